@@ -0,0 +1,64 @@
+"""
+A temporary tournament state directory for unit tests of the daemon's queue.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from tournament.daemon import fs_queue
+from tournament.flags import set_flag, SubmissionFlag
+from tournament.util import paths
+
+# The paths a test case points into its temporary state directory
+STATE_PATHS = ["PROCESSING_CONFIG", "STAGING_DIR", "TOURNEY_DIR", "COST_MODEL_FILE", "ADMISSIONS_FILE",
+               "ADMISSIONS_LOCK_FILE", "HEAD_TO_HEAD_DIR", "METRICS_FILE", "RESULTS_FILE", "LEADERBOARD_HTML_FILE",
+               "LEADERBOARD_JSON_FILE", "LEADERBOARD_LOCK_FILE", "RESULTS_SERVER_TRACE_FILE", "RESULTS_DB_FILE"]
+
+
+class TempStateTestCase(unittest.TestCase):
+    """ A test case with an empty queue and tournament, in a temporary state directory """
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.paths = {name: getattr(paths, name) for name in STATE_PATHS}
+        for name in STATE_PATHS:
+            setattr(paths, name, os.path.join(self.state_dir, os.path.basename(self.paths[name])))
+        os.mkdir(paths.STAGING_DIR)
+        os.mkdir(paths.TOURNEY_DIR)
+
+    def tearDown(self):
+        for (name, path) in self.paths.items():
+            setattr(paths, name, path)
+        shutil.rmtree(self.state_dir)
+
+    @staticmethod
+    def write_processing_config(config: dict):
+        """ Write the fields of the processing config that differ from the defaults """
+        with open(paths.PROCESSING_CONFIG, 'w') as config_file:
+            json.dump(config, config_file)
+
+    @staticmethod
+    def add_to_tourney(submitter: str):
+        """ Give a submitter an entry in the tournament """
+        os.mkdir(paths.get_tourney_dir(submitter))
+
+    @staticmethod
+    def queue(submitter: str, submission_time: datetime, awaiting_generation: bool = False,
+              low_priority: bool = False) -> str:
+        """
+        Queue a submission, as fs_queue.queue_submission does but without a submission to move into the queue
+        :return: the path of the queued submission
+        """
+        # pylint: disable=protected-access
+        staged_dir = os.path.join(paths.STAGING_DIR,
+                                  fs_queue._create_submission_request_name(submitter, submission_time))
+        os.mkdir(staged_dir)
+        if awaiting_generation:
+            set_flag(SubmissionFlag.AWAITING_GENERATION, True, staged_dir)
+        if low_priority:
+            set_flag(SubmissionFlag.LOW_PRIORITY, True, staged_dir)
+        set_flag(SubmissionFlag.SUBMISSION_READY, True, staged_dir)
+        return staged_dir
@@ -0,0 +1,77 @@
+"""
+Unit tests of the admission control of submissions to the queue.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import unittest
+from datetime import datetime, timedelta
+
+from test.temp_state import TempStateTestCase
+from tournament.daemon import admission, eta
+from tournament.daemon.admission import Admission
+
+
+class TestAdmission(TempStateTestCase):
+    """ admission.admit """
+
+    def setUp(self):
+        super().setUp()
+        self.now = datetime.now().replace(microsecond=0)
+        for submitter in ["alice", "bob", "carol"]:
+            self.add_to_tourney(submitter)
+
+    def test_off(self):
+        """ Every submission is accepted when admission control is off """
+        self.write_processing_config({'admission_control': "off", 'admission_max_queued': 1})
+        self.queue("bob", self.now)
+        self.assertEqual(admission.admit("alice", self.now), (Admission.ACCEPTED, ""))
+
+    def test_min_interval(self):
+        """ A submitter can't submit again until the minimum interval has passed since their last accepted one """
+        self.write_processing_config({'admission_control': "reject", 'admission_min_interval_minutes': 10})
+        self.assertEqual(admission.admit("alice", self.now)[0], Admission.ACCEPTED)
+
+        (decision, reason) = admission.admit("alice", self.now + timedelta(minutes=5))
+        self.assertEqual(decision, Admission.REJECTED)
+        self.assertIn("at most once every 10 minutes", reason)
+
+        # rejected submissions don't restart the interval
+        self.assertEqual(admission.admit("alice", self.now + timedelta(minutes=10))[0], Admission.ACCEPTED)
+
+    def test_max_queued(self):
+        """ A submission is deferred when too many other submissions are queued """
+        self.write_processing_config({'admission_control': "defer", 'admission_max_queued': 2})
+        self.queue("bob", self.now)
+        self.queue("carol", self.now)
+
+        (decision, reason) = admission.admit("alice", self.now)
+        self.assertEqual(decision, Admission.DEFERRED)
+        self.assertIn("2 submissions queued", reason)
+
+    def test_own_queued_submission_is_not_counted(self):
+        """ A submission replacing the submitters own queued submission doesn't add to the queue """
+        self.write_processing_config({'admission_control': "defer", 'admission_max_queued': 2})
+        self.queue("alice", self.now)
+        self.queue("bob", self.now)
+        self.assertEqual(admission.admit("alice", self.now)[0], Admission.ACCEPTED)
+
+    def test_max_wait(self):
+        """ A submission is rejected when the queue ahead of it is estimated to take too long """
+        self.write_processing_config({'admission_control': "reject", 'admission_max_wait_minutes': 5})
+        # carol's submission and then bob's take 410 and 18 seconds
+        eta.record_start("carol", 200)
+        self.queue("bob", self.now)
+
+        (decision, reason) = admission.admit("alice", self.now)
+        self.assertEqual(decision, Admission.REJECTED)
+        self.assertIn("estimated to take 7 minutes", reason)
+
+    def test_first_submission_is_never_limited(self):
+        """ A submitter without an entry in the tournament is always accepted """
+        self.write_processing_config({'admission_control': "reject", 'admission_max_queued': 1})
+        self.queue("bob", self.now)
+        self.assertEqual(admission.admit("dave", self.now), (Admission.ACCEPTED, ""))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Unit tests of running ant assignment test suites directly with JUnit, stopping at the first failure where only the
+result is needed. The JDK is stood in for by scripts that report how they were run.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import stat
+import unittest
+from unittest import mock
+
+from test.temp_state import TempStateTestCase
+from tournament.config.assignments import ant_assignment
+from tournament.config.assignments.ant_assignment import AntAssignment
+from tournament.util import paths, types
+
+# Prints how it was run. FailFastRunner stops at a failure, and any other runner runs every test
+JAVA = """#!/bin/sh
+echo "$@"
+case "$*" in
+    *FailFastRunner*) echo "Failure: test1"; echo "{marker}"; echo "Tests run: 1,  Failures: 1"; exit 1;;
+    *) echo "OK (3 tests)";;
+esac
+"""
+
+# Counts the times it is run, and compiles FailFastRunner into the directory given by -d unless JAVAC_FAILS is set
+JAVAC = """#!/bin/sh
+echo run >> "$JAVAC_LOG"
+[ -n "$JAVAC_FAILS" ] && { echo "javac: cannot find symbol"; exit 1; }
+while [ "$1" != "-d" ]; do shift; done
+touch "$2/FailFastRunner.class"
+"""
+
+
+class TestFailFast(TempStateTestCase):
+    """ AntAssignment.run_test with and without fail_fast """
+
+    def setUp(self):
+        super().setUp()
+        self.saved_paths = (paths.JAVA_CLASSES_DIR, paths.TRACE_FILE)
+        paths.JAVA_CLASSES_DIR = os.path.join(self.state_dir, "java_classes")
+        paths.TRACE_FILE = os.path.join(self.state_dir, "tournament_traces.log")
+
+        source_dir = os.path.join(self.state_dir, "source_assg")
+        self.submission_dir = os.path.join(self.state_dir, "submission")
+        for root in [source_dir, self.submission_dir]:
+            for directory in ["tests/Boundary", "programs/original", "programs/mutant-1", "lib"]:
+                os.makedirs(os.path.join(root, directory))
+            self.write(os.path.join(root, "lib", "junit.jar"), "")
+        self.write(os.path.join(self.submission_dir, "classes/tests/Boundary/swen/BoundaryTests.class"), "")
+        os.makedirs(os.path.join(self.submission_dir, "classes/programs/mutant-1"))
+
+        bin_dir = os.path.join(self.state_dir, "bin")
+        os.makedirs(bin_dir)
+        for (name, script) in [("java", JAVA.format(marker=ant_assignment.FAIL_FAST_MARKER)), ("javac", JAVAC)]:
+            self.write(os.path.join(bin_dir, name), script)
+            os.chmod(os.path.join(bin_dir, name), stat.S_IRWXU)
+        self.javac_log = os.path.join(self.state_dir, "javac.log")
+        self.environ = mock.patch.dict(os.environ, {'PATH': f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+                                                    'JAVAC_LOG': self.javac_log})
+        self.environ.start()
+
+        self.assg = AntAssignment(source_dir)
+
+    def tearDown(self):
+        self.environ.stop()
+        (paths.JAVA_CLASSES_DIR, paths.TRACE_FILE) = self.saved_paths
+        super().tearDown()
+
+    @staticmethod
+    def write(path: str, contents: str):
+        """ Write a file, creating the directories it is in """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(contents)
+
+    def _javac_runs(self) -> int:
+        """ How many times javac has been run """
+        if not os.path.isfile(self.javac_log):
+            return 0
+        with open(self.javac_log, 'r') as file:
+            return len(file.readlines())
+
+    def test_full_run(self):
+        """ Without fail_fast the whole test suite is run by JUnitCore, and its tests can be counted """
+        (result, traces) = self.assg.run_test("Boundary", "mutant-1", self.submission_dir)
+        self.assertEqual(result, types.TestResult.NO_BUGS_DETECTED)
+        self.assertIn("org.junit.runner.JUnitCore swen.BoundaryTests", traces)
+        self.assertFalse(self.assg.exited_early(traces))
+        self.assertEqual(self.assg.get_num_tests(traces), 3)
+        self.assertEqual(self._javac_runs(), 0)
+
+    def test_fail_fast_run(self):
+        """ With fail_fast the test suite is run by FailFastRunner, which stops at the first failure """
+        (result, traces) = self.assg.run_test("Boundary", "mutant-1", self.submission_dir, fail_fast=True)
+        self.assertEqual(result, types.TestResult.BUG_FOUND)
+        self.assertIn(f"{paths.JAVA_CLASSES_DIR} FailFastRunner swen.BoundaryTests", traces)
+        self.assertTrue(self.assg.exited_early(traces))
+
+    def test_runner_is_compiled_once(self):
+        """ FailFastRunner is compiled by the first run that needs it, and shared by later runs """
+        for _ in range(2):
+            self.assg.run_test("Boundary", "mutant-1", self.submission_dir, fail_fast=True)
+        self.assertEqual(self._javac_runs(), 1)
+        self.assertTrue(os.path.isfile(os.path.join(paths.JAVA_CLASSES_DIR, "FailFastRunner.class")))
+
+    def test_runner_unavailable(self):
+        """ If FailFastRunner can't be compiled whole test suites are run, without trying to compile it again """
+        with mock.patch.dict(os.environ, {'JAVAC_FAILS': "1"}):
+            for _ in range(2):
+                (result, traces) = self.assg.run_test("Boundary", "mutant-1", self.submission_dir, fail_fast=True)
+                self.assertEqual(result, types.TestResult.NO_BUGS_DETECTED)
+                self.assertIn("org.junit.runner.JUnitCore", traces)
+        self.assertEqual(self._javac_runs(), 1)
+        with open(paths.TRACE_FILE, 'r') as file:
+            self.assertIn("Unable to compile", file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+"""
+Unit tests of the asyncio HTTP server of the results server.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from http import HTTPStatus, client
+from unittest import mock
+
+from tournament.reporting import async_server
+from tournament.reporting.async_server import AsyncHTTPServer, EventBroadcaster, RateLimiter
+from tournament.reporting.response import Response
+
+
+class TestRateLimiter(unittest.TestCase):
+    """ async_server.RateLimiter """
+
+    def setUp(self):
+        self.now = 100.0
+        monotonic = mock.patch.object(async_server, "monotonic", lambda: self.now)
+        monotonic.start()
+        self.addCleanup(monotonic.stop)
+
+    def test_burst(self):
+        """ A client can make a burst of requests at once, and is then refused until its bucket refills """
+        limiter = RateLimiter(1, 3)
+        self.assertEqual([limiter.allow("alice") for _ in range(4)], [True, True, True, False])
+        self.now += 1
+        self.assertEqual([limiter.allow("alice") for _ in range(2)], [True, False])
+
+    def test_bucket_per_client(self):
+        """ Each client has its own bucket """
+        limiter = RateLimiter(1, 1)
+        self.assertTrue(limiter.allow("alice"))
+        self.assertFalse(limiter.allow("alice"))
+        self.assertTrue(limiter.allow("bob"))
+
+    def test_bucket_holds_burst(self):
+        """ A bucket holds no more than a burst of tokens, however long the client has been idle """
+        limiter = RateLimiter(1, 2)
+        limiter.allow("alice")
+        self.now += 60
+        self.assertEqual([limiter.allow("alice") for _ in range(3)], [True, True, False])
+
+    def test_refilled_buckets_are_forgotten(self):
+        """ Once too many clients are tracked, those whose buckets have refilled are forgotten """
+        limiter = RateLimiter(1, 2)
+        with mock.patch.object(async_server, "MAX_TRACKED_CLIENTS", 2):
+            limiter.allow("alice")
+            self.now += 5
+            limiter.allow("bob")
+            limiter.allow("carol")
+        self.assertEqual(set(limiter.buckets), {"bob", "carol"})
+
+
+class AsyncServerTestCase(unittest.TestCase):
+    """ A test case with an asyncio server on a port chosen by the system, whose requests are answered by route """
+
+    def setUp(self):
+        self.requests = []
+        self.log = []
+        self.file_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.file_dir)
+        self.file_path = os.path.join(self.file_dir, "file")
+        with open(self.file_path, 'wb') as file:
+            file.write(b"from a file" * 1000)
+
+    def start(self, rate_limiter: RateLimiter = None, max_connections: int = 10, client_timeout: float = 5,
+              events: EventBroadcaster = None) -> AsyncHTTPServer:
+        """ Start a server in its own thread, which is shut down when the test finishes """
+        httpd = AsyncHTTPServer(('127.0.0.1', 0), self.route, lambda client_address, line: self.log.append(line),
+                                max_connections, rate_limiter or RateLimiter(1000, 1000), client_timeout, 5, events)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(httpd.shutdown)
+        httpd.started.wait(5)
+        return httpd
+
+    def route(self, method: str, path: str, headers) -> Response:
+        """ Answer with the request, with a file sent by sendfile, or fail """
+        self.requests.append((method, path, headers.get('X-Test')))
+        if path == "/fail":
+            raise ValueError("route failed")
+        if path == "/file":
+            return Response(HTTPStatus.OK, [('Content-Length', str(os.path.getsize(self.file_path)))],
+                            file=open(self.file_path, 'rb'))
+        return Response(HTTPStatus.OK, [('Content-Type', 'text/plain')], f"{method} {path}".encode())
+
+    @staticmethod
+    def connect(httpd: AsyncHTTPServer) -> client.HTTPConnection:
+        """ Open a connection to a server """
+        connection = client.HTTPConnection(*httpd.server_address, timeout=5)
+        connection.connect()
+        return connection
+
+    @staticmethod
+    def send_raw(httpd: AsyncHTTPServer, request: bytes) -> bytes:
+        """ Send bytes to a server, and return everything it sends back before closing the connection """
+        with socket.create_connection(httpd.server_address, timeout=5) as sock:
+            sock.sendall(request)
+            received = b""
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return received
+                received += data
+
+
+class TestAsyncHTTPServer(AsyncServerTestCase):
+    """ async_server.AsyncHTTPServer """
+
+    def test_keep_alive(self):
+        """ Requests made one after another on a connection are answered over that same connection """
+        connection = self.connect(self.start())
+        self.addCleanup(connection.close)
+        sock = connection.sock
+        for path in ["/first", "/second"]:
+            connection.request('GET', path, headers={'X-Test': path})
+            sent = connection.getresponse()
+            self.assertEqual((sent.status, sent.read()), (HTTPStatus.OK, f"GET {path}".encode()))
+            self.assertEqual(sent.getheader('Connection'), 'keep-alive')
+        self.assertIs(connection.sock, sock)
+        self.assertEqual(self.requests, [('GET', "/first", "/first"), ('GET', "/second", "/second")])
+        self.assertEqual(self.log, ["GET /first HTTP/1.1", "GET /second HTTP/1.1"])
+
+    def test_connection_close(self):
+        """ The connection is closed after answering a client that doesn't want it kept open """
+        httpd = self.start()
+        for request in [b"GET /a HTTP/1.1\r\nConnection: close\r\n\r\n", b"GET /a HTTP/1.0\r\n\r\n"]:
+            with self.subTest(request=request):
+                received = self.send_raw(httpd, request)
+                self.assertTrue(received.startswith(b"HTTP/1.1 200 OK\r\n"))
+                self.assertIn(b"\r\nConnection: close\r\n", received)
+                self.assertTrue(received.endswith(b"\r\n\r\nGET /a"))
+
+    def test_head(self):
+        """ HEAD requests are answered without a body, but with the body's length """
+        received = self.send_raw(self.start(), b"HEAD /a HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertIn(b"\r\nContent-Length: 7\r\n", received)
+        self.assertTrue(received.endswith(b"\r\n\r\n"))
+
+    def test_file_is_sent(self):
+        """ Files are sent by sendfile, and the connection kept open after them """
+        connection = self.connect(self.start())
+        self.addCleanup(connection.close)
+        for path in ["/file", "/after"]:
+            connection.request('GET', path)
+            sent = connection.getresponse()
+            self.assertEqual(sent.read(), b"from a file" * 1000 if path == "/file" else b"GET /after")
+
+    def test_malformed_request(self):
+        """ The connection is closed without an answer if the request can't be read """
+        self.assertEqual(self.send_raw(self.start(), b"not a request\r\n\r\n"), b"")
+        self.assertEqual(self.requests, [])
+
+    def test_route_fails(self):
+        """ A request whose route fails is answered with an error, and the connection closed """
+        with mock.patch.object(async_server, "print_tourney_error") as print_error:
+            received = self.send_raw(self.start(), b"GET /fail HTTP/1.1\r\n\r\n")
+        self.assertTrue(received.startswith(b"HTTP/1.1 500 "))
+        self.assertIn(b"\r\nConnection: close\r\n", received)
+        self.assertTrue(print_error.called)
+
+    def test_rate_limit(self):
+        """ A client that has run out of tokens is refused, and its connection closed """
+        connection = self.connect(self.start(rate_limiter=RateLimiter(0.001, 1)))
+        self.addCleanup(connection.close)
+        connection.request('GET', "/a")
+        self.assertEqual(connection.getresponse().read(), b"GET /a")
+
+        connection.request('GET', "/b")
+        refused = connection.getresponse()
+        refused.read()
+        self.assertEqual(refused.status, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(refused.getheader('Retry-After'), '1')
+        self.assertEqual([path for (_, path, _) in self.requests], ["/a"])
+
+    def test_max_connections(self):
+        """ A connection that can't get a free slot in time is refused, until a slot is freed """
+        httpd = self.start(max_connections=1, client_timeout=0.5)
+        connection = self.connect(httpd)
+        connection.request('GET', "/a")
+        connection.getresponse().read()
+
+        received = self.send_raw(httpd, b"GET /b HTTP/1.1\r\n\r\n")
+        self.assertTrue(received.startswith(b"HTTP/1.1 503 "))
+        connection.close()
+        self.assertTrue(self.send_raw(httpd, b"GET /c HTTP/1.1\r\nConnection: close\r\n\r\n").endswith(b"GET /c"))
+
+    def test_shutdown(self):
+        """ Open connections are closed when the server is shut down """
+        httpd = self.start()
+        connection = self.connect(httpd)
+        self.addCleanup(connection.close)
+        connection.request('GET', "/a")
+        connection.getresponse().read()
+        httpd.shutdown()
+        self.assertEqual(connection.sock.recv(1), b"")
+
+
+class TestEventBroadcaster(unittest.TestCase):
+    """ async_server.EventBroadcaster """
+
+    def test_latest_event(self):
+        """ Subscribers are pushed each new event, and only the latest if they haven't received the one before """
+        polled = iter(["v1", "v1", None, "v2", "v3"])
+
+        def poll():
+            event = next(polled, "v3")
+            if event is None:
+                raise ValueError("poll failed")
+            return event
+
+        async def broadcast():
+            broadcaster = EventBroadcaster("/events", poll, 0, 2)
+            early = broadcaster.subscribe()
+            self.assertTrue(early.empty())
+            runner = asyncio.ensure_future(broadcaster.run())
+            await asyncio.sleep(0.2)
+            runner.cancel()
+
+            late = broadcaster.subscribe()
+            self.assertEqual((early.get_nowait(), late.get_nowait()), ("v3", "v3"))
+            self.assertIsNone(broadcaster.subscribe())
+            broadcaster.unsubscribe(early)
+            self.assertIsNotNone(broadcaster.subscribe())
+
+        with mock.patch.object(async_server, "print_tourney_error") as print_error:
+            asyncio.run(broadcast())
+        self.assertTrue(print_error.called)
+
+
+class TestEventStream(AsyncServerTestCase):
+    """ async_server.AsyncHTTPServer pushing server-sent events """
+
+    def setUp(self):
+        super().setUp()
+        self.event = "v1"
+        self.events = EventBroadcaster("/events", lambda: self.event, 0.05, 1)
+        self.httpd = self.start(events=self.events)
+
+    def subscribe(self) -> socket.socket:
+        """ Subscribe to events """
+        sock = socket.create_connection(self.httpd.server_address, timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(b"GET /events HTTP/1.1\r\n\r\n")
+        return sock
+
+    @staticmethod
+    def receive_until(sock: socket.socket, expected: bytes) -> bytes:
+        """ Receive from a connection until the expected bytes have been received """
+        received = b""
+        while expected not in received:
+            data = sock.recv(65536)
+            if not data:
+                break
+            received += data
+        return received
+
+    def test_events_are_pushed(self):
+        """ A subscriber is sent the current event, then each new event """
+        sock = self.subscribe()
+        received = self.receive_until(sock, b"data: v1\n\n")
+        self.assertTrue(received.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b"\r\nContent-Type: text/event-stream\r\n", received)
+        self.assertIn(f"retry: {async_server.EVENT_RETRY_SECONDS * 1000}\n\n".encode(), received)
+        self.assertIn(b"event: update\ndata: v1\n\n", received)
+
+        self.event = "v2"
+        self.assertIn(b"event: update\ndata: v2\n\n", self.receive_until(sock, b"data: v2\n\n"))
+        self.assertEqual(self.requests, [])
+
+    def test_max_subscribers(self):
+        """ Clients are refused once there are too many subscribers, until a subscriber disconnects """
+        sock = self.subscribe()
+        self.receive_until(sock, b"data: v1\n\n")
+        self.assertTrue(self.receive_until(self.subscribe(), b"\r\n\r\n").startswith(b"HTTP/1.1 503 "))
+
+        sock.close()
+        deadline = time.monotonic() + 5
+        while self.events.subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIn(b"data: v1\n\n", self.receive_until(self.subscribe(), b"data: v1\n\n"))
+
+    def test_subscribers_hold_no_connection_slot(self):
+        """ Subscribers don't count towards the maximum number of connections """
+        httpd = self.start(max_connections=1, client_timeout=0.5,
+                           events=EventBroadcaster("/events", lambda: self.event, 0.05, 10))
+        sock = socket.create_connection(httpd.server_address, timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(b"GET /events HTTP/1.1\r\n\r\n")
+        self.receive_until(sock, b"data: v1\n\n")
+        self.assertTrue(self.send_raw(httpd, b"GET /a HTTP/1.1\r\nConnection: close\r\n\r\n").endswith(b"GET /a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
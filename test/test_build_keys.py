@@ -0,0 +1,124 @@
+"""
+Unit tests of reusing the binaries of fuzz assignment programs that are unchanged since the previous submission.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import json
+import os
+import shutil
+import unittest
+
+from test.temp_state import TempStateTestCase
+from tournament.config.assignments.fuzz_assignment import FuzzAssignment
+from tournament.util import paths
+
+# Builds each program in VERSIONS by copying its source, logging which programs were built. Sources containing
+# 'broken' fail to build
+MAKEFILE = ("VERSIONS ?= prog1 prog2\n"
+            "all: $(addprefix bin/,$(VERSIONS))\n"
+            "bin/%: src/%/main.c\n"
+            "\t! grep -q broken $<\n"
+            "\tmkdir -p bin && cp $< $@ && echo $* >> build.log\n")
+
+
+class BuildTestCase(TempStateTestCase):
+    """ A test case with a fuzz assignment of two programs, and submissions of it """
+
+    def setUp(self):
+        super().setUp()
+        for prog in ["original", "include", "prog1", "prog2"]:
+            os.makedirs(os.path.join(self.state_dir, "source_assg", "src", prog))
+        self.assg = FuzzAssignment(os.path.join(self.state_dir, "source_assg"))
+
+    def submission(self, submitter: str, progs: dict, header: str = "", makefile: str = MAKEFILE) -> str:
+        """
+        Write a submission with the given source code for each program
+        :return: the directory of the submission
+        """
+        submission_dir = os.path.join(self.state_dir, submitter)
+        files = {"Makefile": makefile, "src/include/common.h": header,
+                 **{f"src/{prog}/main.c": code for (prog, code) in progs.items()}}
+        for (file_name, contents) in files.items():
+            os.makedirs(os.path.dirname(f"{submission_dir}/{file_name}"), exist_ok=True)
+            with open(f"{submission_dir}/{file_name}", 'w') as file:
+                file.write(contents)
+        return submission_dir
+
+    @staticmethod
+    def built(submission_dir: str) -> [str]:
+        """ The programs built by make in a submission """
+        if not os.path.isfile(f"{submission_dir}/build.log"):
+            return []
+        with open(f"{submission_dir}/build.log", 'r') as file:
+            return sorted(file.read().split())
+
+
+class TestBuildKey(BuildTestCase):
+    """ FuzzAssignment.get_build_key """
+
+    def setUp(self):
+        super().setUp()
+        self.key = self.assg.get_build_key(self.submission("alice", {"prog1": "1", "prog2": "2"}), "prog1")
+
+    def test_same_inputs(self):
+        """ Another submission with the same program, headers and Makefile has the same key """
+        bob_dir = self.submission("bob", {"prog1": "1", "prog2": "changed"})
+        self.assertEqual(self.assg.get_build_key(bob_dir, "prog1"), self.key)
+
+    def test_changed_inputs(self):
+        """ Changing the program, the shared headers or the Makefile changes the key """
+        for (submitter, submission) in [("source", ({"prog1": "changed"},)),
+                                        ("header", ({"prog1": "1"}, "#define CHANGED")),
+                                        ("makefile", ({"prog1": "1"}, "", MAKEFILE + "# changed\n"))]:
+            with self.subTest(changed=submitter):
+                submission_dir = self.submission(submitter, *submission)
+                self.assertNotEqual(self.assg.get_build_key(submission_dir, "prog1"), self.key)
+
+
+class TestCompileProgs(BuildTestCase):
+    """ FuzzAssignment.compile_progs """
+
+    def setUp(self):
+        super().setUp()
+        if shutil.which("make") is None:
+            self.skipTest("programs can't be built without make")
+        self.old_dir = self.submission("old", {"prog1": "1", "prog2": "2"})
+        no_submission = os.path.join(self.state_dir, "none")
+        self.old_results = self.assg.compile_progs(self.old_dir, ["prog1", "prog2"], no_submission)
+
+    def test_first_submission_is_built(self):
+        """ Without a previous submission every program is built, and its build key recorded """
+        self.assertTrue(all(self.old_results.values()))
+        self.assertEqual(self.built(self.old_dir), ["prog1", "prog2"])
+        with open(f"{self.old_dir}/{paths.BUILD_KEYS_FILE}", 'r') as file:
+            self.assertEqual(json.load(file), {prog: self.assg.get_build_key(self.old_dir, prog)
+                                               for prog in ["prog1", "prog2"]})
+
+    def test_unchanged_program_is_reused(self):
+        """ Only changed programs are built, and the binaries of the rest are copied from the previous submission """
+        new_dir = self.submission("new", {"prog1": "1", "prog2": "changed"})
+        results = self.assg.compile_progs(new_dir, ["prog1", "prog2"], self.old_dir)
+        self.assertTrue(all(results.values()))
+        self.assertIn("Reused", results["prog1"].traces)
+        self.assertEqual(self.built(new_dir), ["prog2"])
+        with open(f"{new_dir}/bin/prog1", 'r') as file:
+            self.assertEqual(file.read(), "1")
+
+    def test_changed_makefile_rebuilds_everything(self):
+        """ Programs are rebuilt if the Makefile has changed, even if their source hasn't """
+        new_dir = self.submission("new", {"prog1": "1", "prog2": "2"}, makefile=MAKEFILE + "# changed\n")
+        self.assg.compile_progs(new_dir, ["prog1", "prog2"], self.old_dir)
+        self.assertEqual(self.built(new_dir), ["prog1", "prog2"])
+
+    def test_failed_build(self):
+        """ A program that fails to build is reported, and its build key is not recorded for reuse """
+        new_dir = self.submission("new", {"prog1": "1", "prog2": "broken"})
+        results = self.assg.compile_progs(new_dir, ["prog1", "prog2"], self.old_dir)
+        self.assertTrue(results["prog1"])
+        self.assertFalse(results["prog2"])
+        with open(f"{new_dir}/{paths.BUILD_KEYS_FILE}", 'r') as file:
+            self.assertEqual(list(json.load(file)), ["prog1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Unit tests of the bounded capture of the output of test processes.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tournament.util import capture
+from tournament.util.capture import BoundedOutput
+
+
+class TestBoundedOutput(unittest.TestCase):
+    """ BoundedOutput keeping the head and tail of output """
+
+    def test_short_output_is_kept(self):
+        """ Output shorter than the head and tail is kept whole """
+        output = BoundedOutput(head_bytes=4, tail_bytes=4)
+        output.write(b"abc")
+        output.write(b"def")
+        self.assertEqual(output.text(), "abcdef")
+
+    def test_middle_is_omitted(self):
+        """ Only the head and tail of long output are kept, with the size of the middle """
+        output = BoundedOutput(head_bytes=4, tail_bytes=4)
+        for chunk in [b"0123", b"4567", b"89ab", b"cdef"]:
+            output.write(chunk)
+        self.assertEqual(output.text(), "0123\n\n... [8 bytes of output omitted] ...\n\ncdef")
+
+    def test_chunk_spanning_head_and_tail(self):
+        """ A single write can fill the head and the tail """
+        output = BoundedOutput(head_bytes=4, tail_bytes=4)
+        output.write(b"0123456789")
+        self.assertEqual(output.text(), "0123\n\n... [2 bytes of output omitted] ...\n\n6789")
+
+    def test_undecodable_output(self):
+        """ Bytes that aren't UTF-8 are escaped rather than failing """
+        output = BoundedOutput()
+        output.write(b"ok\xff")
+        self.assertEqual(output.text(), "ok\\xff")
+
+    def test_marker_in_omitted_middle(self):
+        """ Markers are found in output that isn't kept """
+        output = BoundedOutput(markers=["timed out"], head_bytes=4, tail_bytes=4)
+        for chunk in [b"0123", b"the test timed out", b"cdef"]:
+            output.write(chunk)
+        self.assertTrue(output.found_marker("timed out"))
+        self.assertNotIn("timed out", output.text())
+
+    def test_marker_split_across_chunks(self):
+        """ Markers are found when split across writes """
+        output = BoundedOutput(markers=["timed out"])
+        for chunk in [b"...timed", b" ", b"out..."]:
+            output.write(chunk)
+        self.assertTrue(output.found_marker("timed out"))
+
+    def test_marker_absent(self):
+        """ Markers aren't found in output that only resembles them """
+        output = BoundedOutput(markers=["timed out"])
+        output.write(b"timed")
+        output.write(b"out")
+        self.assertFalse(output.found_marker("timed out"))
+
+    def test_spill_limit(self):
+        """ At most spill_limit bytes are written to the spill file """
+        spill_dir = tempfile.mkdtemp()
+        try:
+            spill_file = os.path.join(spill_dir, "output")
+            output = BoundedOutput(spill_file=spill_file, spill_limit=6)
+            for chunk in [b"0123", b"4567", b"89ab"]:
+                output.write(chunk)
+            output.close()
+            with open(spill_file, 'rb') as file:
+                self.assertEqual(file.read(), b"012345")
+        finally:
+            shutil.rmtree(spill_dir)
+
+
+class TestReadBounded(unittest.TestCase):
+    """ capture.read_bounded """
+
+    def test_reads_from_current_position(self):
+        """ A file is read from where it has been seeked to """
+        file = io.BytesIO(b"skipped|kept")
+        file.seek(len(b"skipped|"))
+        self.assertEqual(capture.read_bounded(file).text(), "kept")
+
+
+class TestRunCaptured(unittest.TestCase):
+    """ capture.run_captured running real processes """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_output_and_return_code(self):
+        """ Stdout and stderr are both captured, along with the return code """
+        code = "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"
+        run = capture.run_captured([sys.executable, "-c", code], self.work_dir, timeout=30)
+        self.assertEqual(run.return_code, 3)
+        self.assertFalse(run.timed_out)
+        self.assertIn("out", run.stdout)
+        self.assertIn("err", run.stdout)
+
+    def test_output_is_bounded(self):
+        """ The output of a process is kept in the given bounds """
+        output = BoundedOutput(head_bytes=4, tail_bytes=4)
+        code = "import sys; sys.stdout.write('x' * 1000000 + 'end!')"
+        run = capture.run_captured([sys.executable, "-c", code], self.work_dir, timeout=30, output=output)
+        self.assertEqual(run.stdout, "xxxx\n\n... [999996 bytes of output omitted] ...\n\nend!")
+
+    def test_timeout(self):
+        """ A process that runs past its timeout is reported as timed out """
+        run = capture.run_captured([sys.executable, "-c", "import time; time.sleep(30)"], self.work_dir, timeout=1)
+        self.assertTrue(run.timed_out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Unit tests of how a fuzzer generated corpus is reduced, without a coverage build.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from tournament.config.assignments import corpus_minimiser
+
+
+class CorpusTestCase(unittest.TestCase):
+    """ A test case with a temporary corpus directory """
+
+    def setUp(self):
+        self.corpus_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.corpus_dir)
+
+    def _input(self, name: str, contents: str) -> str:
+        path = os.path.join(self.corpus_dir, name)
+        with open(path, 'w') as input_file:
+            input_file.write(contents)
+        return path
+
+
+class TestCap(CorpusTestCase):
+    """ corpus_minimiser._cap """
+    # pylint: disable=protected-access
+
+    def test_max_inputs(self):
+        """ At most max_inputs inputs are kept, in order """
+        inputs = [self._input(name, "x") for name in ["a", "b", "c"]]
+        self.assertEqual(corpus_minimiser._cap(inputs, 2, 100), inputs[:2])
+
+    def test_smaller_inputs_fit_after_a_large_one(self):
+        """ An input too large for the space left is skipped, and later smaller inputs still kept """
+        inputs = [self._input("a", "xxx"), self._input("b", "x" * 10), self._input("c", "xx")]
+        self.assertEqual(corpus_minimiser._cap(inputs, 10, 5), [inputs[0], inputs[2]])
+
+    def test_nothing_fits(self):
+        """ No inputs are kept if none fit """
+        inputs = [self._input("a", "x" * 10)]
+        self.assertEqual(corpus_minimiser._cap(inputs, 10, 5), [])
+
+
+class TestDeduplicate(CorpusTestCase):
+    """ corpus_minimiser._deduplicate """
+    # pylint: disable=protected-access
+
+    def test_identical_inputs_are_removed(self):
+        """ Only the first of identical inputs is kept, and the rest deleted """
+        inputs = [self._input("a", "same"), self._input("b", "other"), self._input("c", "same")]
+        self.assertEqual(corpus_minimiser._deduplicate(inputs), inputs[:2])
+        self.assertFalse(os.path.exists(inputs[2]))
+
+
+class TestSelectByCoverage(CorpusTestCase):
+    """ corpus_minimiser._select_by_coverage """
+    # pylint: disable=protected-access
+
+    def test_smallest_input_kept_for_each_block(self):
+        """ The smallest input reaching each block is kept, ordered by how many blocks each is kept for """
+        (small, large, subsumed) = (self._input("a", "x"), self._input("b", "xxx"), self._input("c", "xx"))
+        coverage = {small: {1, 2}, large: {1, 2, 3, 4, 5}, subsumed: {1}}
+        # large is the only input reaching blocks 3 to 5, so it is kept for more blocks than small
+        self.assertEqual(corpus_minimiser._select_by_coverage([small, large, subsumed], coverage), [large, small])
+
+    def test_unknown_coverage_is_kept_first(self):
+        """ Inputs whose coverage couldn't be measured are kept, ahead of the rest """
+        (known, unknown) = (self._input("a", "x"), self._input("b", "xx"))
+        coverage = {known: {1}, unknown: None}
+        self.assertEqual(corpus_minimiser._select_by_coverage([known, unknown], coverage), [unknown, known])
+
+
+if __name__ == '__main__':
+    unittest.main()
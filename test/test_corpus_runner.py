@@ -0,0 +1,190 @@
+"""
+Unit tests of how the outcomes of fuzzer generated inputs are classified and combined.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import unittest
+
+from tournament.config.assignments import corpus_runner
+from tournament.config.assignments.corpus_runner import ExecExecutor, ForkServerExecutor, InputOutcome
+from tournament.util import paths, types
+
+
+class TestClassify(unittest.TestCase):
+    """ InputOutcome.classify """
+
+    def test_success(self):
+        """ An input that exits cleanly detects no bugs """
+        self.assertEqual(InputOutcome(0, "").classify(), types.TestResult.NO_BUGS_DETECTED)
+
+    def test_timeout(self):
+        """ An input that reaches its CPU limit times out """
+        self.assertEqual(InputOutcome(None, "").classify(), types.TestResult.TIMEOUT)
+
+    def test_stopped(self):
+        """ An input stopped by wall clock time before reaching its CPU limit has an unknown outcome """
+        self.assertEqual(InputOutcome(None, "", stopped=True).classify(), types.TestResult.NOT_TESTED)
+
+    def test_crash_codes(self):
+        """ Sanitizer crashes, as reported by a shell, are bugs """
+        for return_code in [1, 134]:
+            self.assertEqual(InputOutcome(return_code, "").classify(), types.TestResult.BUG_FOUND)
+
+    def test_unexpected_code(self):
+        """ Any other exit, including a signal not reported as a shell would, is unexpected """
+        for return_code in [2, 139, -signal.SIGABRT]:
+            self.assertEqual(InputOutcome(return_code, "").classify(), types.TestResult.UNEXPECTED_RETURN_CODE)
+
+
+class TestShellReturnCode(unittest.TestCase):
+    """ corpus_runner.shell_return_code """
+
+    def test_signalled(self):
+        """ A process killed by a signal returns 128 + the signal number """
+        self.assertEqual(corpus_runner.shell_return_code(-signal.SIGABRT), 134)
+        self.assertEqual(corpus_runner.shell_return_code(-signal.SIGSEGV), 139)
+
+    def test_exited(self):
+        """ Return codes of processes that exited are unchanged """
+        for return_code in [0, 1, 134, None]:
+            self.assertEqual(corpus_runner.shell_return_code(return_code), return_code)
+
+
+class TestExecExecutor(unittest.TestCase):
+    """ ExecExecutor running real processes, without a shell """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _run(self, code: str, cpu_seconds: int = 5) -> InputOutcome:
+        """ Run python code as the program under test """
+        return ExecExecutor([sys.executable, "-c", code], self.work_dir, cpu_seconds).run("input")
+
+    def test_abort_is_a_bug(self):
+        """ A program that aborts, as a sanitizer does, has found a bug """
+        self.assertEqual(self._run("import os; os.abort()").classify(), types.TestResult.BUG_FOUND)
+
+    def test_exit_code_one_is_a_bug(self):
+        """ A program that exits with code 1, as a sanitizer does, has found a bug """
+        self.assertEqual(self._run("import sys; sys.exit(1)").classify(), types.TestResult.BUG_FOUND)
+
+    def test_success(self):
+        """ A program that exits cleanly detects no bugs """
+        self.assertEqual(self._run("pass").classify(), types.TestResult.NO_BUGS_DETECTED)
+
+    def test_cpu_limit(self):
+        """ A program that uses more than its CPU limit times out """
+        self.assertEqual(self._run("while True: pass", cpu_seconds=1).classify(), types.TestResult.TIMEOUT)
+
+    def test_wall_clock_backstop(self):
+        """ A program stopped by wall clock time without using its CPU time isn't timed out """
+        outcome = ExecExecutor([sys.executable, "-c", "import time; time.sleep(30)"], self.work_dir, 5).run("input", 1)
+        self.assertEqual(outcome.classify(), types.TestResult.NOT_TESTED)
+
+
+class TestForkServerExecutor(unittest.TestCase):
+    """ ForkServerExecutor running inputs as ExecExecutor does """
+
+    # python code run as the program under test, which does what its input says
+    PROGRAM = ("import os, sys\n"
+               "action = open(sys.argv[1]).read()\n"
+               "print('running', action)\n"
+               "sys.stdout.flush()\n"
+               "if action == 'abort': os.abort()\n"
+               "if action == 'spin':\n"
+               "    while True: pass\n"
+               "sys.exit(int(action))")
+
+    def setUp(self):
+        if shutil.which("cc") is None:
+            self.skipTest("the fork server can't be built without a C compiler")
+        self.work_dir = tempfile.mkdtemp()
+        self.tools_dir = (paths.TOOLS_DIR, corpus_runner.FORK_SERVER_LIB)
+        paths.TOOLS_DIR = f"{self.work_dir}/tools"
+        corpus_runner.FORK_SERVER_LIB = f"{paths.TOOLS_DIR}/fork_server.so"
+        self.fork_server_lib = corpus_runner.get_fork_server_lib()
+        self.assertTrue(self.fork_server_lib)
+
+        command = [sys.executable, "-c", self.PROGRAM, "{input}"]
+        self.fork_server = ForkServerExecutor(command, self.work_dir, 1, self.fork_server_lib)
+        self.executor = ExecExecutor(command, self.work_dir, 1)
+
+    def tearDown(self):
+        self.fork_server.close()
+        (paths.TOOLS_DIR, corpus_runner.FORK_SERVER_LIB) = self.tools_dir
+        shutil.rmtree(self.work_dir)
+
+    def _run_both(self, action: str) -> (InputOutcome, InputOutcome):
+        """ Run an input through the fork server and directly """
+        input_file = os.path.join(self.work_dir, action)
+        with open(input_file, 'w') as file:
+            file.write(action)
+        return self.fork_server.run(input_file), self.executor.run(input_file)
+
+    def test_server_is_started(self):
+        """ The fork server is used, rather than falling back to executing each input """
+        self.assertIsNotNone(self.fork_server.server)
+
+    def test_same_outcomes(self):
+        """ Exits, aborts and CPU timeouts have the same return code, output and result with or without the server """
+        for action in ["0", "1", "2", "abort", "spin"]:
+            with self.subTest(action=action):
+                (forked, executed) = self._run_both(action)
+                self.assertEqual(forked.return_code, executed.return_code)
+                self.assertEqual(forked.output, executed.output)
+                self.assertEqual(forked.classify(), executed.classify())
+        # every input was run by the server, rather than after it stopped
+        self.assertIsNotNone(self.fork_server.server)
+
+
+class TestRunCorpus(unittest.TestCase):
+    """ corpus_runner.run_corpus combining the outcomes of a corpus """
+
+    def setUp(self):
+        self.corpus_dir = tempfile.mkdtemp()
+        for name in ["a", "b", "c", "d"]:
+            with open(os.path.join(self.corpus_dir, name), 'w') as input_file:
+                input_file.write(name)
+        self.inputs = corpus_runner.get_inputs(self.corpus_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.corpus_dir)
+
+    def _executor(self, code: str, cpu_seconds: int = 5):
+        """ Create executors that run python code as the program under test, with the input as its argument """
+        return lambda: ExecExecutor([sys.executable, "-c", code, "{input}"], self.corpus_dir, cpu_seconds)
+
+    def test_no_inputs(self):
+        """ A corpus with no inputs detects no bugs """
+        (result, _) = corpus_runner.run_corpus([], self._executor("pass"), 2, 60)
+        self.assertEqual(result, types.TestResult.NO_BUGS_DETECTED)
+
+    def test_crash_wins(self):
+        """ A crash decides the result of the corpus over any other outcome """
+        code = "import os, sys; os.abort() if open(sys.argv[1]).read() == 'c' else sys.exit(2)"
+        (result, traces) = corpus_runner.run_corpus(self.inputs, self._executor(code), 2, 60)
+        self.assertEqual(result, types.TestResult.BUG_FOUND)
+        self.assertIn(os.path.join(self.corpus_dir, "c"), traces)
+
+    def test_time_limit(self):
+        """ A corpus that can't all be run within the time limit of the cell isn't scored """
+        (result, traces) = corpus_runner.run_corpus(self.inputs, self._executor("import time; time.sleep(2)"), 1, 1)
+        self.assertEqual(result, types.TestResult.NOT_TESTED)
+        self.assertIn("time limit of the cell", traces)
+
+    def test_timeout_before_time_limit(self):
+        """ An input that reached its CPU limit decides the result, even if other inputs couldn't be run """
+        code = "import sys, time\nif open(sys.argv[1]).read() == 'a':\n    while True: pass\ntime.sleep(30)"
+        (result, _) = corpus_runner.run_corpus(self.inputs, self._executor(code, cpu_seconds=1), 1, 4)
+        self.assertEqual(result, types.TestResult.TIMEOUT)
+
+if __name__ == '__main__':
+    unittest.main()
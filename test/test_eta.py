@@ -0,0 +1,113 @@
+"""
+Unit tests of the queue order and the estimates of when queued submissions will be processed.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from test.temp_state import TempStateTestCase
+from tournament.daemon import eta, fs_queue
+
+
+class TestQueueOrder(TempStateTestCase):
+    """ fs_queue.get_queue """
+
+    def test_ordered_by_submission_time(self):
+        """ Submissions are ordered by when they were submitted, not when their directory changed """
+        now = datetime.now().replace(microsecond=0)
+        later = self.queue("alice", now)
+        earlier = self.queue("bob", now - timedelta(minutes=1))
+        # setting a flag modifies the earlier submission's directory after the later one was queued
+        os.utime(earlier, (time.time() + 60, time.time() + 60))
+        self.assertEqual(fs_queue.get_queue(), [earlier, later])
+
+    def test_low_priority_last(self):
+        """ Deferred submissions are queued after every accepted submission """
+        now = datetime.now().replace(microsecond=0)
+        deferred = self.queue("alice", now - timedelta(minutes=1), low_priority=True)
+        accepted = self.queue("bob", now)
+        self.assertEqual(fs_queue.get_queue(), [accepted, deferred])
+
+    def test_awaiting_generation_is_not_next(self):
+        """ A submission waiting for its tests to be generated is skipped """
+        now = datetime.now().replace(microsecond=0)
+        self.queue("alice", now - timedelta(minutes=1), awaiting_generation=True)
+        ready = self.queue("bob", now)
+        self.assertEqual(fs_queue.get_next_request(), os.path.basename(ready))
+
+
+class TestCostModel(TempStateTestCase):
+    """ Recording how long submissions take """
+
+    def test_default_model(self):
+        """ Before any submission is recorded the default model is used """
+        self.assertEqual(eta.get_cost_model(), eta.DEFAULT_COST_MODEL)
+
+    def test_moving_averages(self):
+        """ Each recorded submission moves the model towards its costs """
+        eta.record_submission(num_pairs=10, test_seconds=100, overhead_seconds=20)
+        model = eta.get_cost_model()
+        self.assertAlmostEqual(model['seconds_per_pair'], 0.3 * 10 + 0.7 * 2)
+        self.assertAlmostEqual(model['overhead_seconds'], 0.3 * 20 + 0.7 * 10)
+        self.assertEqual(model['submissions_recorded'], 1)
+
+    def test_no_pairs_keeps_seconds_per_pair(self):
+        """ A submission with no pairs to test doesn't change the cost of a pair """
+        eta.record_submission(num_pairs=0, test_seconds=0, overhead_seconds=10)
+        self.assertEqual(eta.get_cost_model()['seconds_per_pair'], eta.DEFAULT_COST_MODEL['seconds_per_pair'])
+
+    def test_record_start_and_finish(self):
+        """ The submission being processed is recorded until it finishes """
+        eta.record_start("alice", 4)
+        self.assertEqual(eta.get_cost_model()['processing']['estimated_seconds'], 10 + 2 * 4)
+        eta.record_submission(4, 8, 10)
+        self.assertIsNone(eta.get_cost_model()['processing'])
+
+
+class TestEstimates(TempStateTestCase):
+    """ Estimating when queued submissions will be processed """
+
+    def setUp(self):
+        super().setUp()
+        for submitter in ["alice", "bob", "carol"]:
+            self.add_to_tourney(submitter)
+
+    def test_count_pairs(self):
+        """ A submitter is tested against every other submitter, in both directions """
+        self.assertEqual(eta.count_pairs("alice"), 4)
+        self.assertEqual(eta.count_pairs("dave"), 6)
+
+    def test_empty_queue(self):
+        """ Nothing is waited for when the queue is empty """
+        self.assertEqual(eta.estimate_wait_seconds(), 0.0)
+        self.assertIsNone(eta.estimate_submission("alice"))
+
+    def test_queue_is_estimated_in_order(self):
+        """ Each queued submission waits for those ahead of it """
+        now = datetime.now().replace(microsecond=0)
+        self.queue("alice", now - timedelta(minutes=2))
+        self.queue("dave", now - timedelta(minutes=1))
+
+        # alice has 4 pairs to test and dave 6, each taking 10 seconds plus 2 seconds per pair
+        self.assertAlmostEqual(eta.estimate_wait_seconds(), (10 + 2 * 4) + (10 + 2 * 6), delta=1)
+        self.assertEqual([estimate['submitter'] for estimate in eta.estimate_queue()], ["alice", "dave"])
+        self.assertEqual(eta.estimate_submission("dave")['position'], 2)
+
+    def test_queue_starts_after_current_submission(self):
+        """ The queue waits for the submission being processed """
+        eta.record_start("carol", 45)
+        self.queue("alice", datetime.now().replace(microsecond=0))
+        self.assertAlmostEqual(eta.estimate_wait_seconds(), (10 + 2 * 45) + (10 + 2 * 4), delta=1)
+
+    def test_waits_for_generation(self):
+        """ A submission waiting for its tests to be generated also waits for the generation """
+        eta.record_generation(1000)
+        self.queue("alice", datetime.now().replace(microsecond=0), awaiting_generation=True)
+        self.assertAlmostEqual(eta.estimate_wait_seconds(), 0.3 * 1000 + (10 + 2 * 4), delta=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
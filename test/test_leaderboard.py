@@ -0,0 +1,189 @@
+"""
+Unit tests of publishing the leaderboard, and of the results server sending the published files.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import gzip
+import json
+import os
+import re
+import threading
+import unittest
+from datetime import datetime
+from email.message import Message
+from http import HTTPStatus, client
+from types import SimpleNamespace
+from unittest import mock
+
+from test.temp_state import TempStateTestCase
+from tournament.reporting import leaderboard, results_server
+from tournament.util import format as fmt, paths
+
+
+def snapshot_entry(test_score: float, prog_score: float, submitted: bool = True) -> dict:
+    """ The results of a submitter in a snapshot of an assignment with one test and one program """
+    return {'normalised_test_score': test_score, 'normalised_prog_score': prog_score,
+            'latest_submission_date': datetime(2020, 1, 1).strftime(fmt.DATETIME_TRACE_STRING) if submitted else None,
+            'tests': {"test1": 1}, 'progs': {"prog1": 0},
+            'average_bugs_detected': 1, 'average_tests_evaded': 0, 'average_tests_per_suite': 1}
+
+
+def snapshot(results: dict) -> dict:
+    """ A snapshot of the tournament with the given results of each submitter """
+    return {'snapshot_date': datetime(2020, 1, 2).strftime(fmt.DATETIME_TRACE_STRING),
+            'time_to_process_last_submission': 10, 'num_submitters': len(results),
+            'best_average_bugs_detected': 1, 'best_average_tests_evaded': 0, 'results': results}
+
+
+class LeaderboardTestCase(TempStateTestCase):
+    """ A test case with a snapshot of a tournament of an assignment with one test and one program """
+
+    def setUp(self):
+        super().setUp()
+        self.assg = SimpleNamespace(get_test_list=lambda: ["test1"], get_programs_list=lambda: ["prog1"])
+        assignment_config = mock.patch.object(leaderboard, "AssignmentConfig")
+        assignment_config.start().return_value.get_assignment.return_value = self.assg
+        self.addCleanup(assignment_config.stop)
+        self.write_snapshot(snapshot({"alice": snapshot_entry(1.0, 0.5), "bob": snapshot_entry(0.5, 0.5)}))
+
+    @staticmethod
+    def write_snapshot(contents: dict):
+        """ Write the snapshot file """
+        with open(paths.RESULTS_FILE, 'w') as file:
+            json.dump(contents, file)
+
+    @staticmethod
+    def read(file_path: str) -> bytes:
+        """ The contents of a published file """
+        with open(file_path, 'rb') as file:
+            return file.read()
+
+
+class TestRankedLeaderboard(unittest.TestCase):
+    """ leaderboard.ranked_leaderboard """
+
+    def test_ranks(self):
+        """ Submitters are ranked by score, with equal scores sharing a rank """
+        ranked = leaderboard.ranked_leaderboard(snapshot({"alice": snapshot_entry(0.5, 0.5),
+                                                          "bob": snapshot_entry(1.0, 1.0),
+                                                          "carol": snapshot_entry(1.0, 0.0)}))
+        self.assertEqual([(entry['name'], entry['rank'], entry['score']) for entry in ranked],
+                         [("bob", 1, 2.0), ("alice", 2, 1.0), ("carol", 2, 1.0)])
+
+    def test_no_submission(self):
+        """ Submitters without a processed submission are unranked """
+        ranked = leaderboard.ranked_leaderboard(snapshot({"alice": snapshot_entry(0.0, 0.0, submitted=False),
+                                                          "bob": snapshot_entry(0.0, 0.0)}))
+        self.assertEqual({entry['name']: entry['rank'] for entry in ranked}, {"alice": None, "bob": 1})
+
+
+class TestPublish(LeaderboardTestCase):
+    """ leaderboard.publish """
+
+    def test_published_files(self):
+        """ The page and the JSON version of the leaderboard are published with gzip compressed copies """
+        leaderboard.publish()
+        for file_path in [paths.LEADERBOARD_HTML_FILE, paths.LEADERBOARD_JSON_FILE]:
+            with self.subTest(file_path=file_path):
+                self.assertEqual(gzip.decompress(self.read(f"{file_path}.gz")), self.read(file_path))
+
+        published = json.loads(self.read(paths.LEADERBOARD_JSON_FILE))
+        self.assertEqual([entry['name'] for entry in published['leaderboard']], ["alice", "bob"])
+        self.assertEqual((published['tests'], published['progs']), (["test1"], ["prog1"]))
+        self.assertIn(f'data-version="{published["version"]}"', self.read(paths.LEADERBOARD_HTML_FILE).decode())
+
+    def test_version(self):
+        """ The version of the leaderboard only changes when the snapshot or the queue of submissions does """
+        leaderboard.publish()
+        version = json.loads(self.read(paths.LEADERBOARD_JSON_FILE))['version']
+        leaderboard.publish()
+        self.assertEqual(json.loads(self.read(paths.LEADERBOARD_JSON_FILE))['version'], version)
+
+        self.queue("carol", datetime(2020, 1, 3))
+        leaderboard.publish()
+        published = json.loads(self.read(paths.LEADERBOARD_JSON_FILE))
+        self.assertEqual(published['queued_submissions'], 1)
+        self.assertNotEqual(published['version'], version)
+
+    def test_no_snapshot(self):
+        """ Nothing is published before the first snapshot is written """
+        os.remove(paths.RESULTS_FILE)
+        leaderboard.publish()
+        self.assertFalse(os.path.exists(paths.LEADERBOARD_HTML_FILE))
+
+
+class TestThreadedServer(LeaderboardTestCase):
+    """ The threaded results server sending the published leaderboard """
+
+    def setUp(self):
+        super().setUp()
+        leaderboard.publish()
+        self.httpd = results_server.ThreadedHTTPServer(('127.0.0.1', 0), results_server.TourneyResultsHandler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.addCleanup(self.httpd.server_close)
+        self.addCleanup(self.httpd.shutdown)
+
+    def request(self, method: str, path: str, **headers) -> (client.HTTPResponse, bytes):
+        """ Make a request to the server """
+        connection = client.HTTPConnection(*self.httpd.server_address, timeout=10)
+        self.addCleanup(connection.close)
+        connection.request(method, path, headers={name.replace('_', '-'): value for (name, value) in headers.items()})
+        sent = connection.getresponse()
+        return sent, sent.read()
+
+    def test_page_is_sent(self):
+        """ The published page is sent as it is, compressed if the client accepts gzip """
+        (sent, body) = self.request('GET', "/")
+        self.assertEqual(sent.status, HTTPStatus.OK)
+        self.assertEqual(body, self.read(paths.LEADERBOARD_HTML_FILE))
+
+        (sent, body) = self.request('GET', "/", Accept_Encoding="gzip")
+        self.assertEqual(sent.getheader('Content-Encoding'), 'gzip')
+        self.assertEqual(int(sent.getheader('Content-Length')), len(body))
+        self.assertEqual(gzip.decompress(body), self.read(paths.LEADERBOARD_HTML_FILE))
+
+    def test_json_is_sent(self):
+        """ The JSON version of the leaderboard is sent from its own path """
+        (sent, body) = self.request('GET', "/leaderboard.json")
+        self.assertEqual(sent.getheader('Content-Type'), 'application/json')
+        self.assertEqual(body, self.read(paths.LEADERBOARD_JSON_FILE))
+
+    def test_revalidation(self):
+        """ A client with the current page is told it hasn't been modified, and HEAD requests have no body """
+        (sent, _) = self.request('GET', "/")
+        (revalidated, body) = self.request('GET', "/", If_None_Match=sent.getheader('ETag'))
+        self.assertEqual((revalidated.status, body), (HTTPStatus.NOT_MODIFIED, b""))
+
+        (head, body) = self.request('HEAD', "/")
+        self.assertEqual(head.status, HTTPStatus.OK)
+        self.assertEqual(body, b"")
+        self.assertTrue(re.fullmatch(r'"[0-9a-f]+-[0-9a-f]+"', head.getheader('ETag')))
+
+
+class TestLeaderboardEvent(LeaderboardTestCase):
+    """ results_server.leaderboard_event """
+
+    def test_event(self):
+        """ The event pushed to subscribers changes each time a different leaderboard is published """
+        self.assertIsNone(results_server.leaderboard_event())
+        leaderboard.publish()
+        event = json.loads(results_server.leaderboard_event())
+        self.assertEqual(event['version'], json.loads(self.read(paths.LEADERBOARD_JSON_FILE))['version'])
+        self.assertEqual(event['queued_submissions'], 0)
+
+        leaderboard.publish()
+        self.assertEqual(json.loads(results_server.leaderboard_event()), event)
+        self.queue("carol", datetime(2020, 1, 3))
+        leaderboard.publish()
+        republished = json.loads(results_server.leaderboard_event())
+        self.assertNotEqual(republished['version'], event['version'])
+        self.assertEqual(republished['queued_submissions'], 1)
+
+    def test_events_path(self):
+        """ The threaded server doesn't provide events, so answers their path with an error """
+        sent = results_server.route_request('GET', results_server.EVENTS_PATH, Message())
+        self.assertEqual(sent.status, HTTPStatus.NOT_FOUND)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Unit tests of the manifests used to detect which tests and programs of a submission have changed.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import json
+import os
+import unittest
+
+from test.temp_state import TempStateTestCase
+from tournament.config.assignments.fuzz_assignment import FuzzAssignment
+from tournament.util import manifest, paths
+
+
+class ManifestTestCase(TempStateTestCase):
+    """ A test case with a fuzz assignment of two programs, and submissions of it """
+
+    def setUp(self):
+        super().setUp()
+        for prog in ["original", "include", "prog1", "prog2"]:
+            os.makedirs(os.path.join(self.state_dir, "source_assg", "src", prog))
+        self.assg = FuzzAssignment(os.path.join(self.state_dir, "source_assg"))
+
+    def write(self, submitter: str, files: dict) -> str:
+        """
+        Write files into a submission
+        :return: the directory of the submission
+        """
+        submission_dir = os.path.join(self.state_dir, submitter)
+        for (file_name, contents) in files.items():
+            os.makedirs(os.path.dirname(f"{submission_dir}/{file_name}"), exist_ok=True)
+            with open(f"{submission_dir}/{file_name}", 'w') as file:
+                file.write(contents)
+        return submission_dir
+
+
+class TestHashing(ManifestTestCase):
+    """ manifest.hash_file and manifest.hash_tree """
+
+    def test_ignore_whitespace(self):
+        """ Whitespace within lines is only ignored when asked to, as by `diff -w` """
+        submission_dir = self.write("alice", {"a.c": "int x = 1;\n", "b.c": "int x=1;  \n"})
+        (file_a, file_b) = (f"{submission_dir}/a.c", f"{submission_dir}/b.c")
+        self.assertNotEqual(manifest.hash_file(file_a), manifest.hash_file(file_b))
+        self.assertEqual(manifest.hash_file(file_a, ignore_whitespace=True),
+                         manifest.hash_file(file_b, ignore_whitespace=True))
+
+    def test_tree_paths_are_relative_to_root(self):
+        """ Files are named relative to the root of the submission, not the hashed directory """
+        submission_dir = self.write("alice", {"src/prog1/main.c": "main", "src/prog2/main.c": "other"})
+        hashes = manifest.hash_tree(submission_dir, "src/prog1")
+        self.assertEqual(list(hashes), [os.path.join("src", "prog1", "main.c")])
+
+    def test_missing_directory(self):
+        """ A directory that doesn't exist has no files """
+        self.assertEqual(manifest.hash_tree(self.state_dir, "missing"), {})
+
+
+class TestManifest(ManifestTestCase):
+    """ Creating, storing and comparing the manifests of submissions """
+
+    def test_manifest_per_test_and_prog(self):
+        """ Every test and program has an entry, listing the files in its directories """
+        submission_dir = self.write("alice", {"fuzzer/fuzz.py": "fuzz", "src/prog1/main.c": "main"})
+        created = self.assg.create_manifest(submission_dir)
+        self.assertEqual(set(created['tests']["fuzzer"]), {os.path.join("fuzzer", "fuzz.py")})
+        self.assertEqual(set(created['progs']["prog1"]), {os.path.join("src", "prog1", "main.c")})
+        self.assertEqual(created['progs']["prog2"], {})
+
+    def test_stored_manifest_is_loaded(self):
+        """ A stored manifest is used instead of hashing the submission again """
+        submission_dir = self.write("alice", {"src/prog1/main.c": "main"})
+        self.assg.write_manifest(submission_dir)
+        with open(f"{submission_dir}/{paths.MANIFEST_FILE}", 'r') as file:
+            self.assertEqual(json.load(file), self.assg.create_manifest(submission_dir))
+
+        self.write("alice", {"src/prog1/main.c": "changed after the manifest was stored"})
+        self.assertNotEqual(self.assg.load_manifest(submission_dir), self.assg.create_manifest(submission_dir))
+
+    def test_fingerprint(self):
+        """ Submissions with the same tests and programs have the same fingerprint, whether stored or not """
+        alice_dir = self.write("alice", {"src/prog1/main.c": "main", "README": "alice"})
+        bob_dir = self.write("bob", {"src/prog1/main.c": "main"})
+        self.assg.write_manifest(alice_dir)
+        self.assertEqual(self.assg.get_fingerprint(alice_dir), self.assg.get_fingerprint(bob_dir))
+
+        self.write("bob", {"src/prog2/main.c": "main"})
+        self.assertNotEqual(self.assg.get_fingerprint(alice_dir), self.assg.get_fingerprint(bob_dir))
+
+    def test_changed_progs(self):
+        """ Only programs whose files have changed since the old submission are new """
+        old_dir = self.write("old", {"src/prog1/main.c": "main", "src/prog2/main.c": "main"})
+        self.assg.write_manifest(old_dir)
+        new_dir = self.write("new", {"src/prog1/main.c": "main", "src/prog2/main.c": "changed"})
+        self.assertEqual(self.assg.detect_new_progs(new_dir, old_dir), ["prog2"])
+
+    def test_no_old_submission(self):
+        """ Every program of a first submission is new """
+        new_dir = self.write("new", {"src/prog1/main.c": "main"})
+        self.assertEqual(self.assg.detect_new_progs(new_dir, os.path.join(self.state_dir, "missing")),
+                         ["prog1", "prog2"])
+
+
+class TestProgFingerprint(ManifestTestCase):
+    """ AbstractAssignment.get_prog_fingerprint """
+
+    def _fingerprints_match(self, prog1_files: dict, prog2_files: dict) -> bool:
+        """ Whether two programs of a submission have the same fingerprint, checking it agrees with progs_identical """
+        submission_dir = self.write("alice", {**{f"src/prog1/{name}": code for (name, code) in prog1_files.items()},
+                                              **{f"src/prog2/{name}": code for (name, code) in prog2_files.items()}})
+        match = self.assg.get_prog_fingerprint("prog1", submission_dir) == \
+            self.assg.get_prog_fingerprint("prog2", submission_dir)
+        self.assertEqual(match, self.assg.progs_identical("prog1", "prog2", submission_dir))
+        return match
+
+    def test_identical_programs(self):
+        """ Copies of a program under different names have the same fingerprint """
+        self.assertTrue(self._fingerprints_match({"main.c": "int main() {}\n"}, {"main.c": "int main() {}\n"}))
+
+    def test_whitespace_is_ignored(self):
+        """ Programs that only differ in whitespace within lines have the same fingerprint """
+        self.assertTrue(self._fingerprints_match({"main.c": "int main() {}\n"}, {"main.c": "int  main(){ }\t\n"}))
+
+    def test_different_code(self):
+        """ Programs with different code have different fingerprints """
+        self.assertFalse(self._fingerprints_match({"main.c": "int main() {}\n"}, {"main.c": "int main() {1;}\n"}))
+
+    def test_different_file_names(self):
+        """ Programs with the same code in differently named files have different fingerprints """
+        self.assertFalse(self._fingerprints_match({"main.c": "int main() {}\n"}, {"prog.c": "int main() {}\n"}))
+
+    def test_extra_file(self):
+        """ A program with an extra file has a different fingerprint """
+        self.assertFalse(self._fingerprints_match({"main.c": "int main() {}\n"},
+                                                  {"main.c": "int main() {}\n", "util.h": "\n"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Unit tests of recording and reading the tournament's throughput metrics.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+
+from tournament.util import metrics, paths, types
+
+
+class TestMetrics(unittest.TestCase):
+    """ Recording metrics into the block, and reading them back """
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.metrics_file = paths.METRICS_FILE
+        paths.METRICS_FILE = os.path.join(self.state_dir, ".metrics")
+        metrics.reset(4)
+
+    def tearDown(self):
+        paths.METRICS_FILE = self.metrics_file
+        # the block is mapped once per process
+        metrics._mapped.clear()  # pylint: disable=protected-access
+        shutil.rmtree(self.state_dir)
+
+    def test_no_block(self):
+        """ Nothing is read if no block has been created """
+        os.remove(paths.METRICS_FILE)
+        self.assertIsNone(metrics.read())
+
+    def test_block_of_another_layout(self):
+        """ A block written by a version with other slots isn't read """
+        with open(paths.METRICS_FILE, 'r+b') as block_file:
+            block_file.write(struct.pack('d', len(metrics.SLOTS) + 1))
+        self.assertIsNone(metrics.read())
+
+    def test_regions_are_summed(self):
+        """ Metrics recorded by different processes are summed across their regions """
+        metrics.record_submission("tested", 20)
+        process = multiprocessing.current_process()
+        name = process.name
+        try:
+            for number in [1, 2]:
+                process.name = f"process_{number}"
+                metrics.record_cell(types.TestResult.BUG_FOUND, 0.2)
+        finally:
+            process.name = name
+
+        values = metrics.read()
+        self.assertEqual(values["tourney_submissions_processed_total:tested"], 1)
+        self.assertEqual(values["tourney_submission_duration_seconds:30"], 1)
+        self.assertEqual(values["tourney_cells_total:BUG_FOUND"], 2)
+        self.assertEqual(values["tourney_cell_duration_seconds:0.25"], 2)
+        self.assertAlmostEqual(values["tourney_cell_duration_seconds:sum"], 0.4)
+
+    def test_read_waits_for_a_region_being_written(self):
+        """ A region part way through being written is read once the write finishes """
+        block = metrics._block()  # pylint: disable=protected-access
+        offset = 8 + metrics.REGION_BYTES
+        slot_offset = offset + 8 * (1 + metrics.SLOTS["tourney_pool_processes_busy"])
+
+        # a writer part way through updating a region, which has not yet written its new value
+        struct.pack_into('d', block, offset, 1)
+
+        def finish_write():
+            struct.pack_into('d', block, slot_offset, 1)
+            struct.pack_into('d', block, offset, 2)
+
+        writer = threading.Timer(0.02, finish_write)
+        writer.start()
+        try:
+            self.assertEqual(metrics.read()["tourney_pool_processes_busy"], 1)
+        finally:
+            writer.join()
+
+    def test_exposition(self):
+        """ Counters, histograms and gauges are written in the Prometheus text format """
+        metrics.record_cell(types.TestResult.NO_BUGS_DETECTED, 0.02)
+        metrics.record_cell(types.TestResult.NO_BUGS_DETECTED, 100)
+        metrics.record_busy(True)
+
+        lines = metrics.exposition([("tourney_queue_length", "Submissions queued", 3)]).splitlines()
+        self.assertIn("tourney_queue_length 3", lines)
+        self.assertIn('tourney_cells_total{result="NO_BUGS_DETECTED"} 2', lines)
+        self.assertIn('tourney_cell_duration_seconds_bucket{le="0.05"} 1', lines)
+        self.assertIn('tourney_cell_duration_seconds_bucket{le="60"} 1', lines)
+        self.assertIn('tourney_cell_duration_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn("tourney_cell_duration_seconds_count 2", lines)
+        self.assertIn("tourney_pool_processes_idle 3", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
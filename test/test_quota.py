@@ -0,0 +1,107 @@
+"""
+Unit tests of the size accounting of submissions.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from tournament.util import quota
+from tournament.util.quota import QuotaExceeded, SizeReport
+
+
+class TestFormatSize(unittest.TestCase):
+    """ quota.format_size """
+
+    def test_du_style(self):
+        """ Sizes are written as `du -h` writes them """
+        for (num_bytes, size) in [(512, "512B"), (1500, "1.5K"), (744000, "744K"), (1800000000, "1.8G")]:
+            self.assertEqual(quota.format_size(num_bytes), size)
+
+
+class TestSizeReport(unittest.TestCase):
+    """ SizeReport accounting for files """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _write(self, rel_path: str, num_bytes: int) -> int:
+        """ Write a file under the work directory, returning the disk space it uses """
+        path = os.path.join(self.work_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b"x" * num_bytes)
+        return os.lstat(path).st_blocks * 512
+
+    def test_breakdown(self):
+        """ Each file is counted towards its directories, down to max_depth """
+        report = SizeReport(limit=1000, max_depth=1)
+        report.add(os.path.join("tests", "unit", "test1"), 100)
+        report.add(os.path.join("tests", "test2"), 10)
+        report.add("build.xml", 1)
+        self.assertEqual(report.total, 111)
+        self.assertEqual(report.breakdown, {".": 111, os.path.join(".", "tests"): 110})
+
+    def test_limit(self):
+        """ Going over the limit raises QuotaExceeded, but reaching it doesn't """
+        report = SizeReport(limit=100)
+        report.add("a", 100)
+        with self.assertRaises(QuotaExceeded):
+            report.add("b", 1)
+
+    def test_walk(self):
+        """ Walking a tree measures the disk space of every file, without following symlinks """
+        used = self._write(os.path.join("src", "prog.c"), 10000) + self._write("build.xml", 10)
+        os.symlink(os.path.join(self.work_dir, "src"), os.path.join(self.work_dir, "link"))
+        report = SizeReport(limit=10 ** 9)
+        report.walk(self.work_dir)
+        self.assertEqual(report.total - os.lstat(os.path.join(self.work_dir, "link")).st_blocks * 512, used)
+
+    def test_copytree(self):
+        """ A tree within the quota is copied, and accounted for under its destination """
+        used = self._write(os.path.join("src", "prog.c"), 10000)
+        report = SizeReport(limit=10 ** 9)
+        report.copytree(os.path.join(self.work_dir, "src"), os.path.join(self.work_dir, "copy"), "programs")
+        self.assertTrue(os.path.isfile(os.path.join(self.work_dir, "copy", "prog.c")))
+        self.assertEqual(report.breakdown[os.path.join(".", "programs")], used)
+
+    def test_copytree_over_quota(self):
+        """ A tree over the quota is partially copied and then removed """
+        for name in ["a", "b", "c"]:
+            self._write(os.path.join("src", name), 10000)
+        report = SizeReport(limit=1)
+        with self.assertRaises(QuotaExceeded):
+            report.copytree(os.path.join(self.work_dir, "src"), os.path.join(self.work_dir, "copy"), "programs")
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, "copy")))
+
+
+class TestCheckQuota(unittest.TestCase):
+    """ quota.check_quota """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.work_dir, "prog.c"), 'wb') as file:
+            file.write(b"x" * 10000)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_within_quota(self):
+        """ A submission within the quota is valid """
+        self.assertTrue(quota.check_quota(self.work_dir, 10 ** 9))
+
+    def test_over_quota(self):
+        """ A submission over the quota is invalid, with a breakdown of where its space was used """
+        result = quota.check_quota(self.work_dir, 1)
+        self.assertFalse(result)
+        self.assertIn("larger than 1B", result.traces)
+        self.assertIn("\t.", result.traces)
+
+
+if __name__ == '__main__':
+    unittest.main()
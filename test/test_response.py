@@ -0,0 +1,194 @@
+"""
+Unit tests of the responses of the results server.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from email.message import Message
+from email.utils import formatdate
+from http import HTTPStatus
+
+from tournament.reporting import response
+
+
+def request_headers(**headers) -> Message:
+    """ The headers of a request, e.g. If_None_Match='"etag"' for If-None-Match """
+    message = Message()
+    for (name, value) in headers.items():
+        message[name.replace('_', '-')] = value
+    return message
+
+
+class PublishedFileTestCase(unittest.TestCase):
+    """ A test case with a published file """
+
+    def setUp(self):
+        self.publish_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.publish_dir, "leaderboard.html")
+        self.publish(b"<html>v1</html>")
+
+    def tearDown(self):
+        shutil.rmtree(self.publish_dir)
+
+    def publish(self, contents: bytes, file_path: str = None):
+        """ Publish a file by replacing it, as leaderboard.publish does """
+        file_path = file_path or self.file_path
+        with open(f"{file_path}.tmp", 'wb') as file:
+            file.write(contents)
+        os.replace(f"{file_path}.tmp", file_path)
+
+    def get(self, **headers) -> response.Response:
+        """ Request the published file """
+        result = response.file_response(self.file_path, 'text/html', request_headers(**headers))
+        self.addCleanup(result.close)
+        return result
+
+
+class TestConditionalGet(PublishedFileTestCase):
+    """ response.file_response answering conditional requests """
+
+    def test_file_is_sent(self):
+        """ The file is sent with validators the client can revalidate its copy with """
+        sent = self.get()
+        self.assertEqual(sent.status, HTTPStatus.OK)
+        self.assertEqual(sent.file.read(), b"<html>v1</html>")
+        headers = dict(sent.headers)
+        self.assertEqual(headers['Content-Length'], str(len(b"<html>v1</html>")))
+        self.assertEqual(headers['Cache-Control'], 'no-cache')
+        self.assertIn('ETag', headers)
+        self.assertIn('Last-Modified', headers)
+
+    def test_matching_etag(self):
+        """ A client with the current version is told it hasn't been modified, without the file """
+        etag = dict(self.get().headers)['ETag']
+        for if_none_match in [etag, f'"other", {etag}', '*']:
+            with self.subTest(if_none_match=if_none_match):
+                not_modified = self.get(If_None_Match=if_none_match)
+                self.assertEqual(not_modified.status, HTTPStatus.NOT_MODIFIED)
+                self.assertIsNone(not_modified.file)
+                self.assertEqual(dict(not_modified.headers)['ETag'], etag)
+
+    def test_republished_file(self):
+        """ A file republished since the client's copy has a new ETag, and is sent again """
+        etag = dict(self.get().headers)['ETag']
+        self.publish(b"<html>v2</html>")
+        sent = self.get(If_None_Match=etag)
+        self.assertEqual(sent.status, HTTPStatus.OK)
+        self.assertNotEqual(dict(sent.headers)['ETag'], etag)
+        self.assertEqual(sent.file.read(), b"<html>v2</html>")
+
+    def test_if_modified_since(self):
+        """ Without an ETag, the client's copy is current if it is no older than the file """
+        self.assertEqual(self.get(If_Modified_Since=formatdate(time.time() + 60, usegmt=True)).status,
+                         HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(self.get(If_Modified_Since=formatdate(time.time() - 60, usegmt=True)).status, HTTPStatus.OK)
+        self.assertEqual(self.get(If_Modified_Since="not a date").status, HTTPStatus.OK)
+
+    def test_etag_takes_precedence(self):
+        """ If-Modified-Since is ignored when the client also sends an ETag """
+        sent = self.get(If_None_Match='"other"', If_Modified_Since=formatdate(time.time() + 60, usegmt=True))
+        self.assertEqual(sent.status, HTTPStatus.OK)
+
+    def test_unpublished_file(self):
+        """ Requests for a file that hasn't been published yet are answered with an error """
+        os.remove(self.file_path)
+        self.assertEqual(self.get().status, HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+class TestJsonResponse(unittest.TestCase):
+    """ response.json_response answering conditional requests """
+
+    def test_matching_etag(self):
+        """ The ETag of a document depends on its contents """
+        etag = dict(response.json_response({'a': 1}, request_headers()).headers)['ETag']
+        self.assertEqual(response.json_response({'a': 1}, request_headers(If_None_Match=etag)).status,
+                         HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response.json_response({'a': 2}, request_headers(If_None_Match=etag)).status, HTTPStatus.OK)
+
+    def test_errors_are_always_sent(self):
+        """ Documents sent with an error status are never answered with Not Modified """
+        headers = request_headers()
+        etag = dict(response.json_response({'error': "x"}, headers, HTTPStatus.NOT_FOUND).headers)['ETag']
+        sent = response.json_response({'error': "x"}, request_headers(If_None_Match=etag), HTTPStatus.NOT_FOUND)
+        self.assertEqual(sent.status, HTTPStatus.NOT_FOUND)
+
+
+class TestAcceptsGzip(unittest.TestCase):
+    """ response.accepts_gzip """
+
+    def test_accepted(self):
+        """ gzip is accepted whether named on its own, among other codings, or by its old name """
+        for accept_encoding in ["gzip", "deflate, gzip;q=0.5", "x-gzip", "GZip", "br, gzip ; q=1"]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertTrue(response.accepts_gzip(accept_encoding))
+
+    def test_not_accepted(self):
+        """ gzip is not accepted if the client doesn't name it, or refuses it with a quality of 0 """
+        for accept_encoding in [None, "", "deflate, br", "gzip;q=0", "gzip; q=0.000", "identity"]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertFalse(response.accepts_gzip(accept_encoding))
+
+
+class TestGzip(PublishedFileTestCase):
+    """ response.file_response and response.json_response sending gzip compressed bodies """
+
+    def setUp(self):
+        super().setUp()
+        self.compressed = gzip.compress(b"<html>v1</html>")
+        self.publish(self.compressed, f"{self.file_path}.gz")
+
+    def test_compressed_copy_is_sent(self):
+        """ A client that accepts gzip is sent the pre-compressed copy of the file """
+        sent = self.get(Accept_Encoding="gzip")
+        headers = dict(sent.headers)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Content-Length'], str(len(self.compressed)))
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(sent.file.read()), b"<html>v1</html>")
+
+    def test_uncompressed_file_is_sent(self):
+        """ A client that doesn't accept gzip is sent the file itself """
+        for headers in [{}, {'Accept_Encoding': "gzip;q=0"}]:
+            with self.subTest(headers=headers):
+                sent = self.get(**headers)
+                self.assertNotIn('Content-Encoding', dict(sent.headers))
+                self.assertEqual(sent.file.read(), b"<html>v1</html>")
+
+    def test_missing_compressed_copy(self):
+        """ The file itself is sent if it has no compressed copy, even to clients that accept gzip """
+        os.remove(f"{self.file_path}.gz")
+        sent = self.get(Accept_Encoding="gzip")
+        self.assertNotIn('Content-Encoding', dict(sent.headers))
+        self.assertEqual(sent.file.read(), b"<html>v1</html>")
+
+    def test_etag_per_encoding(self):
+        """ The compressed and uncompressed copies have different ETags, so caches can't confuse them """
+        compressed_etag = dict(self.get(Accept_Encoding="gzip").headers)['ETag']
+        etag = dict(self.get().headers)['ETag']
+        self.assertNotEqual(compressed_etag, etag)
+        self.assertEqual(self.get(Accept_Encoding="gzip", If_None_Match=compressed_etag).status,
+                         HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(self.get(Accept_Encoding="gzip", If_None_Match=etag).status, HTTPStatus.OK)
+
+    def test_large_documents_are_compressed(self):
+        """ JSON documents are only compressed if they are large enough to benefit """
+        large = {'data': "x" * response.GZIP_MIN_BYTES}
+        sent = response.json_response(large, request_headers(Accept_Encoding="gzip"))
+        self.assertEqual(dict(sent.headers)['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(sent.body)), large)
+
+        for (data, headers) in [({'data': "x"}, request_headers(Accept_Encoding="gzip")), (large, request_headers())]:
+            with self.subTest(data=len(data['data']), headers=dict(headers)):
+                sent = response.json_response(data, headers)
+                self.assertNotIn('Content-Encoding', dict(sent.headers))
+                self.assertEqual(json.loads(sent.body), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
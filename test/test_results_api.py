@@ -0,0 +1,149 @@
+"""
+Unit tests of the JSON API of the tournament results, answered from the results database.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import json
+import unittest
+from datetime import datetime
+from http import HTTPStatus
+from unittest import mock
+
+from test.test_leaderboard import LeaderboardTestCase, snapshot, snapshot_entry
+from test.test_response import request_headers
+from tournament.reporting import response, results_api, results_db, results_server
+from tournament.util import types
+
+SUBMITTERS = ["alice", "bob", "carol"]
+
+
+def _state() -> dict:
+    """ A tournament state in which only alice's test found a bug, in bob's prog """
+    def result(tester, testee):
+        return types.TestResult.BUG_FOUND if (tester, testee) == ("alice", "bob") else \
+            types.TestResult.NO_BUGS_DETECTED
+
+    return {tester: {'test_results': {testee: {"test1": {"prog1": result(tester, testee).value}}
+                                      for testee in SUBMITTERS if testee != tester}}
+            for tester in SUBMITTERS}
+
+
+class TestResultsApi(LeaderboardTestCase):
+    """ results_api.route_api_request, as routed by results_server.route_request """
+    # pylint: disable=protected-access
+
+    def setUp(self):
+        super().setUp()
+        # each thread keeps its reader open, so the reader of the previous test's database is closed first
+        self._close_reader()
+        self.addCleanup(self._close_reader)
+        assignment_config = mock.patch.object(results_db, "AssignmentConfig")
+        assignment_config.start().return_value.get_assignment.return_value = self.assg
+        self.addCleanup(assignment_config.stop)
+
+    @staticmethod
+    def _close_reader():
+        """ Close the current thread's connection to the results database """
+        if getattr(results_db._readers, 'connection', None) is not None:
+            results_db._readers.connection.close()
+            results_db._readers.connection = None
+
+    @staticmethod
+    def update():
+        """ Write a snapshot of three submitters, and the state it was computed from, to the results database """
+        results_db.update(snapshot({"alice": snapshot_entry(1.0, 0.5), "bob": snapshot_entry(0.5, 0.5),
+                                    "carol": snapshot_entry(0.5, 0.5)}), _state())
+
+    @staticmethod
+    def get(path: str, **headers) -> (HTTPStatus, dict):
+        """ Request a path of the API, and return the status and JSON document of the response """
+        sent = results_server.route_request('GET', path, request_headers(**headers))
+        return sent.status, json.loads(sent.body) if sent.body else None
+
+    def test_not_published(self):
+        """ Results are unavailable until the database has been written """
+        self.assertEqual(self.get("/api/leaderboard")[0], HTTPStatus.SERVICE_UNAVAILABLE)
+
+    def test_leaderboard_pages(self):
+        """ The leaderboard is paged in rank order """
+        self.update()
+        (status, page) = self.get("/api/leaderboard?page=1&per_page=2")
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual([(entry['name'], entry['rank']) for entry in page['leaderboard']], [("alice", 1), ("bob", 2)])
+        self.assertEqual(page['leaderboard'][0]['tests'], {"test1": 1})
+        self.assertEqual((page['num_pages'], page['num_submitters']), (2, 3))
+        self.assertEqual((page['tests'], page['progs']), (["test1"], ["prog1"]))
+
+        (_, page) = self.get("/api/leaderboard?page=2&per_page=2")
+        self.assertEqual([entry['name'] for entry in page['leaderboard']], ["carol"])
+        (_, page) = self.get("/api/leaderboard")
+        self.assertEqual((page['page'], page['per_page'], len(page['leaderboard'])),
+                         (1, results_api.DEFAULT_PAGE_SIZE, 3))
+
+    def test_bad_page(self):
+        """ Pages that aren't positive integers, or are too large, are refused """
+        self.update()
+        for query in ["page=0", "page=x", "per_page=0", f"per_page={results_api.MAX_PAGE_SIZE + 1}", "per_page=1.5"]:
+            with self.subTest(query=query):
+                (status, document) = self.get(f"/api/leaderboard?{query}")
+                self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+                self.assertIn('error', document)
+
+    def test_submitter(self):
+        """ A submitter's entry has the results of their tests and progs, and their place in the queue """
+        self.update()
+        self.queue("bob", datetime(2020, 1, 3))
+        (status, details) = self.get("/api/submitter/alice")
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(details['rank'], 1)
+        self.assertEqual(details['tests_against_progs']["bob"], {"test1": {"prog1": types.TestResult.BUG_FOUND.value}})
+        self.assertEqual(set(details['progs_against_tests']), {"bob", "carol"})
+        self.assertIsNone(details['queue_position'])
+        self.assertEqual(details['queued_submissions'], 1)
+
+        (_, details) = self.get("/api/submitter/bob")
+        self.assertEqual(details['queue_position'], 1)
+        self.assertIsNotNone(details['estimated_completion'])
+
+    def test_mutant(self):
+        """ A prog's entry has the result of every other submitter's test suites against it """
+        self.update()
+        (status, details) = self.get("/api/mutant/bob/prog1")
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(details['tests_against_prog'], {"alice": {"test1": types.TestResult.BUG_FOUND.value},
+                                                         "carol": {"test1": types.TestResult.NO_BUGS_DETECTED.value}})
+
+    def test_not_found(self):
+        """ Unknown submitters, progs and endpoints are not found """
+        self.update()
+        for path in ["/api/submitter/dave", "/api/mutant/dave/prog1", "/api/mutant/bob/prog2", "/api/mutant/bob",
+                     "/api/unknown"]:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[0], HTTPStatus.NOT_FOUND)
+
+    def test_queue(self):
+        """ The queue lists each queued submission in the order they will be processed, without needing results """
+        self.queue("carol", datetime(2020, 1, 3))
+        self.queue("bob", datetime(2020, 1, 4))
+        (status, queue) = self.get("/api/queue")
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual([(entry['position'], entry['submitter']) for entry in queue['queue']],
+                         [(1, "carol"), (2, "bob")])
+
+    def test_revalidation(self):
+        """ A client whose copy of an answer is current is told it hasn't been modified """
+        self.update()
+        etag = dict(results_server.route_request('GET', "/api/leaderboard", request_headers()).headers)['ETag']
+        sent = results_server.route_request('GET', "/api/leaderboard", request_headers(If_None_Match=etag))
+        self.assertEqual(sent.status, HTTPStatus.NOT_MODIFIED)
+
+    def test_large_answers_are_compressed(self):
+        """ Answers large enough to benefit are compressed for clients that accept gzip """
+        with mock.patch.object(response, "GZIP_MIN_BYTES", 0):
+            self.update()
+            sent = results_server.route_request('GET', "/api/leaderboard", request_headers(Accept_Encoding="gzip"))
+        self.assertEqual(dict(sent.headers)['Content-Encoding'], 'gzip')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Unit tests of the incremental update of the head to head cells in the results database.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import sqlite3
+import unittest
+
+from tournament.reporting import results_db
+from tournament.util import types
+
+SUBMITTERS = ["alice", "bob", "carol"]
+
+
+def _state(bug_found_by: dict) -> dict:
+    """
+    A tournament state in which every submitter has run their one test against every other submitters one prog
+    :param bug_found_by: for each tester, the testees whose prog their test found a bug in
+    """
+    def result(tester, testee):
+        return types.TestResult.BUG_FOUND if testee in bug_found_by.get(tester, []) else \
+            types.TestResult.NO_BUGS_DETECTED
+
+    return {tester: {'test_results': {testee: {'test1': {'prog1': result(tester, testee).value}}
+                                      for testee in SUBMITTERS if testee != tester}}
+            for tester in SUBMITTERS}
+
+
+class TestWriteCells(unittest.TestCase):
+    """ results_db._write_cells """
+    # pylint: disable=protected-access
+
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.executescript(results_db.SCHEMA)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def _cells(self) -> list:
+        return self.connection.execute("SELECT * FROM cells ORDER BY tester, testee, test, prog").fetchall()
+
+    def _rewritten(self, state: dict, changed_submitters) -> list:
+        results_db._write_cells(self.connection, state, changed_submitters)
+        return self._cells()
+
+    def test_full_rewrite(self):
+        """ Rewriting every cell writes one cell per tester, testee, test and prog """
+        cells = self._rewritten(_state({"alice": ["bob"]}), None)
+        self.assertEqual(len(cells), len(SUBMITTERS) * (len(SUBMITTERS) - 1))
+        self.assertIn(("alice", "bob", "test1", "prog1", types.TestResult.BUG_FOUND.value), cells)
+
+    def test_incremental_matches_full_rewrite(self):
+        """ Rewriting the cells of changed submitters gives the same cells as rewriting every cell """
+        results_db._write_cells(self.connection, _state({}), None)
+
+        state = _state({"alice": ["bob"], "carol": ["alice"]})
+        incremental = self._rewritten(state, ["alice"])
+        self.assertEqual(incremental, self._rewritten(state, None))
+
+    def test_unchanged_submitters_are_not_rewritten(self):
+        """ Cells between submitters that haven't changed are left as they were """
+        results_db._write_cells(self.connection, _state({}), None)
+
+        # bob and carols cells are only rewritten if they are reported as changed
+        cells = self._rewritten(_state({"bob": ["carol"]}), ["alice"])
+        self.assertIn(("bob", "carol", "test1", "prog1", types.TestResult.NO_BUGS_DETECTED.value), cells)
+
+    def test_several_changed_submitters(self):
+        """ Cells between two changed submitters are rewritten once """
+        results_db._write_cells(self.connection, _state({}), None)
+
+        state = _state({"alice": ["bob"], "bob": ["alice", "carol"]})
+        incremental = self._rewritten(state, ["alice", "bob"])
+        self.assertEqual(incremental, self._rewritten(state, None))
+
+    def test_changed_submitter_not_in_tournament(self):
+        """ A changed submitter that isn't in the tournament leaves the cells as a full rewrite would """
+        state = _state({})
+        results_db._write_cells(self.connection, state, None)
+        self.assertEqual(self._rewritten(state, ["dave"]), self._rewritten(state, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
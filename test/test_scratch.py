@@ -0,0 +1,114 @@
+"""
+Unit tests of the head to head test stages and build artefacts kept in scratch space.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import json
+import os
+import unittest
+from types import SimpleNamespace
+
+from test.temp_state import TempStateTestCase
+from tournament.processing import main as processing
+from tournament.util import paths, scratch
+
+
+class ScratchTestCase(TempStateTestCase):
+    """ A test case with a scratch space in its temporary state directory """
+
+    def setUp(self):
+        super().setUp()
+        self.scratch_dir = os.path.join(self.state_dir, "scratch")
+        self.write_processing_config({'scratch_dir': self.scratch_dir})
+        # the scratch space is configured once per process
+        scratch._scratch.clear()  # pylint: disable=protected-access
+
+    def tearDown(self):
+        scratch._scratch.clear()  # pylint: disable=protected-access
+        super().tearDown()
+
+    @staticmethod
+    def write(path: str, contents: str):
+        """ Write a file, creating the directories it is in """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(contents)
+
+
+class TestArtefacts(ScratchTestCase):
+    """ scratch.get_artefact_dir """
+
+    def _make_entry(self, submitter: str, manifest: dict, artefact: str):
+        """ Install a tourney entry with a manifest and a build artefact """
+        tourney_dir = paths.get_tourney_dir(submitter)
+        self.write(f"{tourney_dir}/{paths.MANIFEST_FILE}", json.dumps(manifest))
+        self.write(f"{tourney_dir}/bin/prog", artefact)
+
+    def test_artefact_copied_to_scratch(self):
+        """ An entry's artefacts are read from a copy in scratch space """
+        self._make_entry("alice", {'progs': {'prog': "v1"}}, "v1")
+        artefact_dir = scratch.get_artefact_dir("alice", "bin")
+        self.assertEqual(os.path.commonpath([artefact_dir, self.scratch_dir]), self.scratch_dir)
+        with open(f"{artefact_dir}/prog", 'r') as file:
+            self.assertEqual(file.read(), "v1")
+
+    def test_replaced_entry_is_copied_again(self):
+        """ A replaced entry's artefacts are copied again, even if the new entry has the same inode as the old """
+        self._make_entry("alice", {'progs': {'prog': "v1"}}, "v1")
+        old_dir = scratch.get_artefact_dir("alice", "bin")
+
+        self._make_entry("alice", {'progs': {'prog': "v2"}}, "v2")
+        new_dir = scratch.get_artefact_dir("alice", "bin")
+        self.assertNotEqual(new_dir, old_dir)
+        self.assertFalse(os.path.exists(old_dir))
+        with open(f"{new_dir}/prog", 'r') as file:
+            self.assertEqual(file.read(), "v2")
+
+    def test_entry_without_manifest(self):
+        """ Artefacts of an entry without a manifest can't be versioned, so are read from the entry itself """
+        self.write(f"{paths.get_tourney_dir('alice')}/bin/prog", "v1")
+        self.assertEqual(scratch.get_artefact_dir("alice", "bin"), f"{paths.get_tourney_dir('alice')}/bin")
+
+    def test_clear(self):
+        """ Clearing the scratch space removes every artefact and stage """
+        self._make_entry("alice", {'progs': {'prog': "v1"}}, "v1")
+        scratch.get_artefact_dir("alice", "bin")
+        scratch.clear()
+        self.assertEqual(os.listdir(self.scratch_dir), [])
+
+
+class TestTestStages(ScratchTestCase):
+    """ Persistent test stages created from the source assignment """
+
+    def setUp(self):
+        super().setUp()
+        # the part of an assignment that test stages are created from
+        source_assg_dir = os.path.join(self.state_dir, "source_assg")
+        self.source_assg = SimpleNamespace(get_source_assg_dir=lambda: source_assg_dir)
+        self.write(f"{self.source_assg.get_source_assg_dir()}/build.xml", "v1")
+
+    def _stage_contents(self) -> str:
+        """ The contents of the source file in the first test stage """
+        stage_dir = processing._get_test_stage(self.source_assg, 0)  # pylint: disable=protected-access
+        self.assertEqual(os.path.commonpath([stage_dir, self.scratch_dir]), self.scratch_dir)
+        with open(f"{stage_dir}/build.xml", 'r') as file:
+            return file.read()
+
+    def test_stage_is_reused(self):
+        """ A stage is only copied from the source assignment once """
+        self.assertEqual(self._stage_contents(), "v1")
+        stage_dir = processing._get_test_stage(self.source_assg, 0)  # pylint: disable=protected-access
+        self.write(f"{stage_dir}/build.xml", "prepared")
+        self.assertEqual(self._stage_contents(), "prepared")
+
+    def test_stage_is_rebuilt_for_a_changed_source_assignment(self):
+        """ A stage copied from an earlier version of the source assignment is rebuilt """
+        self.assertEqual(self._stage_contents(), "v1")
+        self.write(f"{self.source_assg.get_source_assg_dir()}/build.xml", "v2")
+        # the source assignment is fingerprinted once per process
+        processing._source_fingerprints.clear()  # pylint: disable=protected-access
+        self.assertEqual(self._stage_contents(), "v2")
+
+
+if __name__ == '__main__':
+    unittest.main()
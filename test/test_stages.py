@@ -0,0 +1,147 @@
+"""
+Unit tests of testing batches of pairs in double-buffered head to head test stages.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from test.test_scratch import ScratchTestCase
+from tournament.processing import main as processing
+from tournament.util import funcs, types
+
+
+class TestRelink(unittest.TestCase):
+    """ funcs.relink """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.link = os.path.join(self.work_dir, "link")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_link_is_reused(self):
+        """ A link already pointing at the target is left alone """
+        self.assertTrue(funcs.relink("alice", self.link))
+        self.assertFalse(funcs.relink("alice", self.link))
+        self.assertEqual(os.readlink(self.link), "alice")
+
+    def test_link_is_repointed(self):
+        """ A link pointing elsewhere is pointed at the target """
+        funcs.relink("alice", self.link)
+        self.assertTrue(funcs.relink("bob", self.link))
+        self.assertEqual(os.readlink(self.link), "bob")
+
+    def test_directory_is_replaced(self):
+        """ A directory copied into a stage by an earlier version is replaced by a link """
+        os.makedirs(os.path.join(self.link, "tests"))
+        self.assertTrue(funcs.relink("alice", self.link))
+        self.assertTrue(os.path.islink(self.link))
+
+
+class StageAssignment:
+    """
+    An assignment of one test and one program, whose stages are prepared by writing the pair they are prepared for.
+    Records the stage each cell was run in, and the pair the stage was prepared for when it was run
+    """
+
+    def __init__(self, source_assg_dir: str):
+        self.source_assg_dir = source_assg_dir
+        self.runs = []
+        self.runs_lock = threading.Lock()
+
+    def get_source_assg_dir(self) -> str:
+        """ The original source code of the assignment """
+        return self.source_assg_dir
+
+    @staticmethod
+    def get_test_list() -> [str]:
+        """ The one test of the assignment """
+        return ["test1"]
+
+    @staticmethod
+    def get_programs_list() -> [str]:
+        """ The one program of the assignment """
+        return ["prog1"]
+
+    @staticmethod
+    def prep_test_stage(tester: str, testee: str, test_stage_dir: str):
+        """ Prepare a stage for a pair """
+        with open(f"{test_stage_dir}/pair", 'w') as file:
+            file.write(f"{tester} {testee}")
+
+    def run_test(self, test: str, prog: str, test_stage_dir: str, fail_fast: bool = False) -> (types.TestResult, str):
+        """ Record the pair that the stage was prepared for """
+        with open(f"{test_stage_dir}/pair", 'r') as file:
+            pair = tuple(file.read().split())
+        with self.runs_lock:
+            self.runs.append((pair, test_stage_dir, test, prog, fail_fast))
+        return types.TestResult.BUG_FOUND, ""
+
+    @staticmethod
+    def exited_early(_traces: str) -> bool:
+        """ No run stops early """
+        return False
+
+
+class TestRunTests(ScratchTestCase):
+    """ processing.run_tests """
+
+    def setUp(self):
+        super().setUp()
+        self.write(f"{self.state_dir}/source_assg/build.xml", "")
+        self.assg = StageAssignment(f"{self.state_dir}/source_assg")
+        # cells that aren't rerun are taken from the tournament state
+        self.tourney_state = SimpleNamespace(get=lambda tester, testee, test, prog: types.TestResult.NOT_TESTED)
+        self.pairs = [("alice", "bob"), ("alice", "carol"), ("alice", "dave")]
+
+    def _run_tests(self, new_tests: [str], new_progs: [str]) -> ([tuple], dict):
+        """ Run a batch of pairs against the assignment """
+        with mock.patch.object(processing, "AssignmentConfig") as assignment_config:
+            assignment_config.return_value.get_assignment.return_value = self.assg
+            return processing.run_tests(self.pairs, self.tourney_state, new_tests, new_progs)
+
+    def test_pairs_are_tested_in_their_own_stage(self):
+        """ Each pair is tested in a stage prepared for it, alternating between the two stages """
+        (results, stats) = self._run_tests(["test1"], [])
+        self.assertEqual([run[0] for run in self.assg.runs], self.pairs)
+        stages = [run[1] for run in self.assg.runs]
+        self.assertEqual(stages[0], stages[2])
+        self.assertNotEqual(stages[0], stages[1])
+
+        self.assertEqual(results, [(tester, testee, {"test1": {"prog1": types.TestResult.BUG_FOUND}})
+                                   for (tester, testee) in self.pairs])
+        self.assertEqual((stats['pairs'], stats['cells']), (3, 3))
+
+    def test_unchanged_cells_are_reused(self):
+        """ Cells whose test and program are both unchanged are taken from the tournament state """
+        (results, stats) = self._run_tests([], [])
+        self.assertEqual(self.assg.runs, [])
+        self.assertEqual([test_set for (_, _, test_set) in results],
+                         [{"test1": {"prog1": types.TestResult.NOT_TESTED}}] * 3)
+        self.assertEqual(stats['cells'], 0)
+
+    def test_cells_stop_at_the_first_bug(self):
+        """ Head to head cells only need their result, so are run fail fast """
+        self._run_tests([], ["prog1"])
+        self.assertEqual([run[4] for run in self.assg.runs], [True] * 3)
+
+    def test_stages_persist_between_batches(self):
+        """ The stages of a batch are reused by the next batch, rather than copied again """
+        self._run_tests(["test1"], [])
+        stages = {run[1] for run in self.assg.runs}
+        for stage in stages:
+            self.write(f"{stage}/kept", "")
+        self._run_tests(["test1"], [])
+        self.assertEqual({run[1] for run in self.assg.runs}, stages)
+        self.assertTrue(all(os.path.isfile(f"{stage}/kept") for stage in stages))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+Unit tests of the live status board of the tournament daemon, and of the view of it rendered by `backend.py top`.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from test.temp_state import TempStateTestCase
+from tournament.reporting import top
+from tournament.util import funcs, paths, status_board
+
+
+class StatusBoardTestCase(TempStateTestCase):
+    """ A test case with a status board of its own, created by a daemon with pid 1234 """
+    # pylint: disable=protected-access
+
+    def setUp(self):
+        super().setUp()
+        self.board_name = paths.STATUS_BOARD_NAME
+        paths.STATUS_BOARD_NAME = f"swen_tourney_test_{os.getpid()}"
+        status_board.create(1234)
+        self.buf = status_board._board['block'].buf
+
+    def tearDown(self):
+        self.buf = None
+        status_board.remove()
+        status_board._header.clear()
+        status_board._slot.clear()
+        paths.STATUS_BOARD_NAME = self.board_name
+        super().tearDown()
+
+    @staticmethod
+    def in_pool_process(number: int):
+        """ Run as the pool process with the given number """
+        return mock.patch.object(funcs, "current_process", return_value=SimpleNamespace(name=f"process_{number}"))
+
+
+class TestHeader(StatusBoardTestCase):
+    """ The header of the status board, written by the daemon """
+
+    def test_created(self):
+        """ A new board records the daemon, and that it isn't processing a submission """
+        header = status_board.read_header(self.buf)
+        self.assertEqual((header['pid'], header['num_slots'], header['submitter']), (1234, status_board.NUM_SLOTS, ""))
+        self.assertEqual(header['sequence'] % 2, 0)
+        self.assertEqual(status_board.read_slots(self.buf), [])
+
+    def test_submission(self):
+        """ The submission being processed is recorded until the daemon has finished it """
+        status_board.set_submission("alice", 4)
+        header = status_board.read_header(self.buf)
+        self.assertEqual((header['submitter'], header['pairs_total'], header['pairs_done_before']), ("alice", 4, 0))
+        self.assertGreater(header['submission_started'], 0)
+
+        status_board.clear_submission()
+        header = status_board.read_header(self.buf)
+        self.assertEqual((header['submitter'], header['pairs_total']), ("", 0))
+
+    def test_long_names(self):
+        """ Names too long for their field are truncated """
+        status_board.set_submission("a" * (status_board.NAME_BYTES + 10), 1)
+        self.assertEqual(status_board.read_header(self.buf)['submitter'], "a" * status_board.NAME_BYTES)
+
+    def test_replaces_leftover_board(self):
+        """ A board left behind by a daemon that didn't shut down cleanly is replaced """
+        # pylint: disable=protected-access
+        status_board._board.clear()
+        status_board.create(5678)
+        self.buf = status_board._board['block'].buf
+        self.assertEqual(status_board.read_header(self.buf)['pid'], 5678)
+
+    def test_removed(self):
+        """ Readers can't attach to a board once the daemon has removed it """
+        self.buf = None
+        status_board.remove()
+        self.assertIsNone(status_board.attach())
+        status_board.create(1234)
+
+
+class TestSlots(StatusBoardTestCase):
+    """ The slots of the status board, written by pool processes """
+
+    def test_pair_and_cell(self):
+        """ A pool process records the pair and cell it is testing in its own slot, and what it has finished """
+        with self.in_pool_process(3):
+            status_board.start_pair("alice", "bob")
+            status_board.start_cell("test1", "prog1")
+            slots = status_board.read_slots(self.buf)
+            self.assertEqual([slot['slot'] for slot in slots], [3])
+            slot = slots[0]
+            self.assertEqual((slot['pid'], slot['busy']), (os.getpid(), 1))
+            self.assertEqual((slot['tester'], slot['testee'], slot['test'], slot['prog']),
+                             ("alice", "bob", "test1", "prog1"))
+            self.assertGreater(slot['cell_started'], 0)
+
+            status_board.finish_cell()
+            status_board.finish_pair(2)
+            status_board.set_idle()
+            slot = status_board.read_slots(self.buf)[0]
+        self.assertEqual((slot['busy'], slot['tester'], slot['cell_started']), (0, "", 0))
+        self.assertEqual((slot['pairs_done'], slot['cells_run'], slot['cells_reused']), (1, 1, 2))
+
+    def test_not_in_pool(self):
+        """ Processes outside the processing pool have no slot """
+        status_board.start_pair("alice", "bob")
+        status_board.finish_pair(1)
+        self.assertEqual(status_board.read_slots(self.buf), [])
+
+    def test_slot_is_shared_modulo_slots(self):
+        """ Process numbers beyond the number of slots wrap around """
+        with self.in_pool_process(status_board.NUM_SLOTS + 1):
+            status_board.start_pair("alice", "bob")
+        self.assertEqual([slot['slot'] for slot in status_board.read_slots(self.buf)], [1])
+
+    def test_counters_are_carried_on(self):
+        """ A process taking over a slot carries on its counters, so that totals never go backwards """
+        # pylint: disable=protected-access
+        with self.in_pool_process(3):
+            status_board.start_pair("alice", "bob")
+            status_board.finish_pair(0)
+            status_board._slot.clear()
+            status_board.start_pair("alice", "carol")
+            status_board.finish_pair(0)
+        status_board.set_submission("alice", 4)
+        self.assertEqual(status_board.read_slots(self.buf)[0]['pairs_done'], 2)
+        self.assertEqual(status_board.read_header(self.buf)['pairs_done_before'], 2)
+
+    def test_read_during_write(self):
+        """ A record read while it is being written is read again once the write has finished """
+        # pylint: disable=protected-access
+        status_board._header['sequence'] += 1
+        self.buf[:8] = status_board._header['sequence'].to_bytes(8, 'little')
+
+        def finish_write(_seconds):
+            status_board.set_submission("alice", 4)
+
+        with mock.patch.object(status_board.time, "sleep", side_effect=finish_write) as sleep:
+            header = status_board.read_header(self.buf)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(header['submitter'], "alice")
+
+
+class TestRender(StatusBoardTestCase):
+    """ top.render """
+
+    def test_render(self):
+        """ The view shows the submission being processed, and what each pool process is doing """
+        status_board.set_submission("alice", 4)
+        with self.in_pool_process(3):
+            status_board.start_pair("alice", "bob")
+            status_board.finish_pair(1)
+        (view, totals) = top.render(self.buf, None)
+        self.assertIn("daemon pid 1234", view)
+        self.assertIn("Processing alice", view)
+        self.assertIn("1/4 pairs tested", view)
+        self.assertRegex(view, r"process_3 +\d+ +busy +alice -> bob")
+        self.assertEqual((totals['pairs'], totals['cells']), (1, 0))
+
+        (view, _) = top.render(self.buf, {**totals, 'time': totals['time'] - 1})
+        self.assertIn("0.0 cells/s", view)
+
+
+if __name__ == '__main__':
+    unittest.main()
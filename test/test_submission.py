@@ -0,0 +1,130 @@
+"""
+Unit tests of the validation of submissions in the frontend stages.
+
+Run from the root of the repository with `python3.8 -m unittest discover -s test -t .`
+"""
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from test.temp_state import TempStateTestCase
+from tournament import submission
+from tournament.util import manifest, paths
+
+
+class TestCopyTourneyEntry(TempStateTestCase):
+    """ Replacing a submission that is identical to the submitters tourney entry with a copy of the entry """
+
+    def setUp(self):
+        super().setUp()
+        # the part of an assignment that fingerprints submissions, as a hash of every file in the submission
+        self.assg = SimpleNamespace(
+            get_fingerprint=lambda submission_dir: str(sorted(manifest.hash_tree(submission_dir, "src").items())))
+        self.tourney_dir = paths.get_tourney_dir("alice")
+        self.pre_val_dir = os.path.join(self.state_dir, "pre_validation")
+        for (root, files) in [(self.tourney_dir, {"src/prog.c": "prog", "bin/prog": "compiled"}),
+                              (self.pre_val_dir, {"src/prog.c": "prog"})]:
+            for (file_name, contents) in files.items():
+                os.makedirs(os.path.dirname(f"{root}/{file_name}"), exist_ok=True)
+                with open(f"{root}/{file_name}", 'w') as file:
+                    file.write(contents)
+        # the tourney entry was made long ago
+        os.utime(self.tourney_dir, (time.time() - 3600, time.time() - 3600))
+
+    def _copy(self, fingerprint: str) -> bool:
+        """ Copy the tourney entry over the submission, if it has the given fingerprint """
+        # pylint: disable=protected-access
+        return submission._copy_tourney_entry(self.assg, self.tourney_dir, self.pre_val_dir, fingerprint)
+
+    def test_entry_is_copied(self):
+        """ The submission gains the compiled files of the entry, and is as new as when it was submitted """
+        self.assertTrue(self._copy(self.assg.get_fingerprint(self.tourney_dir)))
+        with open(f"{self.pre_val_dir}/bin/prog", 'r') as file:
+            self.assertEqual(file.read(), "compiled")
+        self.assertGreater(os.stat(self.pre_val_dir).st_mtime, time.time() - 60)
+        self.assertFalse(os.path.exists(f"{self.pre_val_dir}.entry"))
+
+    def test_replaced_entry_is_not_copied(self):
+        """ An entry replaced before it is copied leaves the submission to be validated """
+        self.assertFalse(self._copy("the fingerprint of the entry before it was replaced"))
+        self.assertFalse(os.path.exists(f"{self.pre_val_dir}/bin"))
+        self.assertFalse(os.path.exists(f"{self.pre_val_dir}.entry"))
+
+
+class TestRunInParallel(TempStateTestCase):
+    """ submission._run_in_parallel """
+
+    def setUp(self):
+        super().setUp()
+        self.started = []
+        self.running = [0, 0]  # how many calls are running, and the most that have run at once
+        self.lock = threading.Lock()
+
+    def _run(self, func, items: list, parallel: bool = True) -> list:
+        """ Validate items of an assignment that does or doesn't support parallel test runs """
+        def tracked(item):
+            with self.lock:
+                self.started.append(item)
+                self.running[0] += 1
+                self.running[1] = max(self.running)
+            try:
+                return func(item)
+            finally:
+                with self.lock:
+                    self.running[0] -= 1
+
+        assg = SimpleNamespace(supports_parallel_test_runs=lambda: parallel)
+        with mock.patch.object(submission, "AssignmentConfig") as assignment_config:
+            assignment_config.return_value.get_assignment.return_value = assg
+            # pylint: disable=protected-access
+            return submission._run_in_parallel(tracked, items, failed=lambda result: result == "fail")
+
+    def test_results_in_item_order(self):
+        """ Results are in the order of the items, not the order they finished in """
+        self.write_processing_config({'validation_workers': 4})
+        results = self._run(lambda delay: time.sleep(delay) or delay, [0.3, 0.2, 0.1, 0])
+        self.assertEqual(results, [0.3, 0.2, 0.1, 0])
+
+    def test_items_run_at_once(self):
+        """ Up to validation_workers items are run at once """
+        self.write_processing_config({'validation_workers': 3})
+        barrier = threading.Barrier(3, timeout=10)
+        self.assertEqual(self._run(lambda item: barrier.wait() >= 0, range(6)), [True] * 6)
+        self.assertEqual(self.running[1], 3)
+
+    def test_assignment_without_parallel_test_runs(self):
+        """ Items of an assignment that can't run tests in parallel are run one at a time """
+        self.write_processing_config({'validation_workers': 4})
+        self._run(lambda item: time.sleep(0.05), range(4), parallel=False)
+        self.assertEqual(self.running[1], 1)
+
+    def test_failures_dont_stop_validation(self):
+        """ Without fail fast every item is run, whatever the result of the others """
+        self.write_processing_config({'validation_workers': 1})
+        self.assertEqual(self._run(lambda item: item, ["fail", "ok", "fail"]), ["fail", "ok", "fail"])
+
+    def test_fail_fast(self):
+        """ With fail fast, items not yet started at the first failure are skipped """
+        self.write_processing_config({'validation_workers': 1, 'validation_fail_fast': True})
+        self.assertEqual(self._run(lambda item: item, ["ok", "fail", "ok", "ok"]), ["ok", "fail", None, None])
+        self.assertEqual(self.started, ["ok", "fail"])
+
+    def test_fail_fast_keeps_running_items(self):
+        """ Items already running at the first failure finish, and keep their results """
+        self.write_processing_config({'validation_workers': 2, 'validation_fail_fast': True})
+        results = self._run(lambda item: time.sleep(0.3) or item if item == "slow" else item,
+                            ["slow", "fail", "ok", "ok"])
+        self.assertEqual(results[:2], ["slow", "fail"])
+        self.assertEqual(results.count(None), 4 - len(self.started))
+
+    def test_no_items(self):
+        """ Nothing is run for no items """
+        self.assertEqual(self._run(lambda item: item, []), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
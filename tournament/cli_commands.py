@@ -69,6 +69,11 @@ def _create_backend_parser():
     shutdown_parser.add_argument('--message', default="", help='The message to display while tournament is shutdown')
     shutdown_parser.set_defaults(func=lambda args: tourney.shutdown(args.message))
 
+    top_parser = subparsers.add_parser('top', description='Show a live view of the tournament processing submissions.')
+    top_parser.add_argument('--interval', type=float, default=2, help='How often to refresh the view, in seconds')
+    top_parser.add_argument('--once', action='store_true', help='Show the view once rather than refreshing it')
+    top_parser.set_defaults(func=lambda args: tourney.top(args.interval, args.once))
+
     subparsers.add_parser('get_diffs', description='Generate diffs of submitters mutants to verify mutants are valid.')\
         .set_defaults(func=lambda args: tourney.get_diffs())
 
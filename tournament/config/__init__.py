@@ -4,7 +4,7 @@ Configuration file validation performed on tournament startup
 
 from tournament.util import Result, Ansi
 from .exceptions import NoConfigDefined
-from .files import ApprovedSubmitters, AssignmentConfig, EmailConfig, ServerConfig
+from .files import ApprovedSubmitters, AssignmentConfig, EmailConfig, ProcessingConfig, ServerConfig
 
 
 def configuration_valid() -> Result:
@@ -22,6 +22,8 @@ def configuration_valid() -> Result:
             result += ApprovedSubmitters().check_valid()
         if result:
             result += ServerConfig().check_server_config()
+        if result:
+            result += ProcessingConfig().check_processing_config()
         # if result:
         #    result += EmailConfig().check_email_valid()
 
@@ -3,11 +3,16 @@ The tournament can be configured for multiple different assignment types.
 AbstractAssignment provides an interface that new assignment configurations must implement in order to be
 used in the tournament. New assignment configurations should inherit from this class
 """
+import hashlib
+import json
 import os
+import shutil
 from abc import ABCMeta, abstractmethod
 from typing import Dict
 
+from tournament.config.files.processing_config import ProcessingConfig
 from tournament.util import FilePath, Prog, Result, Submitter, Test, TestResult
+from tournament.util import manifest, paths, quota
 
 
 class AbstractAssignment(metaclass=ABCMeta):
@@ -46,6 +51,91 @@ class AbstractAssignment(metaclass=ABCMeta):
         """
         raise NotImplementedError("Error: get_programs_under_test is not implemented")
 
+    @abstractmethod
+    def get_test_dirs(self, test: Test) -> [str]:
+        """
+        Get the directories containing the source code of a test
+        :param test: the test
+        :return: the directories, relative to the root of a submission
+        """
+        raise NotImplementedError("Error: get_test_dirs is not implemented")
+
+    @abstractmethod
+    def get_prog_dirs(self, prog: Prog) -> [str]:
+        """
+        Get the directories containing the source code of a program under test
+        :param prog: the program under test
+        :return: the directories, relative to the root of a submission
+        """
+        raise NotImplementedError("Error: get_prog_dirs is not implemented")
+
+    def create_manifest(self, submission_dir: FilePath) -> Dict:
+        """
+        Hash the source code of every test and program under test in a submission
+        :param submission_dir: the submission to hash
+        :return: {'tests': {test: {file: hash}}, 'progs': {prog: {file: hash}}}
+        """
+        def hash_dirs(dirs: [str]) -> Dict[str, str]:
+            hashes = {}
+            for rel_dir in dirs:
+                hashes.update(manifest.hash_tree(submission_dir, rel_dir))
+            return hashes
+
+        return {'tests': {test: hash_dirs(self.get_test_dirs(test)) for test in self.get_test_list()},
+                'progs': {prog: hash_dirs(self.get_prog_dirs(prog)) for prog in self.get_programs_list()}}
+
+    def write_manifest(self, submission_dir: FilePath):
+        """ Create the manifest of a submission and store it in the submission as paths.MANIFEST_FILE """
+        json.dump(self.create_manifest(submission_dir), open(f"{submission_dir}/{paths.MANIFEST_FILE}", 'w'),
+                  indent=4, sort_keys=True)
+
+    def load_manifest(self, submission_dir: FilePath) -> Dict:
+        """
+        Load the manifest stored in a submission. Submissions made before manifests were introduced are hashed instead
+        """
+        manifest_file = f"{submission_dir}/{paths.MANIFEST_FILE}"
+        if os.path.isfile(manifest_file):
+            return json.load(open(manifest_file, 'r'))
+        return self.create_manifest(submission_dir)
+
+    def get_fingerprint(self, submission_dir: FilePath) -> str:
+        """
+        A single hash of all the tests and programs under test in a submission.
+        Two submissions with the same fingerprint will perform identically in the tournament
+        """
+        return hashlib.sha256(json.dumps(self.load_manifest(submission_dir), sort_keys=True).encode()).hexdigest()
+
+    def get_prog_fingerprint(self, prog: Prog, submission_dir: FilePath) -> str:
+        """
+        A hash of a programs source code that ignores whitespace in the same way as `diff -w`.
+        Programs that progs_identical considers identical will have the same fingerprint
+        :param prog: the program under test
+        :param submission_dir: the submission containing the program
+        """
+        hashes = []
+        for prog_dir in self.get_prog_dirs(prog):
+            # paths are taken relative to each program's own directory so that different programs can be compared
+            dir_hashes = manifest.hash_tree(FilePath(f"{submission_dir}/{prog_dir}"), "", ignore_whitespace=True)
+            hashes.append(sorted(dir_hashes.items()))
+        return hashlib.sha256(json.dumps(hashes).encode()).hexdigest()
+
+    def changed_since(self, new_submission: FilePath, old_submission: FilePath, kind: str) -> [str]:
+        """
+        Compare the manifests of two submissions and identify which tests or programs have changed
+        :param new_submission: the directory of the new submission
+        :param old_submission: the directory of the old submission
+        :param kind: 'tests' or 'progs'
+        :return: the tests or programs whose source code differs between the two submissions
+        """
+        items = self.get_test_list() if kind == 'tests' else self.get_programs_list()
+        if not os.path.isdir(old_submission):
+            # if there is no previous submission then everything is new
+            return items
+
+        new_manifest = self.load_manifest(new_submission)[kind]
+        old_manifest = self.load_manifest(old_submission)[kind]
+        return [item for item in items if item not in old_manifest or new_manifest.get(item) != old_manifest[item]]
+
     @abstractmethod
     def progs_identical(self, prog1: Prog, prog2: Prog, submission_dir: FilePath) -> bool:
         """
@@ -57,7 +147,8 @@ class AbstractAssignment(metaclass=ABCMeta):
         """
 
     @abstractmethod
-    def run_test(self, test: Test, prog: Prog, submission_dir: FilePath, use_poc: bool = False) -> (TestResult, str):
+    def run_test(self, test: Test, prog: Prog, submission_dir: FilePath, use_poc: bool = False,
+                 fail_fast: bool = False) -> (TestResult, str):
         """
         Run a test against a program under test.
         :param test: the test suite
@@ -65,10 +156,27 @@ class AbstractAssignment(metaclass=ABCMeta):
         :param submission_dir: the directory of the submission
         :param use_poc: some assignments will use tests with an element of randomness to them - e.g. fuzzers -
         when validating that a program has a valid bug a proof of concept (poc) may be used instead
+        :param fail_fast: the run may stop as soon as a bug is detected. Traces from such a run can't be used to
+        count the tests in the test suite
         :return: The result of the test run
         """
         raise NotImplementedError("Error: run_test is not implemented")
 
+    def exited_early(self, traces: str) -> bool:
+        """
+        Determine whether a fail_fast test run stopped before running the whole test suite
+        :param traces: the traces from running a test suite
+        :return: whether the run stopped early
+        """
+        return False
+
+    def supports_parallel_test_runs(self) -> bool:
+        """
+        Whether run_test can be called concurrently on the same submission directory
+        :return: True unless running a test writes to shared files in the submission directory
+        """
+        return True
+
     @abstractmethod
     def get_num_tests(self, traces: str) -> int:
         """
@@ -89,6 +197,43 @@ class AbstractAssignment(metaclass=ABCMeta):
         """
         raise NotImplementedError("Error: prep_submission is not implemented")
 
+    def copy_into(self, submission_dir: FilePath, destination_dir: FilePath, rel_dirs: [str]) -> Result:
+        """
+        Replace directories in destination_dir with the submitters copies from submission_dir.
+        Files are accounted for as they are copied and copying stops as soon as the submission quota is exceeded.
+        :param submission_dir: The directory of the submission
+        :param destination_dir: The directory to copy into
+        :param rel_dirs: The directories to copy, relative to the roots of the submission and destination
+        :return: whether all directories were copied
+        """
+        for rel_dir in rel_dirs:
+            shutil.rmtree(f"{destination_dir}/{rel_dir}", ignore_errors=True)
+
+        report = quota.SizeReport(ProcessingConfig().submission_quota_bytes())
+        # the directory being copied, for errors
+        copying = self.get_assignment_name()
+        try:
+            report.walk(destination_dir)
+            for rel_dir in rel_dirs:
+                copying = f"{self.get_assignment_name()}/{rel_dir}"
+                report.copytree(FilePath(f"{submission_dir}/{rel_dir}"), FilePath(f"{destination_dir}/{rel_dir}"),
+                                rel_dir)
+        except quota.QuotaExceeded:
+            return Result(False, f"The submission is larger than {quota.format_size(report.limit)}.\n"
+                                 f"Server space is limited so please keep your submissions to a reasonable size\n"
+                                 f"Further details:\n{report.describe()}")
+        except shutil.Error as copy_error:
+            # copytree carries on past files it can't copy, and then reports all of them
+            failures = copy_error.args[0] if copy_error.args else None
+            if not isinstance(failures, list):
+                return Result(False, f"{copying}: {copy_error}")
+            return Result(False, "\n".join(f"{self.get_assignment_name()}/{os.path.relpath(src, submission_dir)}: "
+                                           f"{str(reason).replace(f': {src!r}', '')}" for (src, _, reason) in failures))
+        except OSError as os_error:
+            return Result(False, f"{copying}: {os_error.strerror or os_error}")
+
+        return Result(True, "Copy successful")
+
     @abstractmethod
     def compile_prog(self, submission_dir: FilePath, prog: Prog) -> Result:
         """
@@ -99,6 +244,18 @@ class AbstractAssignment(metaclass=ABCMeta):
         """
         raise NotImplementedError("Error: compile_prog is not implemented")
 
+    def compile_progs(self, submission_dir: FilePath, progs: [Prog],
+                      prev_submission_dir: FilePath) -> Dict[Prog, Result]:
+        """
+        Compile several programs under test. By default each program is compiled in turn with compile_prog.
+        Assignments can override this to build programs in parallel, or to reuse builds from a previous submission
+        :param submission_dir: The directory in which to compile the programs under test
+        :param progs: The programs under test to compile
+        :param prev_submission_dir: The submitters previous submission, which may not exist
+        :return: whether compilation was successful for each program
+        """
+        return {prog: self.compile_prog(submission_dir, prog) for prog in progs}
+
     @abstractmethod
     def compile_test(self, submission_dir: FilePath, test: Test) -> Result:
         """
@@ -109,6 +266,24 @@ class AbstractAssignment(metaclass=ABCMeta):
         """
         raise NotImplementedError("Error: compile_test is not implemented")
 
+    def generates_tests_in_background(self) -> bool:
+        """
+        Whether compile_test only generates a seed set of tests for validation, with the full set of tests generated
+        later on the tournament server by generate_tests. Submissions are not tested in the tournament until
+        generate_tests has finished
+        """
+        return False
+
+    def generate_tests(self, submission_dir: FilePath) -> Result:
+        """
+        Generate the full set of tests for a submission that has been queued for the tournament.
+        If generation fails the submission must be left with the tests generated by compile_test.
+        A newer submission from the same submitter can remove the queued submission at any time
+        :param submission_dir: the queued submission
+        :return: whether generation was successful
+        """
+        return Result(True, "")
+
     @abstractmethod
     def detect_new_tests(self, new_submission: FilePath, old_submission: FilePath) -> [Test]:
         """
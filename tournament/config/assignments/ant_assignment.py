@@ -16,16 +16,89 @@ assignment_name/
 
 An example can be found at 'ant_assignment' in the same repo as this code
 
+Submissions are compiled once, and head to head tests are run with JUnit directly rather than through ant. The JUnit
+test classes and jars are found the same way the assignment's build.xml finds them: from the includes of its
+<batchtest> filesets or the names of its <test> elements, and from the jars of its <path> and <classpath> elements.
+If build.xml doesn't name the jars, or they can't be found in the source assignment, submissions are built and tested
+by ant instead.
 """
+import glob
 import math
 import os
 import re
+import shutil
 import subprocess
-from typing import Dict
+from typing import Dict, List, Tuple
+from xml.etree import ElementTree
 
 from tournament.config.assignments import AbstractAssignment
+from tournament.config.files.processing_config import ProcessingConfig
 from tournament.util import FilePath, Prog, Result, Submitter, Test, TestResult
-from tournament.util import paths, print_tourney_error
+from tournament.util import capture, paths, print_tourney_error, relink, scratch
+
+# Runs JUnit tests and stops at the first failure. Used for runs that only need to know whether a bug was detected
+FAIL_FAST_RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "FailFastRunner.java")
+
+# Printed by the ant build script when a test suite times out
+ANT_TIMEOUT_MARKER = "Parallel execution timed out"
+
+# Printed by FailFastRunner when it stops a test suite before all tests have been run
+FAIL_FAST_MARKER = "FailFastRunner: stopped at first failure"
+
+# Used when build.xml doesn't say which classes are tests, or where the JUnit jars are
+DEFAULT_TEST_PATTERNS = ["**/*Test.class", "**/*Tests.class"]
+DEFAULT_JUNIT_CLASSPATH = ["lib/*"]
+
+
+def _read_build_file(build_file: FilePath) -> Tuple[List[str], List[str]]:
+    """
+    Find the JUnit test classes and jars used by an ant build script
+    :param build_file: the build.xml of the assignment
+    :return: glob patterns of the test class files, relative to a test's classes, and the classpath entries of the
+    jars, relative to the submission. Either is empty if the build script doesn't specify them
+    """
+    try:
+        root = ElementTree.parse(build_file).getroot()
+    except (OSError, ElementTree.ParseError):
+        return [], []
+
+    # as in ant, the first definition of a property wins
+    properties = {}
+    for prop in root.iter('property'):
+        value = prop.get('value', prop.get('location'))
+        if prop.get('name') and value is not None:
+            properties.setdefault(prop.get('name'), value)
+
+    def expand(value: str) -> str:
+        for _ in range(10):
+            value = re.sub(r"\$\{([^}]+)\}", lambda match: properties.get(match.group(1), match.group(0)), value)
+        return value
+
+    patterns = []
+    for batchtest in root.iter('batchtest'):
+        for fileset in batchtest.iter('fileset'):
+            for include in re.split(r"[,\s]+", expand(fileset.get('includes', ""))):
+                if include and "${" not in include:
+                    patterns.append(re.sub(r"\.java$", ".class", include))
+    for test in root.iter('test'):
+        # single tests are usually named after a property given on the command line, e.g. ${test}Tests
+        name = re.sub(r"\$\{[^}]+\}", "*", expand(test.get('name', "")))
+        if name:
+            patterns.append(name.replace(".", "/") + ".class")
+
+    classpath = []
+    for path in list(root.iter('path')) + list(root.iter('classpath')):
+        for element in path:
+            if element.tag == 'pathelement':
+                for entry in re.split(r"[:;]", expand(element.get('location', element.get('path', "")))):
+                    if entry.endswith(".jar") and "${" not in entry:
+                        classpath.append(entry)
+            elif element.tag == 'fileset' and ".jar" in element.get('includes', "*.jar"):
+                jar_dir = expand(element.get('dir', ""))
+                if jar_dir and "${" not in jar_dir:
+                    classpath.append(f"{jar_dir}/*")
+
+    return list(dict.fromkeys(patterns)), list(dict.fromkeys(classpath))
 
 
 class AntAssignment(AbstractAssignment):
@@ -36,6 +109,14 @@ class AntAssignment(AbstractAssignment):
         self.tests_list = sorted(os.listdir(self.get_source_assg_dir() + "/tests"))
         self.progs_list = sorted(
             [prog for prog in os.listdir(self.get_source_assg_dir() + "/programs") if prog != 'original'])
+        self.fail_fast_runner_unavailable = False
+
+        (build_patterns, build_classpath) = _read_build_file(FilePath(f"{self.get_source_assg_dir()}/build.xml"))
+        self.test_patterns = build_patterns or DEFAULT_TEST_PATTERNS
+        self.junit_classpath = ProcessingConfig().junit_classpath() or build_classpath or DEFAULT_JUNIT_CLASSPATH
+        # without the JUnit jars tests can't be compiled or run directly, so ant builds and tests submissions instead
+        self.precompiled = any(glob.glob(os.path.join(self.get_source_assg_dir(), entry))
+                               for entry in self.junit_classpath)
 
     def get_test_list(self) -> [Test]:
         return self.tests_list
@@ -43,95 +124,172 @@ class AntAssignment(AbstractAssignment):
     def get_programs_list(self) -> [Prog]:
         return self.progs_list
 
+    def get_test_dirs(self, test: Test) -> [str]:
+        return [f"tests/{test}"]
+
+    def get_prog_dirs(self, prog: Prog) -> [str]:
+        return [f"programs/{prog}"]
+
+    def supports_parallel_test_runs(self) -> bool:
+        # tests are run from their precompiled classes, otherwise each `ant test` run compiles into the shared
+        # classes/ and .depcache/ folders of the submission
+        return self.precompiled
+
     def progs_identical(self, prog1: Prog, prog2: Prog, submission_dir: FilePath) -> bool:
         diff = subprocess.run(f"diff -rw {prog1} {prog2}", cwd=submission_dir + "/programs",
                               shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
         return diff.returncode == 0
 
-    def run_test(self, test: Test, prog: Prog, submission_dir: FilePath, use_poc: bool = False) -> (TestResult, str):
+    def run_test(self, test: Test, prog: Prog, submission_dir: FilePath, use_poc: bool = False,
+                 fail_fast: bool = False) -> (TestResult, str):
+
+        test_classes = f"{submission_dir}/classes/tests/{test}"
+        prog_classes = f"{submission_dir}/classes/programs/{prog}"
+        test_class_names = self._get_test_class_names(test_classes)
+        if not test_class_names or not os.path.isdir(prog_classes):
+            # submissions without precompiled classes are built and tested by the ant build script
+            return self._run_ant_test(test, prog, submission_dir)
+
+        # the tests and program are already compiled, so only their classpath needs to be composed
+        classpath = [test_classes, prog_classes] + self._junit_classpath(submission_dir)
+        runner = "org.junit.runner.JUnitCore"
+        if fail_fast and self._get_fail_fast_runner(submission_dir):
+            classpath.append(paths.JAVA_CLASSES_DIR)
+            runner = "FailFastRunner"
+
+        result = capture.run_captured(["java", "-cp", os.pathsep.join(classpath), runner] + test_class_names,
+                                      submission_dir, timeout=30)
+        if result.timed_out:
+            return TestResult.TIMEOUT, "Took longer than 30 seconds to run"
+
+        if result.return_code == 0:
+            return TestResult.NO_BUGS_DETECTED, result.stdout
+        else:
+            return TestResult.BUG_FOUND, result.stdout
 
-        result = subprocess.run(
-            f"ant test -Dtest=\"{test}\" -Dprogram=\"{prog}\"",
-            shell=True, cwd=submission_dir,
-            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=False
-        )
+    def exited_early(self, traces: str) -> bool:
+        return FAIL_FAST_MARKER in traces
+
+    def _get_fail_fast_runner(self, submission_dir: FilePath) -> bool:
+        """
+        Make sure the FailFastRunner class is compiled into paths.JAVA_CLASSES_DIR. It is compiled by the first run
+        that needs it, against the JUnit jars of that submission
+        :return: whether the FailFastRunner is available
+        """
+        if os.path.isfile(f"{paths.JAVA_CLASSES_DIR}/FailFastRunner.class"):
+            return True
+        if self.fail_fast_runner_unavailable:
+            return False
+
+        # compile into a temporary directory and rename it, so concurrent runs never see a partial build
+        tmp_classes_dir = f"{paths.JAVA_CLASSES_DIR}.tmp.{os.getpid()}"
+        shutil.rmtree(tmp_classes_dir, ignore_errors=True)
+        os.makedirs(tmp_classes_dir)
+        compil = subprocess.run(["javac", "-nowarn", "-d", tmp_classes_dir,
+                                 "-cp", os.pathsep.join(self._junit_classpath(submission_dir)), FAIL_FAST_RUNNER],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=False)
+        if compil.returncode != 0:
+            print_tourney_error(f"Unable to compile {FAIL_FAST_RUNNER}, running full test suites:\n{compil.stdout}")
+            self.fail_fast_runner_unavailable = True
+        else:
+            try:
+                os.rename(tmp_classes_dir, paths.JAVA_CLASSES_DIR)
+            except OSError:
+                pass  # another process compiled the runner first
+        shutil.rmtree(tmp_classes_dir, ignore_errors=True)
+
+        return os.path.isfile(f"{paths.JAVA_CLASSES_DIR}/FailFastRunner.class")
+
+    @staticmethod
+    def _run_ant_test(test: Test, prog: Prog, submission_dir: FilePath) -> (TestResult, str):
+        """ Compile and run a test against a program using the ant build script """
+        result = capture.run_captured(f"ant test -Dtest=\"{test}\" -Dprogram=\"{prog}\"", submission_dir, shell=True,
+                                      output=capture.BoundedOutput(markers=[ANT_TIMEOUT_MARKER]))
 
-        if "Parallel execution timed out" in result.stdout:
+        if result.output.found_marker(ANT_TIMEOUT_MARKER):
             return TestResult.TIMEOUT, result.stdout
-        elif result.returncode == 0:
+        elif result.return_code == 0:
             return TestResult.NO_BUGS_DETECTED, result.stdout
         else:
             return TestResult.BUG_FOUND, result.stdout
 
+    def _get_test_class_names(self, test_classes: FilePath) -> [str]:
+        """ The fully qualified names of the JUnit test classes (e.g. swen90006.machine.BoundaryTests) in a test """
+        class_files = {class_file for pattern in self.test_patterns
+                       for class_file in glob.glob(f"{test_classes}/{pattern}", recursive=True)
+                       # inner classes are run by the class that contains them
+                       if "$" not in os.path.basename(class_file)}
+        return sorted(os.path.relpath(class_file, test_classes)[:-len(".class")].replace(os.sep, ".")
+                      for class_file in class_files)
+
+    def _junit_classpath(self, submission_dir: FilePath) -> [str]:
+        """ The JUnit classpath entries, with relative entries resolved within the submission """
+        return [os.path.join(submission_dir, entry) for entry in self.junit_classpath]
+
+    def _javac(self, submission_dir: FilePath, source_dir: str, classes_dir: str, classpath: [str]) -> Result:
+        """
+        Compile all java files in a directory of a submission.
+        The output directory is replaced, so classes from a previous compilation are never mixed in
+        :param submission_dir: the submission to compile
+        :param source_dir: the directory of source code, relative to the submission
+        :param classes_dir: the directory to compile into, relative to the submission
+        :param classpath: any classes the source code depends on
+        :return: whether compilation was successful, with the compiler output on failure
+        """
+        sources = sorted(glob.glob(f"{submission_dir}/{source_dir}/**/*.java", recursive=True))
+        if not sources:
+            return Result(False, f"No java files found in {source_dir}")
+
+        shutil.rmtree(f"{submission_dir}/{classes_dir}", ignore_errors=True)
+        os.makedirs(f"{submission_dir}/{classes_dir}")
+
+        compil = subprocess.run(["javac", "-nowarn", "-d", classes_dir,
+                                 "-cp", os.pathsep.join(classpath + self._junit_classpath(submission_dir))] + sources,
+                                cwd=submission_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True, check=False)
+        if compil.returncode != 0:
+            return Result(False, compil.stdout)
+        return Result(True, "")
+
     def get_num_tests(self, traces: str) -> int:
-        num_tests_regex = re.search("Tests run: ([0-9]+)", traces)
+        # ant reports 'Tests run: N', JUnitCore reports 'OK (N tests)' on success and 'Tests run: N' on failure
+        num_tests_pattern = r"Tests run: ([0-9]+)|OK \(([0-9]+) tests?\)"
+        num_tests_regex = re.search(num_tests_pattern, traces)
         if num_tests_regex is not None:
-            return int(num_tests_regex.group(1))
+            return int(num_tests_regex.group(1) or num_tests_regex.group(2))
         else:
             # Assumed default test count of 20
-            print_tourney_error(f"Cannot find regex 'Tests run: ([0-9]+)' in traces:\n{traces}")
+            print_tourney_error(f"Cannot find regex '{num_tests_pattern}' in traces:\n{traces}")
             return 20
 
     def prep_submission(self, submission_dir: FilePath, destination_dir: FilePath) -> Result:
-
-        # copy across the tests
-        subprocess.run(f"rm -rf {destination_dir}/tests", shell=True, check=True)
-        res = subprocess.run(f"cp -rf {submission_dir}/tests {destination_dir}",
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, check=False, text=True)
-        if res.returncode != 0:
-            return Result(False, res.stderr[res.stderr.find(self.get_assignment_name()): ])
-
-        # copy across the programs, excluding 'original'
-        for program in self.get_programs_list():
-            subprocess.run(f"rm -rf {destination_dir}/programs/{program}", shell=True, check=True)
-            res = subprocess.run(
-                f"cp -rf {submission_dir}/programs/{program} {destination_dir}/programs",
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, check=False, text=True)
-            if res.returncode != 0:
-                return Result(False, res.stderr[res.stderr.find(self.get_assignment_name()): ])
+        # copy across the tests and the programs, excluding 'original'
+        copy_result = self.copy_into(submission_dir, destination_dir,
+                                     ["tests"] + [f"programs/{program}" for program in self.get_programs_list()])
+        if not copy_result:
+            return copy_result
 
         return Result(True, "Preparation successful")
 
     def compile_prog(self, submission_dir: FilePath, prog: Prog) -> Result:
-        # program compilation is handled by the ant build script
-        return Result(True, "")
+        if not self.precompiled:
+            # program compilation is handled by the ant build script
+            return Result(True, "")
+        # programs are compiled once here, so head to head testing only needs to run them
+        return self._javac(submission_dir, f"programs/{prog}", f"classes/programs/{prog}", [])
 
     def compile_test(self, submission_dir: FilePath, test: Test) -> Result:
-        # program compilation is handled by the ant build script
-        return Result(True, "")
+        if not self.precompiled:
+            # test compilation is handled by the ant build script
+            return Result(True, "")
+        # tests are compiled against the original program. Mutants share its API, so one build runs against all of them
+        return self._javac(submission_dir, f"tests/{test}", f"classes/tests/{test}", ["classes/programs/original"])
 
     def detect_new_tests(self, new_submission: FilePath, old_submission: FilePath) -> [Test]:
-
-        if not os.path.isdir(old_submission):
-            # if there is no previous submission then all tests are new
-            return self.get_test_list()
-
-        new_tests = []
-        tests_path = "/tests/"
-        for test in self.get_test_list():
-            diff = subprocess.run(
-                f"diff -r {new_submission + tests_path + test} {old_submission + tests_path + test}",
-                stdout=subprocess.PIPE, shell=True, check=False)
-            if diff.returncode != 0:
-                new_tests.append(test)
-
-        return new_tests
+        return self.changed_since(new_submission, old_submission, 'tests')
 
     def detect_new_progs(self, new_submission: FilePath, old_submission: FilePath) -> [Prog]:
-        if not os.path.isdir(old_submission):
-            # if there is no previous submission then all tests are new
-            return self.get_programs_list()
-
-        new_progs = []
-        programs_path = "/programs/"
-        for prog in self.get_programs_list():
-            diff = subprocess.run(
-                f"diff -r {new_submission + programs_path + prog} {old_submission + programs_path + prog}",
-                stdout=subprocess.PIPE, shell=True, check=False)
-            if diff.returncode != 0:
-                new_progs.append(prog)
-
-        return new_progs
+        return self.changed_since(new_submission, old_submission, 'progs')
 
     def prep_test_stage(self, tester: Submitter, testee: Submitter, test_stage_dir: FilePath):
 
@@ -140,29 +298,22 @@ class AntAssignment(AbstractAssignment):
         testee_code_dir = paths.get_tourney_dir(testee)
 
         # make sure folders that are required are present
-        if not os.path.isdir(test_stage_code_dir + "/.depcache"):
-            subprocess.run(f"mkdir {test_stage_code_dir}/.depcache", shell=True, check=True)
-
-        if not os.path.isdir(test_stage_code_dir + "/classes"):
-            subprocess.run(f"mkdir {test_stage_code_dir}/classes", shell=True, check=True)
-
-        # clean test_stage_dir of previous tests
-        tester_files = ["/.depcache/tests", "/tests", "/classes/tests"]
-        testee_files = ["/.depcache/programs", "/programs", "/classes/programs"]
-
-        # remove previous files
-        for file in tester_files + testee_files:
-            subprocess.run(f"rm -rf {test_stage_code_dir + file}", shell=True, check=True)
-
-        # link in files from tester
-        for file in tester_files:
-            subprocess.run(f"ln -s {tester_code_dir + file} {test_stage_code_dir + file}",
-                           shell=True, check=True)
-
-        # link in files from testee
-        for file in testee_files:
-            subprocess.run(f"ln -s {testee_code_dir + file} {test_stage_code_dir + file}",
-                           shell=True, check=True)
+        os.makedirs(test_stage_code_dir + "/.depcache", exist_ok=True)
+        os.makedirs(test_stage_code_dir + "/classes", exist_ok=True)
+
+        # source code is linked from the tourney entries, build artefacts from their copies in scratch space.
+        # Tests are run directly from the precompiled classes, the sources and .depcache are only used by ant when
+        # an entry has no precompiled classes
+        tester_links = {"/tests": f"{tester_code_dir}/tests",
+                        "/.depcache/tests": scratch.get_artefact_dir(tester, ".depcache/tests"),
+                        "/classes/tests": scratch.get_artefact_dir(tester, "classes/tests")}
+        testee_links = {"/programs": f"{testee_code_dir}/programs",
+                        "/.depcache/programs": scratch.get_artefact_dir(testee, ".depcache/programs"),
+                        "/classes/programs": scratch.get_artefact_dir(testee, "classes/programs")}
+
+        # The stage is persistent, so only the links that differ from the previous pair need to be swapped
+        for (file, target) in {**tester_links, **testee_links}.items():
+            relink(target, test_stage_code_dir + file)
 
     def compute_normalised_prog_score(self, submitter_score: float, best_score: float) -> float:
         if best_score == 0:
@@ -0,0 +1,152 @@
+"""
+Reduces a fuzzer generated corpus to the inputs that exercise distinct behaviour in the original program.
+
+Fuzzers often generate thousands of near identical inputs, and every input is replayed in every head to head cell the
+corpus is tested in. Byte identical inputs are removed first. The remaining inputs are then run against a coverage
+instrumented build of the original program (see resources/coverage_hook.c), and for every block of code executed only
+the smallest input that reaches it is kept, in the style of afl-cmin. Finally the corpus is capped by number of inputs
+and total size.
+
+If the coverage build can't be made the corpus is only deduplicated and capped.
+"""
+import hashlib
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from typing import Dict, Optional, Set
+
+from tournament.config.assignments import corpus_runner
+from tournament.util import FilePath, Result, manifest, paths, print_tourney_error
+
+COVERAGE_HOOK_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "coverage_hook.c")
+
+
+def get_coverage_binary(source_assg_dir: FilePath) -> FilePath:
+    """
+    Build a coverage instrumented copy of the original program the first time it is needed.
+    Builds are keyed on the source code of the original program, so a changed assignment is rebuilt
+    :param source_assg_dir: the source assignment containing src/original and src/include
+    :return: the path of the coverage binary, or an empty path if it can't be built
+    """
+    build_key = hashlib.sha256(str(sorted({**manifest.hash_tree(source_assg_dir, "src/original"),
+                                           **manifest.hash_tree(source_assg_dir, "src/include"),
+                                           'hook': manifest.hash_file(FilePath(COVERAGE_HOOK_SOURCE))}.items()))
+                               .encode()).hexdigest()[:16]
+    coverage_binary = FilePath(f"{paths.TOOLS_DIR}/coverage_original_{build_key}")
+    if os.path.isfile(coverage_binary):
+        return coverage_binary
+
+    os.makedirs(paths.TOOLS_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory() as build_dir:
+        hook_object = f"{build_dir}/coverage_hook.o"
+        tmp_binary = f"{build_dir}/coverage_original"
+        sources = sorted(glob(f"{source_assg_dir}/src/original/**/*.c", recursive=True))
+
+        for command in [["cc", "-c", "-O2", "-o", hook_object, COVERAGE_HOOK_SOURCE],
+                        ["cc", "-O0", "-g", "-fsanitize-coverage=trace-pc", "-DDEBUG_NO_PRINTF",
+                         f"-I{source_assg_dir}/src/include", f"-I{source_assg_dir}/src/original",
+                         "-o", tmp_binary] + sources + [hook_object, "-lm"]]:
+            compil = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                                    check=False)
+            if compil.returncode != 0:
+                print_tourney_error(f"Unable to build a coverage binary, corpora will not be minimised by coverage:\n"
+                                    f"{compil.stdout}")
+                return FilePath("")
+
+        os.replace(tmp_binary, coverage_binary)
+
+    return coverage_binary
+
+
+def _get_coverage(coverage_binary: FilePath, input_file: FilePath, cpu_seconds: int) -> Optional[Set[int]]:
+    """ The blocks of code executed by an input, or None if the input's coverage couldn't be measured """
+    with tempfile.NamedTemporaryFile() as coverage_file:
+        executor = corpus_runner.ExecExecutor([coverage_binary, "{input}"], FilePath(os.path.dirname(input_file)),
+                                              cpu_seconds, env={**os.environ, 'COVERAGE_OUTPUT': coverage_file.name})
+        outcome = executor.run(input_file)
+        coverage_map = coverage_file.read()
+
+    if outcome.return_code is None or not coverage_map:
+        return None
+    return {block for (block, hit) in enumerate(coverage_map) if hit}
+
+
+def _deduplicate(inputs: [FilePath]) -> [FilePath]:
+    """ Remove inputs whose contents are identical to an earlier input """
+    seen = set()
+    unique = []
+    for input_file in inputs:
+        digest = manifest.hash_file(input_file)
+        if digest in seen:
+            os.remove(input_file)
+        else:
+            seen.add(digest)
+            unique.append(input_file)
+    return unique
+
+
+def _select_by_coverage(inputs: [FilePath], coverage: Dict[FilePath, Optional[Set[int]]]) -> [FilePath]:
+    """
+    For every block of code keep the smallest input that executes it, along with any input whose coverage is unknown.
+    Kept inputs are ordered by how many blocks they are kept for, so capping the corpus drops the least useful first
+    """
+    best = {}
+    for input_file in sorted(inputs, key=lambda i: (os.path.getsize(i), i)):
+        for block in coverage[input_file] or []:
+            best.setdefault(block, input_file)
+
+    kept_for = {}
+    for input_file in best.values():
+        kept_for[input_file] = kept_for.get(input_file, 0) + 1
+
+    unknown = [input_file for input_file in inputs if coverage[input_file] is None]
+    return unknown + sorted(kept_for, key=lambda i: (-kept_for[i], os.path.getsize(i), i))
+
+
+def _cap(inputs: [FilePath], max_inputs: int, max_bytes: int) -> [FilePath]:
+    """ Keep inputs in order while they fit within both limits. Inputs too large to fit are skipped """
+    kept = []
+    total_bytes = 0
+    for input_file in inputs:
+        if len(kept) >= max_inputs:
+            break
+        size = os.path.getsize(input_file)
+        if total_bytes + size > max_bytes:
+            continue
+        kept.append(input_file)
+        total_bytes += size
+    return kept
+
+
+def minimise_corpus(tests_dir: FilePath, source_assg_dir: FilePath, max_inputs: int, max_bytes: int,
+                    cpu_seconds: int, workers: int) -> Result:
+    """
+    Deduplicate and minimise a fuzzer generated corpus in place
+    :param tests_dir: the directory of generated inputs
+    :param source_assg_dir: the source assignment, used to build the coverage binary
+    :param max_inputs: the maximum number of inputs to keep
+    :param max_bytes: the maximum total size of the inputs to keep
+    :param cpu_seconds: the CPU time limit of each input when measuring coverage
+    :param workers: the number of inputs to measure at once
+    :return: a summary of the minimisation
+    """
+    inputs = corpus_runner.get_inputs(tests_dir)
+    num_generated = len(inputs)
+    inputs = _deduplicate(inputs)
+    num_unique = len(inputs)
+
+    coverage_binary = get_coverage_binary(source_assg_dir)
+    if coverage_binary:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            coverage = dict(zip(inputs, pool.map(lambda i: _get_coverage(coverage_binary, i, cpu_seconds), inputs)))
+        inputs = _select_by_coverage(inputs, coverage)
+
+    kept = set(_cap(inputs, max_inputs, max_bytes))
+    for input_file in corpus_runner.get_inputs(tests_dir):
+        if input_file not in kept:
+            os.remove(input_file)
+
+    return Result(True, f"Corpus minimised: {num_generated} generated, {num_unique} unique, {len(kept)} kept"
+                        f"{'' if coverage_binary else ' (coverage unavailable)'}")
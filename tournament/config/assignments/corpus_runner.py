@@ -0,0 +1,344 @@
+"""
+Runs a corpus of fuzzer generated inputs against a program under test.
+
+The corpus is split into shards that are run in parallel, and all shards stop as soon as any input triggers a
+sanitizer crash. Each input is limited by CPU time rather than wall clock time, so whether an input times out does not
+depend on how heavily loaded the machine is.
+
+Inputs can optionally be run through a fork server (see resources/fork_server.c), which executes the program under
+test once per shard and forks a child for each input, rather than paying the program's start up cost for every input.
+
+Inputs are also stopped by a wall clock backstop, and the corpus as a whole by a wall clock limit, so that a cell with a
+large corpus of slow inputs still finishes. Being stopped by wall clock time does depend on load, so it never decides
+the result of the cell: an input stopped before reaching its CPU limit has an unknown outcome, and a cell whose inputs
+could not all be run is NOT_TESTED, which is scored as neither a bug found nor a test suite evaded.
+"""
+import os
+import select
+import shutil
+import signal
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+from tournament.util import FilePath, TestResult, capture, kill_process_group, limit_cpu, paths, print_tourney_error
+
+# Return codes of a program under test that indicate a sanitizer crash, as reported by a shell (see shell_return_code).
+# The exact error codes that AddressSanitizer returns are to be determined.
+# This will be updated as more codes are discovered
+CRASH_RETURN_CODES = [1, 128 + signal.SIGABRT]
+
+# Inputs are also stopped after this multiple of their CPU limit in wall clock time, e.g. if they block on a read
+WALL_CLOCK_FACTOR = 10
+
+# How long to wait for a fork server to start, or to fork a child
+FORK_SERVER_TIMEOUT = 10
+
+FORK_SERVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "fork_server.c")
+FORK_SERVER_LIB = f"{paths.TOOLS_DIR}/fork_server.so"
+
+# When several inputs give different results, the result of the cell is the highest priority result
+RESULT_PRIORITY = [TestResult.NO_BUGS_DETECTED, TestResult.NOT_TESTED, TestResult.TIMEOUT,
+                   TestResult.UNEXPECTED_RETURN_CODE, TestResult.BUG_FOUND]
+
+
+def shell_return_code(return_code: int) -> int:
+    """
+    The return code of a process as a shell reports it, where a process killed by a signal returns 128 + the signal
+    number. Processes run without a shell, or through the fork server, instead report the negated signal number
+    """
+    return 128 - return_code if return_code is not None and return_code < 0 else return_code
+
+
+class InputOutcome:
+    """
+    The outcome of running a single input. A return code of None means the input reached its CPU limit, unless it was
+    stopped by wall clock time first, in which case its outcome is unknown
+    """
+    def __init__(self, return_code: int, output: str, stopped: bool = False):
+        self.return_code = return_code
+        self.output = output
+        self.stopped = stopped
+
+    def classify(self) -> TestResult:
+        """ Convert the outcome into the TestResult it implies for the cell """
+        if self.stopped:
+            return TestResult.NOT_TESTED
+        elif self.return_code is None:
+            return TestResult.TIMEOUT
+        elif self.return_code == 0:
+            return TestResult.NO_BUGS_DETECTED
+        elif self.return_code in CRASH_RETURN_CODES:
+            return TestResult.BUG_FOUND
+        else:
+            return TestResult.UNEXPECTED_RETURN_CODE
+
+
+class ExecExecutor:
+    """ Runs each input in a newly executed process """
+
+    def __init__(self, command: [str], cwd: FilePath, cpu_seconds: int, env: dict = None):
+        """
+        :param command: the command to run, where '{input}' is replaced by the path of the input
+        :param cwd: the directory to run the command in
+        :param cpu_seconds: the CPU time limit of each input
+        :param env: the environment to run the command in, if not the tournament's own
+        """
+        self.command = command
+        self.cwd = cwd
+        self.cpu_seconds = cpu_seconds
+        self.env = env
+
+    def _wall_clock_limit(self, timeout: float = None) -> float:
+        """ How long an input may run for in wall clock time, given how long is left to run the corpus """
+        limit = self.cpu_seconds * WALL_CLOCK_FACTOR
+        return limit if timeout is None else max(0.0, min(limit, timeout))
+
+    def run(self, input_file: FilePath, timeout: float = None) -> InputOutcome:
+        """
+        Run a single input
+        :param input_file: the input to run
+        :param timeout: if set, the wall clock time left to run the corpus, which the input may not run past
+        """
+        command = limit_cpu([arg.replace("{input}", input_file) for arg in self.command], self.cpu_seconds)
+        wall_clock_limit = self._wall_clock_limit(timeout)
+        result = capture.run_captured(command, self.cwd, timeout=wall_clock_limit, env=self.env)
+        if result.timed_out:
+            return self._stopped(input_file, wall_clock_limit)
+
+        return self._outcome(input_file, result.return_code, result.stdout)
+
+    @staticmethod
+    def _stopped(input_file: FilePath, wall_clock_limit: float) -> InputOutcome:
+        """ The outcome of an input stopped by wall clock time before it reached its CPU limit """
+        return InputOutcome(None, f"{input_file}: stopped after {wall_clock_limit:.0f} seconds of wall clock time, "
+                                  f"before reaching its CPU limit", stopped=True)
+
+    def _outcome(self, input_file: FilePath, return_code: int, output: str) -> InputOutcome:
+        """ The outcome of an input that ran to completion, or was killed on reaching its CPU limit """
+        if return_code in [-signal.SIGXCPU, -signal.SIGKILL]:
+            # killed by SIGXCPU or SIGKILL after reaching the CPU limit
+            return InputOutcome(None, f"{input_file}: used more than {self.cpu_seconds} seconds of CPU time")
+        return_code = shell_return_code(return_code)
+        return InputOutcome(return_code, f"{input_file}: exit code {return_code}\n{output}")
+
+    def close(self):
+        """ Release any resources held by the executor """
+
+
+class ForkServerExecutor(ExecExecutor):
+    """
+    Runs each input in a child forked from a single execution of the program, see resources/fork_server.c.
+    If the fork server can't be started, or stops responding, inputs are executed as by ExecExecutor instead
+    """
+
+    def __init__(self, command: [str], cwd: FilePath, cpu_seconds: int, fork_server_lib: FilePath):
+        """
+        :param command: the command to run, where '{input}' is replaced by the path of the input
+        :param cwd: the directory to run the command in
+        :param cpu_seconds: the CPU time limit of each input
+        :param fork_server_lib: the compiled fork server library
+        """
+        super().__init__(command, cwd, cpu_seconds)
+        self.work_dir = tempfile.mkdtemp(prefix="fork_server_")
+        self.cur_input = f"{self.work_dir}/.cur_input"
+        self.cur_output = f"{self.work_dir}/.cur_output"
+        self.server = None
+        self.ctl_write = None
+        self.st_read = None
+        self._start(fork_server_lib)
+
+    def _start(self, fork_server_lib: FilePath):
+        """ Execute the program with the fork server preloaded, and wait for it to say hello """
+        open(self.cur_input, 'wb').close()
+
+        (ctl_read, ctl_write) = os.pipe()
+        (st_read, st_write) = os.pipe()
+        try:
+            env = {**os.environ,
+                   'FORK_SERVER_CTL_FD': str(ctl_read),
+                   'FORK_SERVER_ST_FD': str(st_write),
+                   'FORK_SERVER_OUTPUT': self.cur_output,
+                   'FORK_SERVER_CPU_LIMIT': str(self.cpu_seconds),
+                   'LD_PRELOAD': " ".join(filter(None, [fork_server_lib, os.environ.get('LD_PRELOAD')])),
+                   # AddressSanitizer expects to be the first library loaded
+                   'ASAN_OPTIONS': ":".join(filter(None, [os.environ.get('ASAN_OPTIONS'),
+                                                          "verify_asan_link_order=0"]))}
+            self.server = subprocess.Popen([arg.replace("{input}", self.cur_input) for arg in self.command],
+                                           cwd=self.cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.DEVNULL, pass_fds=(ctl_read, st_write),
+                                           start_new_session=True)
+        except OSError:
+            self.server = None
+        finally:
+            # the child's ends of the pipes are only used by the fork server, and the parent's are closed by _stop
+            os.close(ctl_read)
+            os.close(st_write)
+            if self.server is None:
+                os.close(ctl_write)
+                os.close(st_read)
+
+        if self.server is None:
+            return
+        (self.ctl_write, self.st_read) = (ctl_write, st_read)
+        if self._read_message(FORK_SERVER_TIMEOUT) is None:
+            self._stop()
+
+    def _read_message(self, timeout: float) -> Optional[int]:
+        """ Read a message from the fork server, or None if the server has stopped or doesn't reply in time """
+        (ready, _, _) = select.select([self.st_read], [], [], timeout)
+        if not ready:
+            return None
+        message = os.read(self.st_read, 4)
+        return struct.unpack("I", message)[0] if len(message) == 4 else None
+
+    def _stop(self):
+        """ Stop the fork server. Any remaining inputs are executed directly """
+        if self.server is not None:
+            os.close(self.ctl_write)
+            try:
+                self.server.wait(timeout=FORK_SERVER_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                kill_process_group(self.server)
+            os.close(self.st_read)
+            self.server = None
+
+    def run(self, input_file: FilePath, timeout: float = None) -> InputOutcome:
+        if self.server is None:
+            return super().run(input_file, timeout)
+
+        shutil.copyfile(input_file, self.cur_input)
+        try:
+            os.write(self.ctl_write, struct.pack("I", 0))
+        except OSError:
+            self._stop()
+            return super().run(input_file, timeout)
+
+        child = self._read_message(FORK_SERVER_TIMEOUT)
+        if child is None:
+            self._stop()
+            return super().run(input_file, timeout)
+
+        # wall clock backstop, as for ExecExecutor. The CPU limit is applied by the fork server
+        wall_clock_limit = self._wall_clock_limit(timeout)
+        status = self._read_message(wall_clock_limit)
+        if status is None:
+            try:
+                os.kill(child, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            if self._read_message(FORK_SERVER_TIMEOUT) is None:
+                self._stop()
+            return self._stopped(input_file, wall_clock_limit)
+
+        return_code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        try:
+            with open(self.cur_output, 'rb') as output_file:
+                output = capture.read_bounded(output_file).text()
+        except FileNotFoundError:
+            output = ""
+        return self._outcome(input_file, return_code, output)
+
+    def close(self):
+        self._stop()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def get_fork_server_lib() -> FilePath:
+    """
+    Build the fork server library the first time it is needed, or after its source has changed
+    :return: the path of the library, or an empty path if it can't be built
+    """
+    try:
+        if os.path.getmtime(FORK_SERVER_LIB) >= os.path.getmtime(FORK_SERVER_SOURCE):
+            return FilePath(FORK_SERVER_LIB)
+    except OSError:
+        pass
+
+    # build under a temporary name and rename, so concurrent workers never load a partial build
+    os.makedirs(paths.TOOLS_DIR, exist_ok=True)
+    tmp_lib = f"{FORK_SERVER_LIB}.tmp.{os.getpid()}.{threading.get_ident()}"
+    compil = subprocess.run(["cc", "-shared", "-fPIC", "-O2", "-o", tmp_lib, FORK_SERVER_SOURCE],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=False)
+    if compil.returncode != 0:
+        print_tourney_error(f"Unable to build the fork server, running inputs directly:\n{compil.stdout}")
+        return FilePath("")
+
+    os.replace(tmp_lib, FORK_SERVER_LIB)
+    return FilePath(FORK_SERVER_LIB)
+
+
+def run_corpus(inputs: [FilePath], make_executor: Callable[[], ExecExecutor], shards: int,
+               time_limit: float) -> (TestResult, str):
+    """
+    Run a corpus of inputs against a program under test
+    :param inputs: the inputs to run
+    :param make_executor: creates the executor used by each shard to run its inputs
+    :param shards: the number of shards to run in parallel
+    :param time_limit: the wall clock time the corpus may take to run. If inputs are left unrun at the limit, and no
+                       other input decides the result, the cell is NOT_TESTED
+    :return: the highest priority result of any input, with the traces of the input that caused it
+    """
+    if not inputs:
+        return TestResult.NO_BUGS_DETECTED, "No inputs to run"
+
+    deadline = time.time() + time_limit
+    crashed = threading.Event()
+    out_of_time = threading.Event()
+    outcomes = []
+    outcomes_lock = threading.Lock()
+    num_run = [0]
+
+    def run_shard(shard_inputs: [FilePath]):
+        executor = make_executor()
+        try:
+            for input_file in shard_inputs:
+                if crashed.is_set():
+                    return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    out_of_time.set()
+                    return
+                outcome = executor.run(input_file, remaining)
+                if outcome.stopped and time.time() >= deadline:
+                    # stopped by the time limit of the cell rather than its own
+                    out_of_time.set()
+                    return
+                with outcomes_lock:
+                    num_run[0] += 1
+                    if outcome.classify() != TestResult.NO_BUGS_DETECTED:
+                        outcomes.append(outcome)
+                if outcome.classify() == TestResult.BUG_FOUND:
+                    crashed.set()
+        finally:
+            executor.close()
+
+    # inputs are dealt out round robin so each shard gets a similar mix of inputs
+    num_shards = max(1, min(shards, len(inputs)))
+    threads = [threading.Thread(target=run_shard, args=(inputs[shard::num_shards],)) for shard in range(num_shards)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if out_of_time.is_set() and not crashed.is_set():
+        outcomes.append(InputOutcome(None, f"Only {num_run[0]} of {len(inputs)} inputs were run within the "
+                                           f"{time_limit:.0f} second time limit of the cell", stopped=True))
+
+    if not outcomes:
+        return TestResult.NO_BUGS_DETECTED, f"{len(inputs)} inputs run, no bugs detected"
+
+    worst = max(outcomes, key=lambda outcome: RESULT_PRIORITY.index(outcome.classify()))
+    return worst.classify(), worst.output
+
+
+def get_inputs(tests_dir: FilePath) -> [FilePath]:
+    """ All inputs in a corpus directory, in a consistent order """
+    inputs = []
+    for (dir_path, dir_names, file_names) in os.walk(tests_dir, followlinks=True):
+        dir_names.sort()
+        inputs.extend(FilePath(os.path.join(dir_path, file_name)) for file_name in sorted(file_names))
+    return inputs
@@ -17,14 +17,23 @@ fuzz_assignment
 An example can be found at 'fuzz_assignment' in the same repo as this code
 
 """
+import hashlib
+import json
 import os
 import re
+import shutil
 import subprocess
+import tempfile
+from time import time
 from typing import Dict
 
-from tournament.config.assignments import AbstractAssignment
+from tournament.config.assignments import AbstractAssignment, corpus_minimiser, corpus_runner
+from tournament.config.files.processing_config import ProcessingConfig
 from tournament.util import FilePath, Prog, Result, Submitter, Test, TestResult
-from tournament.util import paths
+from tournament.util import capture, kill_process_group, limit_cpu, manifest, paths, quota, relink, scratch
+
+# Flags used when compiling programs under test
+CFLAGS = "-DDEBUG_NO_PRINTF"
 
 
 class FuzzAssignment(AbstractAssignment):
@@ -32,6 +41,8 @@ class FuzzAssignment(AbstractAssignment):
 
     def __init__(self, source_assg_dir: FilePath):
         super().__init__(source_assg_dir)
+        # read once per assignment, so once per batch of head to head cells rather than for every cell
+        self.processing_config = ProcessingConfig()
         self.tests_list = ["fuzzer"]
         self.progs_list = sorted(
             [prog for prog in os.listdir(self.get_source_assg_dir() + "/src") if prog not in ['original', 'include']])
@@ -42,39 +53,48 @@ class FuzzAssignment(AbstractAssignment):
     def get_programs_list(self) -> [Prog]:
         return self.progs_list
 
+    def get_test_dirs(self, test: Test) -> [str]:
+        # the generated tests/ folder is not source code. It is regenerated by the fuzzer on each submission
+        return ["fuzzer", "poc"]
+
+    def get_prog_dirs(self, prog: Prog) -> [str]:
+        return [f"src/{prog}"]
+
     def progs_identical(self, prog1: Prog, prog2: Prog, submission_dir: FilePath) -> bool:
         diff = subprocess.run(f"diff -rw {prog1} {prog2}", cwd=submission_dir + "/src",
                               shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
         return diff.returncode == 0
 
-    def run_test(self, test: Test, prog: Prog, submission_dir: FilePath, use_poc: bool = False) -> (TestResult, str):
-
-        if use_poc:
-            test_command = f"./run_tests.sh {prog} --use-poc"
-        else:
-            test_command = f"./run_tests.sh {prog}"
-
-        try:
-            try:
-                result = subprocess.run(test_command, shell=True, cwd=submission_dir, stdout=subprocess.PIPE,
-                                        stderr=subprocess.STDOUT, timeout=30, check=False)
-            except subprocess.TimeoutExpired:
-                return TestResult.TIMEOUT, "Took longer than 30 seconds to run"
-        except MemoryError:
-            # If a prog spams traces to stderr/stdout subprocess can run out of memory and throw a memory exception
-            # This tends to be co-morbid with timeout errors
-            return TestResult.TIMEOUT, "Memory error when extracting traces"
-
-        stdout = result.stdout.decode('ascii', errors='backslashreplace')
-
-        if result.returncode == 0:
-            return TestResult.NO_BUGS_DETECTED, stdout
-        elif result.returncode in [1, 134]:
-            # The exact error codes that AddressSanitizer returns are to be determined.
-            # This will be updated as more codes are discovered
-            return TestResult.BUG_FOUND, stdout
+    def run_test(self, test: Test, prog: Prog, submission_dir: FilePath, use_poc: bool = False,
+                 fail_fast: bool = False) -> (TestResult, str):
+
+        if not use_poc:
+            # run the generated tests directly, in parallel shards that stop at the first crash
+            config = self.processing_config
+            command = [f"bin/{prog}", "{input}"]
+            fork_server_lib = corpus_runner.get_fork_server_lib() if config.fuzz_fork_server() else ""
+
+            def make_executor():
+                if fork_server_lib:
+                    return corpus_runner.ForkServerExecutor(command, submission_dir, config.fuzz_input_cpu_seconds(),
+                                                            fork_server_lib)
+                return corpus_runner.ExecExecutor(command, submission_dir, config.fuzz_input_cpu_seconds())
+
+            inputs = corpus_runner.get_inputs(FilePath(f"{submission_dir}/tests"))
+            return corpus_runner.run_corpus(inputs, make_executor, config.fuzz_shards(), config.fuzz_cell_seconds())
+
+        result = capture.run_captured(f"./run_tests.sh {prog} --use-poc", submission_dir, timeout=30, shell=True)
+        if result.timed_out:
+            return TestResult.TIMEOUT, "Took longer than 30 seconds to run"
+
+        # the shell may exec run_tests.sh in place, so a crash of the script itself is reported as a signal
+        return_code = corpus_runner.shell_return_code(result.return_code)
+        if return_code == 0:
+            return TestResult.NO_BUGS_DETECTED, result.stdout
+        elif return_code in corpus_runner.CRASH_RETURN_CODES:
+            return TestResult.BUG_FOUND, result.stdout
         else:
-            return TestResult.UNEXPECTED_RETURN_CODE, f"Exit code: {result.returncode}\n{stdout}"
+            return TestResult.UNEXPECTED_RETURN_CODE, f"Exit code: {return_code}\n{result.stdout}"
 
     def get_num_tests(self, traces: str) -> int:
         return 0  # num tests is not needed for fuzz_assignment, as it does not impact the scoring functions
@@ -87,21 +107,11 @@ class FuzzAssignment(AbstractAssignment):
         subprocess.run("rm -rf tests/*", shell=True, cwd=submission_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                        check=True)
 
-        # copy across the fuzzer and PoCs
-        for folder in ['/fuzzer', '/poc']:
-            subprocess.run(f"rm -rf {destination_dir + folder}", shell=True, check=True)
-            res = subprocess.run(f"cp -rf {submission_dir + folder} {destination_dir}",
-                                 shell=True, check=False)
-            if res.returncode != 0:
-                return Result(False, res.stderr[res.stderr.find(self.get_assignment_name()): ])
-
-        # copy across the programs, excluding 'original' and 'include'
-        for program in self.get_programs_list():
-            subprocess.run(f"rm -rf {destination_dir}/src/{program}", shell=True, check=True)
-            res = subprocess.run(f"cp -rf {submission_dir}/src/{program} {destination_dir}/src",
-                                 shell=True, check=False)
-            if res.returncode != 0:
-                return Result(False, res.stderr[res.stderr.find(self.get_assignment_name()): ])
+        # copy across the fuzzer, PoCs, and the programs, excluding 'original' and 'include'
+        copy_result = self.copy_into(submission_dir, destination_dir,
+                                     ["fuzzer", "poc"] + [f"src/{program}" for program in self.get_programs_list()])
+        if not copy_result:
+            return copy_result
 
         # ensure the bin/ folder is empty, submitters haven't pushed binaries
         subprocess.run("make clean", shell=True, cwd=destination_dir, stdout=subprocess.PIPE,
@@ -110,23 +120,157 @@ class FuzzAssignment(AbstractAssignment):
         return Result(True, "Preparation successful")
 
     def compile_prog(self, submission_dir: FilePath, prog: Prog) -> Result:
-        compil = subprocess.run(f'CFLAGS="-DDEBUG_NO_PRINTF" make VERSIONS={prog}', cwd=submission_dir,
+        compil = subprocess.run(f'CFLAGS="{CFLAGS}" make VERSIONS={prog}', cwd=submission_dir,
                                 shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
                                 check=False)
         if compil.returncode != 0:
             return Result(False, compil.stdout)
         return Result(True, "")
 
+    def get_build_key(self, submission_dir: FilePath, prog: Prog) -> str:
+        """
+        A hash of everything that goes into a programs binary: its source code, the shared headers, the Makefile
+        and the compiler flags. A binary can be reused by any submission with the same build key
+        """
+        makefile = FilePath(f"{submission_dir}/Makefile")
+        inputs = [CFLAGS,
+                  manifest.hash_tree(submission_dir, f"src/{prog}"),
+                  manifest.hash_tree(submission_dir, "src/include"),
+                  manifest.hash_file(makefile) if os.path.isfile(makefile) else ""]
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def compile_progs(self, submission_dir: FilePath, progs: [Prog],
+                      prev_submission_dir: FilePath) -> Dict[Prog, Result]:
+        build_keys = {prog: self.get_build_key(submission_dir, prog) for prog in progs}
+
+        prev_keys_file = f"{prev_submission_dir}/{paths.BUILD_KEYS_FILE}"
+        prev_build_keys = json.load(open(prev_keys_file, 'r')) if os.path.isfile(prev_keys_file) else {}
+
+        # reuse the binaries of programs that are unchanged since the previous submission
+        results = {}
+        for prog in progs:
+            prev_binary = f"{prev_submission_dir}/bin/{prog}"
+            if prev_build_keys.get(prog) == build_keys[prog] and os.path.isfile(prev_binary):
+                os.makedirs(f"{submission_dir}/bin", exist_ok=True)
+                shutil.copy2(prev_binary, f"{submission_dir}/bin/{prog}")
+                results[prog] = Result(True, "Reused unchanged binary from previous submission")
+
+        # build all remaining programs in a single parallel make job
+        to_build = [prog for prog in progs if prog not in results]
+        if to_build:
+            compil = subprocess.run(f'CFLAGS="{CFLAGS}" make -j{os.cpu_count()} VERSIONS="{" ".join(to_build)}"',
+                                    cwd=submission_dir, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    universal_newlines=True, check=False)
+            for prog in to_build:
+                # if the parallel build failed, build each program on its own to determine which failed and why.
+                # Programs built successfully by the parallel job are up to date and will not be rebuilt
+                results[prog] = Result(True, "") if compil.returncode == 0 else self.compile_prog(submission_dir, prog)
+
+        json.dump({prog: build_keys[prog] for prog in progs if results[prog]},
+                  open(f"{submission_dir}/{paths.BUILD_KEYS_FILE}", 'w'), indent=4, sort_keys=True)
+
+        return {prog: results[prog] for prog in progs}
+
     def compile_test(self, submission_dir: FilePath, test: Test) -> Result:
-        try:
+        config = self.processing_config
+        if config.fuzz_background_generation():
+            # only a short seed run is needed for validation, the full set of tests is generated by generate_tests
+            fuzzer_result = self._run_fuzzer(submission_dir, config.fuzz_seed_seconds(), stop_is_failure=False)
+        else:
+            fuzzer_result = self._run_fuzzer(submission_dir, 300, stop_is_failure=True)
+
+        if not fuzzer_result:
+            return fuzzer_result
+        return self._minimise_tests(submission_dir)
+
+    def generates_tests_in_background(self) -> bool:
+        return self.processing_config.fuzz_background_generation()
+
+    def generate_tests(self, submission_dir: FilePath) -> Result:
+        # tests are generated in a copy of the submission, as a newer submission may replace it in the queue at any time
+        with tempfile.TemporaryDirectory() as work_root:
+            work_dir = FilePath(f"{work_root}/submission")
+            shutil.copytree(submission_dir, work_dir, symlinks=True)
+            shutil.rmtree(f"{work_dir}/tests", ignore_errors=True)
+            os.makedirs(f"{work_dir}/tests")
+
+            result = self._run_fuzzer(work_dir, 300, stop_is_failure=True,
+                                      cpu_seconds=self.processing_config.fuzz_generation_cpu_seconds())
+            if result:
+                result = self._minimise_tests(work_dir)
+            if result:
+                # the full set of tests must still pass against the original program
+                (test_result, traces) = self.run_test(Test("fuzzer"), Prog("original"), work_dir)
+                if test_result != TestResult.NO_BUGS_DETECTED:
+                    result = Result(False, f"Generated tests do not pass against the original program:\n{traces}")
+
+            if not result:
+                return result + "Keeping the tests generated during validation"
+            if not os.path.isdir(submission_dir):
+                return Result(False, "The submission was replaced while its tests were generated")
+
+            # swap in the new tests
+            old_tests_dir = f"{submission_dir}/tests.old"
+            os.rename(f"{submission_dir}/tests", old_tests_dir)
+            shutil.move(f"{work_dir}/tests", f"{submission_dir}/tests")
+            shutil.rmtree(old_tests_dir)
+
+        return result
+
+    def _run_fuzzer(self, submission_dir: FilePath, time_limit: int, stop_is_failure: bool,
+                    cpu_seconds: int = 0) -> Result:
+        """
+        Run the submitters fuzzer to generate tests in tests/
+        :param submission_dir: the submission to generate tests for
+        :param time_limit: the wall clock time the fuzzer may run for
+        :param stop_is_failure: whether being stopped at the time limit is a failure, or just ends the run
+        :param cpu_seconds: if set, the CPU time each process of the fuzzer may use. The fuzzer is also run at a low
+        priority so that it doesn't slow head to head testing
+        :return: whether the fuzzer ran successfully
+        """
+        quota_bytes = self.processing_config.submission_quota_bytes()
+
+        command = ["./run_fuzzer.sh"]
+        if cpu_seconds:
+            command = ["nice", "-n", "10"] + limit_cpu(command, cpu_seconds)
+
+        with tempfile.TemporaryFile() as output:
             # run the fuzzer to generate a list of tests in tests/
-            result = subprocess.run("./run_fuzzer.sh", shell=True, cwd=submission_dir, stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT, universal_newlines=True, timeout=300, check=False)
-        except subprocess.TimeoutExpired:
-            return Result(False, "Generating tests with ./run_fuzzer.sh timed out after 5 minutes")
+            fuzzer = subprocess.Popen(command, cwd=submission_dir, stdout=output, stderr=subprocess.STDOUT,
+                                      start_new_session=True)
+
+            # periodically check the generated tests haven't pushed the submission over its quota
+            deadline = time() + time_limit
+            while fuzzer.poll() is None:
+                try:
+                    fuzzer.wait(timeout=2)
+                except subprocess.TimeoutExpired:
+                    if time() > deadline:
+                        kill_process_group(fuzzer)
+                        if stop_is_failure:
+                            return Result(False, f"Generating tests with ./run_fuzzer.sh timed out after "
+                                                 f"{time_limit} seconds")
+                        return Result(True, f"./run_fuzzer.sh stopped after {time_limit} seconds")
+
+                    quota_result = quota.check_quota(submission_dir, quota_bytes)
+                    if not quota_result:
+                        kill_process_group(fuzzer)
+                        return Result(False, f"./run_fuzzer.sh was stopped.\n{quota_result.traces}")
+
+            output.seek(0)
+            stdout = capture.read_bounded(output).text()
+
+        if fuzzer.returncode != 0:
+            return Result(False, stdout)
+        return Result(True, "")
 
-        if result.returncode != 0:
-            return Result(False, result.stdout)
+    def _minimise_tests(self, submission_dir: FilePath) -> Result:
+        """ Every generated test is replayed in every head to head cell, so keep only tests with distinct behaviour """
+        config = self.processing_config
+        if config.fuzz_corpus_minimise():
+            return corpus_minimiser.minimise_corpus(FilePath(f"{submission_dir}/tests"), self.get_source_assg_dir(),
+                                                    config.fuzz_corpus_max_inputs(), config.fuzz_corpus_max_bytes(),
+                                                    config.fuzz_input_cpu_seconds(), config.fuzz_shards())
         return Result(True, "")
 
     def detect_new_tests(self, new_submission: FilePath, old_submission: FilePath) -> [Test]:
@@ -135,35 +279,17 @@ class FuzzAssignment(AbstractAssignment):
         return self.get_test_list()
 
     def detect_new_progs(self, new_submission: FilePath, old_submission: FilePath) -> [Prog]:
-        if not os.path.isdir(old_submission):
-            # if there is no previous submission then all tests are new
-            return self.get_programs_list()
-
-        new_progs = []
-        for prog in self.get_programs_list():
-            diff = subprocess.run(
-                f"diff -r {new_submission}/src/{prog} {old_submission}/src/{prog}",
-                stdout=subprocess.PIPE, shell=True, check=False)
-            if diff.returncode != 0:
-                new_progs.append(prog)
-
-        return new_progs
+        return self.changed_since(new_submission, old_submission, 'progs')
 
     def prep_test_stage(self, tester: Submitter, testee: Submitter, test_stage_dir: FilePath):
 
         test_stage_code_dir = test_stage_dir
         tester_code_dir = paths.get_tourney_dir(tester)
-        testee_code_dir = paths.get_tourney_dir(testee)
-
-        # symlink in testers tests
-        subprocess.run(f"rm -rf {test_stage_code_dir}/tests", shell=True, check=True)
-        subprocess.run(f"ln -s {tester_code_dir}/tests {test_stage_code_dir}/tests",
-                       shell=True, check=True)
 
-        # symlink in testees programs
-        subprocess.run(f"rm -rf {test_stage_code_dir}/bin", shell=True, check=True)
-        subprocess.run(f"ln -s {testee_code_dir}/bin {test_stage_code_dir}/bin",
-                       shell=True, check=True)
+        # symlink in testers tests and testees programs, with the programs binaries read from scratch space.
+        # Links already pointing at the right submission are kept
+        relink(f"{tester_code_dir}/tests", f"{test_stage_code_dir}/tests")
+        relink(scratch.get_artefact_dir(testee, "bin"), f"{test_stage_code_dir}/bin")
 
     def compute_normalised_prog_score(self, submitter_score: float, best_score: float) -> float:
         if best_score == 0:
@@ -0,0 +1,54 @@
+import org.junit.runner.Request;
+import org.junit.runner.Result;
+import org.junit.runner.Runner;
+import org.junit.runner.notification.Failure;
+import org.junit.runner.notification.RunListener;
+import org.junit.runner.notification.RunNotifier;
+import org.junit.runner.notification.StoppedByUserException;
+
+/**
+ * Runs JUnit test classes and stops at the first failing test.
+ * A head to head cell only needs to know whether any test detects a bug, so once one test fails the rest of the
+ * suite does not need to be run.
+ *
+ * Usage: java FailFastRunner [test classes]
+ * Exits with 0 if all tests pass, and 1 if a test fails
+ */
+public class FailFastRunner {
+
+    /* Printed when the suite is stopped before all tests have been run */
+    public static final String EARLY_EXIT_MARKER = "FailFastRunner: stopped at first failure";
+
+    public static void main(String[] args) throws ClassNotFoundException {
+        Class<?>[] testClasses = new Class<?>[args.length];
+        for (int i = 0; i < args.length; i++) {
+            testClasses[i] = Class.forName(args[i]);
+        }
+
+        final RunNotifier notifier = new RunNotifier();
+        Result result = new Result();
+        notifier.addListener(result.createListener());
+        notifier.addListener(new RunListener() {
+            @Override
+            public void testFailure(Failure failure) {
+                System.out.println("Failure: " + failure.getTestHeader());
+                System.out.println(failure.getTrace());
+                notifier.pleaseStop();
+            }
+        });
+
+        Runner runner = Request.classes(testClasses).getRunner();
+        try {
+            runner.run(notifier);
+        } catch (StoppedByUserException e) {
+            System.out.println(EARLY_EXIT_MARKER);
+        }
+
+        if (result.wasSuccessful()) {
+            System.out.println("OK (" + result.getRunCount() + " tests)");
+            System.exit(0);
+        }
+        System.out.println("Tests run: " + result.getRunCount() + ",  Failures: " + result.getFailureCount());
+        System.exit(1);
+    }
+}
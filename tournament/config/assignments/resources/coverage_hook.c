@@ -0,0 +1,40 @@
+/*
+ * Records which code a program executes, for fuzz corpus minimisation.
+ *
+ * Linked into a build of the program compiled with -fsanitize-coverage=trace-pc, which calls __sanitizer_cov_trace_pc
+ * at the start of every basic block. Each block sets a byte in a coverage map, and the map is written to the file
+ * named by COVERAGE_OUTPUT when the program exits.
+ *
+ * This file must be compiled without -fsanitize-coverage.
+ */
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#define MAP_SIZE (1 << 16)
+
+static unsigned char coverage_map[MAP_SIZE];
+
+/* the start of the program in memory, defined by the linker. Addresses are taken relative to it so that they don't
+ * change between runs of a position independent executable */
+extern char __executable_start;
+
+void __sanitizer_cov_trace_pc(void)
+{
+    uintptr_t pc = (uintptr_t) __builtin_return_address(0) - (uintptr_t) &__executable_start;
+    coverage_map[(pc ^ (pc >> 16)) & (MAP_SIZE - 1)] = 1;
+}
+
+__attribute__((destructor)) static void write_coverage(void)
+{
+    const char *path = getenv("COVERAGE_OUTPUT");
+    if (path == NULL) {
+        return;
+    }
+
+    FILE *output = fopen(path, "wb");
+    if (output != NULL) {
+        fwrite(coverage_map, 1, MAP_SIZE, output);
+        fclose(output);
+    }
+}
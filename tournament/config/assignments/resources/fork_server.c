@@ -0,0 +1,97 @@
+/*
+ * An AFL style fork server, loaded into a program under test with LD_PRELOAD.
+ *
+ * The program is executed once, and its (AddressSanitizer) start up cost is paid once. Before main() is reached this
+ * constructor takes over and forks a child on each request from the tournament. The child returns from the
+ * constructor and runs main() as normal, reading the input the tournament placed at the path in its argv.
+ *
+ * Protocol, all messages are 4 bytes:
+ *   server -> tournament  hello, once the server is ready
+ *   tournament -> server  run the current input
+ *   server -> tournament  the pid of the child running the input
+ *   server -> tournament  the wait status of the child once it has finished
+ *
+ * Configured through the environment:
+ *   FORK_SERVER_CTL_FD     fd to read requests from
+ *   FORK_SERVER_ST_FD      fd to write replies to
+ *   FORK_SERVER_OUTPUT     file each child writes its stdout and stderr to
+ *   FORK_SERVER_CPU_LIMIT  CPU time limit in seconds of each child
+ */
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <sys/resource.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+__attribute__((constructor)) static void fork_server(void)
+{
+    const char *ctl_env = getenv("FORK_SERVER_CTL_FD");
+    const char *st_env = getenv("FORK_SERVER_ST_FD");
+    const char *output = getenv("FORK_SERVER_OUTPUT");
+    const char *cpu_env = getenv("FORK_SERVER_CPU_LIMIT");
+
+    /* not started by the tournament, run the program as normal */
+    if (ctl_env == NULL || st_env == NULL) {
+        return;
+    }
+
+    int ctl_fd = atoi(ctl_env);
+    int st_fd = atoi(st_env);
+    rlim_t cpu_limit = cpu_env == NULL ? 0 : (rlim_t) atol(cpu_env);
+
+    uint32_t message = 0;
+    if (write(st_fd, &message, 4) != 4) {
+        return;
+    }
+
+    for (;;) {
+        /* the tournament has closed the pipe, no more inputs */
+        if (read(ctl_fd, &message, 4) != 4) {
+            _exit(0);
+        }
+
+        pid_t child = fork();
+        if (child < 0) {
+            _exit(1);
+        }
+
+        if (child == 0) {
+            close(ctl_fd);
+            close(st_fd);
+
+            if (cpu_limit > 0) {
+                struct rlimit limit = {cpu_limit, cpu_limit + 1};
+                setrlimit(RLIMIT_CPU, &limit);
+            }
+
+            if (output != NULL) {
+                int output_fd = open(output, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+                if (output_fd >= 0) {
+                    dup2(output_fd, STDOUT_FILENO);
+                    dup2(output_fd, STDERR_FILENO);
+                    close(output_fd);
+                }
+            }
+
+            /* continue on to main() */
+            return;
+        }
+
+        message = (uint32_t) child;
+        if (write(st_fd, &message, 4) != 4) {
+            _exit(1);
+        }
+
+        int status;
+        if (waitpid(child, &status, 0) < 0) {
+            _exit(1);
+        }
+
+        message = (uint32_t) status;
+        if (write(st_fd, &message, 4) != 4) {
+            _exit(1);
+        }
+    }
+}
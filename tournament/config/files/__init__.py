@@ -3,4 +3,5 @@
 from .approved_submitters import ApprovedSubmitters
 from .assignment_config import AssignmentConfig
 from .email_config import EmailConfig
+from .processing_config import ProcessingConfig
 from .server_config import ServerConfig
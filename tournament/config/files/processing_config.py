@@ -0,0 +1,153 @@
+"""
+Configuration for how the tournament processes submissions
+"""
+import json
+import os
+
+from tournament.util import paths, print_tourney_trace, Result
+
+
+class ProcessingConfig:
+    """ Configuration for how the tournament processes submissions """
+
+    default_processing_config = {
+        'scratch_dir': "/dev/shm/swen_tourney",  # fast (e.g. tmpfs) storage for test stages and build artefacts
+        'scratch_budget_mb': 1024,  # once the scratch dir holds this much data new artefacts are kept on disk
+        'submission_quota_mb': 150,  # the maximum size of a submission, including compiled code and generated tests
+        'validation_workers': 4,  # the number of tests/programs to validate at once in the frontend stages
+        'validation_fail_fast': False,  # stop validating a submission at the first failed test or program
+        'junit_classpath': "",  # JUnit jars for ant assignments, if not those in build.xml. Relative to the submission
+        'fuzz_shards': 4,  # the number of fuzz inputs to run at once when testing a program
+        'fuzz_input_cpu_seconds': 1,  # the CPU time each fuzz input may use before it is considered a timeout
+        'fuzz_cell_seconds': 300,  # the wall clock time a head to head cell may take to run all of its fuzz inputs
+        'fuzz_fork_server': False,  # run fuzz inputs through a fork server rather than executing each one
+        'fuzz_corpus_minimise': True,  # reduce generated fuzz corpora to inputs with distinct coverage
+        'fuzz_corpus_max_inputs': 1000,  # the maximum number of inputs kept in a generated fuzz corpus
+        'fuzz_corpus_max_mb': 10,  # the maximum total size of the inputs kept in a generated fuzz corpus
+        'fuzz_background_generation': True,  # generate full fuzz corpora on the server rather than in the frontend
+        'fuzz_seed_seconds': 30,  # how long fuzzers run for in the frontend when corpora are generated on the server
+        'fuzz_generation_workers': 2,  # the number of fuzz corpora generated on the server at once
+        'fuzz_generation_cpu_seconds': 600,  # the CPU time each fuzzer process may use when generating a corpus
+        'head_to_head_traces': False,  # write each pool process's progress to traces/head_to_head_process_N.log
+        'admission_control': "off",  # "reject" or "defer" resubmissions that are too frequent or made while busy
+        'admission_min_interval_minutes': 0,  # the minimum time between accepted submissions from a submitter
+        'admission_max_queued': 0,  # the queue is busy once this many submissions are queued. 0 for no limit
+        'admission_max_wait_minutes': 0,  # the queue is busy once it is estimated to take this long. 0 for no limit
+    }
+
+    processing_config = default_processing_config
+
+    def __init__(self):
+        if not os.path.exists(paths.PROCESSING_CONFIG):
+            print_tourney_trace(f"No processing configuration file found at {paths.PROCESSING_CONFIG}. "
+                                f"Using default configuration.")
+            ProcessingConfig.write_default()
+            self.processing_config = self.default_processing_config
+        else:
+            # fields added in later versions of the tournament fall back to their default values
+            self.processing_config = {**self.default_processing_config,
+                                      **json.load(open(paths.PROCESSING_CONFIG, 'r'))}
+
+    def scratch_dir(self) -> str:
+        """ The directory to use as scratch space. An empty string disables the use of scratch space """
+        return self.processing_config['scratch_dir']
+
+    def scratch_budget_bytes(self) -> int:
+        """ The maximum amount of data to store in the scratch space """
+        return int(self.processing_config['scratch_budget_mb'] * 1000 * 1000)
+
+    def submission_quota_bytes(self) -> int:
+        """ The maximum size of a submission """
+        return int(self.processing_config['submission_quota_mb'] * 1000 * 1000)
+
+    def validation_workers(self) -> int:
+        """ The number of tests or programs to validate at once """
+        return self.processing_config['validation_workers']
+
+    def validation_fail_fast(self) -> bool:
+        """ Whether to stop validating a submission as soon as it fails """
+        return self.processing_config['validation_fail_fast']
+
+    def junit_classpath(self) -> [str]:
+        """ The classpath entries needed to compile and run JUnit tests. Empty to use those of the build script """
+        return [entry for entry in self.processing_config['junit_classpath'].split(os.pathsep) if entry]
+
+    def fuzz_shards(self) -> int:
+        """ The number of fuzz inputs to run at once when testing a program """
+        return max(1, self.processing_config['fuzz_shards'])
+
+    def fuzz_input_cpu_seconds(self) -> int:
+        """ The CPU time limit of each fuzz input """
+        return max(1, int(self.processing_config['fuzz_input_cpu_seconds']))
+
+    def fuzz_cell_seconds(self) -> int:
+        """ The wall clock time limit of running a corpus of fuzz inputs in a head to head cell """
+        return max(1, int(self.processing_config['fuzz_cell_seconds']))
+
+    def fuzz_fork_server(self) -> bool:
+        """ Whether to run fuzz inputs through a fork server """
+        return self.processing_config['fuzz_fork_server']
+
+    def fuzz_corpus_minimise(self) -> bool:
+        """ Whether to minimise generated fuzz corpora """
+        return self.processing_config['fuzz_corpus_minimise']
+
+    def fuzz_corpus_max_inputs(self) -> int:
+        """ The maximum number of inputs kept in a generated fuzz corpus """
+        return self.processing_config['fuzz_corpus_max_inputs']
+
+    def fuzz_corpus_max_bytes(self) -> int:
+        """ The maximum total size of the inputs kept in a generated fuzz corpus """
+        return int(self.processing_config['fuzz_corpus_max_mb'] * 1000 * 1000)
+
+    def fuzz_background_generation(self) -> bool:
+        """ Whether full fuzz corpora are generated in the background on the tournament server """
+        return self.processing_config['fuzz_background_generation']
+
+    def fuzz_seed_seconds(self) -> int:
+        """ How long fuzzers run for in the frontend when corpora are generated in the background """
+        return self.processing_config['fuzz_seed_seconds']
+
+    def fuzz_generation_workers(self) -> int:
+        """ The number of fuzz corpora generated in the background at once """
+        return max(1, self.processing_config['fuzz_generation_workers'])
+
+    def fuzz_generation_cpu_seconds(self) -> int:
+        """ The CPU time each fuzzer process may use when generating a corpus in the background """
+        return max(1, int(self.processing_config['fuzz_generation_cpu_seconds']))
+
+    def head_to_head_traces(self) -> bool:
+        """ Whether pool processes write their progress through each head to head cell to a trace file """
+        return self.processing_config['head_to_head_traces']
+
+    def admission_control(self) -> str:
+        """ How resubmissions that are too frequent or made while the queue is busy are handled: off, reject, defer """
+        return self.processing_config['admission_control']
+
+    def admission_min_interval_seconds(self) -> float:
+        """ The minimum time between accepted submissions from a submitter """
+        return self.processing_config['admission_min_interval_minutes'] * 60
+
+    def admission_max_queued(self) -> int:
+        """ The number of queued submissions at which the queue is busy. 0 for no limit """
+        return self.processing_config['admission_max_queued']
+
+    def admission_max_wait_seconds(self) -> float:
+        """ The estimated time to process the queue at which the queue is busy. 0 for no limit """
+        return self.processing_config['admission_max_wait_minutes'] * 60
+
+    def check_processing_config(self) -> Result:
+        """ Write the details of the processing configuration on tournament start up """
+        if self.admission_control() not in ("off", "reject", "defer"):
+            return Result(False, f"Unknown admission_control '{self.admission_control()}' in "
+                                 f"{paths.PROCESSING_CONFIG}. Must be one of off, reject or defer\n")
+        if self.scratch_dir():
+            return Result(True, f"Scratch space: {self.scratch_dir()} "
+                                f"(budget {self.processing_config['scratch_budget_mb']}MB)\n")
+        return Result(True, "Scratch space disabled\n")
+
+    @staticmethod
+    def write_default():
+        """ Create a default ProcessingConfig file """
+        json.dump(ProcessingConfig.default_processing_config, open(paths.PROCESSING_CONFIG, 'w'),
+                  indent=4, sort_keys=True)
@@ -10,9 +10,18 @@ from tournament.util import paths, print_tourney_trace, Result
 class ServerConfig:
     """ Configuration for the hosting of the results server """
 
+    SERVER_MODES = ["asyncio", "threaded"]
+
     default_server_config = {
         'host': '127.0.0.1',
-        'port': 8080
+        'port': 8080,
+        'mode': "asyncio",  # "asyncio" serves all connections from one event loop, "threaded" uses one thread each
+        'max_connections': 512,  # the maximum number of connections served at once in asyncio mode
+        'rate_limit_per_second': 10,  # requests each client ip may make per second in asyncio mode
+        'rate_limit_burst': 40,  # requests each client ip may make at once before it is rate limited
+        'client_timeout_seconds': 10,  # how long a client may take to send a request or receive a response
+        'keep_alive_seconds': 15,  # how long an idle keep-alive connection is held open
+        'max_event_subscribers': 5000,  # the maximum number of clients subscribed to live updates in asyncio mode
     }
 
     server_config = default_server_config
@@ -24,7 +33,8 @@ class ServerConfig:
             ServerConfig.write_default()
             self.server_config = self.default_server_config
         else:
-            self.server_config = json.load(open(paths.SERVER_CONFIG, 'r'))
+            # fields added in later versions of the tournament fall back to their default values
+            self.server_config = {**self.default_server_config, **json.load(open(paths.SERVER_CONFIG, 'r'))}
 
     def host(self) -> str:
         """ The host of the results server """
@@ -34,9 +44,40 @@ class ServerConfig:
         """ The port on which the results server is accessible """
         return self.server_config['port']
 
+    def mode(self) -> str:
+        """ How the results server handles connections, one of SERVER_MODES """
+        return self.server_config['mode']
+
+    def max_connections(self) -> int:
+        """ The maximum number of connections served at once """
+        return max(1, self.server_config['max_connections'])
+
+    def rate_limit_per_second(self) -> float:
+        """ The rate at which each client ip may make requests """
+        return self.server_config['rate_limit_per_second']
+
+    def rate_limit_burst(self) -> int:
+        """ The number of requests each client ip may make at once """
+        return max(1, self.server_config['rate_limit_burst'])
+
+    def client_timeout_seconds(self) -> float:
+        """ How long a client may take to send a request or receive a response """
+        return self.server_config['client_timeout_seconds']
+
+    def keep_alive_seconds(self) -> float:
+        """ How long an idle keep-alive connection is held open """
+        return self.server_config['keep_alive_seconds']
+
+    def max_event_subscribers(self) -> int:
+        """ The maximum number of clients subscribed to live updates at once """
+        return self.server_config['max_event_subscribers']
+
     def check_server_config(self) -> Result:
         """ Write the details of the results server on tournament start up """
-        return Result(True, f"Server is listening on {self.host()}:{self.port()}\n")
+        if self.mode() not in ServerConfig.SERVER_MODES:
+            return Result(False, f"Unknown results server mode '{self.mode()}'. "
+                                 f"Must be one of {ServerConfig.SERVER_MODES}\n")
+        return Result(True, f"Server is listening on {self.host()}:{self.port()} ({self.mode()} mode)\n")
 
     @staticmethod
     def write_default():
@@ -0,0 +1,93 @@
+"""
+Admission control of submissions to the queue, decided when a submission is made (see submission._submit).
+
+When submitters resubmit faster than the daemon processes submissions, such as in the hours before a deadline, the
+queue grows and everyone in it waits longer for results. Resubmissions from submitters who already have an entry in the
+tournament may be limited to one accepted submission per ProcessingConfig.admission_min_interval_seconds, and while the
+queue is busy: once it holds ProcessingConfig.admission_max_queued submissions, or is estimated to take
+ProcessingConfig.admission_max_wait_seconds to process (see eta.py).
+
+Depending on ProcessingConfig.admission_control, limited submissions are rejected, or deferred: accepted at a low
+priority, so that they are processed after every submission at normal priority. A deferred submission still replaces
+the submitters previously queued submission, so only their latest is processed. A submitters first submission is never
+limited, so first time submitters only ever wait behind submissions at normal priority.
+"""
+import fcntl
+import json
+import os
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from tournament.config import ProcessingConfig
+from tournament.daemon import eta, fs_queue
+from tournament.util import Submitter, format as fmt, paths, write_atomic
+
+
+class Admission(Enum):
+    """ Whether a submission is admitted to the queue """
+    ACCEPTED = "accepted"
+    DEFERRED = "deferred"
+    REJECTED = "rejected"
+
+
+def admit(submitter: Submitter, submission_time: datetime) -> (Admission, str):
+    """
+    Decide whether to admit a submission to the queue, and record when submissions that are admitted were made
+    :param submitter: the submitter making the submission
+    :param submission_time: the time of the submission
+    :return: the decision, and why the submission was limited if it was deferred or rejected
+    """
+    config = ProcessingConfig()
+
+    # serialised between submissions, so that a submitter's concurrent submissions see each other
+    with open(paths.ADMISSIONS_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        admissions = json.load(open(paths.ADMISSIONS_FILE, 'r')) if os.path.isfile(paths.ADMISSIONS_FILE) else {}
+        reason = "" if config.admission_control() == "off" else \
+            _limit_reason(config, submitter, submission_time, admissions.get(submitter))
+        if reason and config.admission_control() == "reject":
+            return Admission.REJECTED, reason
+
+        admissions[submitter] = submission_time.timestamp()
+        write_atomic(paths.ADMISSIONS_FILE, json.dumps(admissions, indent=4, sort_keys=True).encode())
+
+    return (Admission.DEFERRED, reason) if reason else (Admission.ACCEPTED, "")
+
+
+def _limit_reason(config: ProcessingConfig, submitter: Submitter, submission_time: datetime,
+                  last_admitted: Optional[float]) -> str:
+    """
+    Why a submission should be limited
+    :param last_admitted: the timestamp of the submitters last admitted submission, if any
+    :return: the reason, or an empty string if the submission should not be limited
+    """
+    if last_admitted is None and not os.path.isdir(paths.get_tourney_dir(submitter)):
+        # the submitters first submission
+        return ""
+
+    interval = config.admission_min_interval_seconds()
+    if last_admitted is not None and submission_time.timestamp() - last_admitted < interval:
+        last_date = datetime.fromtimestamp(last_admitted).strftime(fmt.DATETIME_TRACE_STRING)
+        return f"Submissions are accepted at most once every {_minutes(interval)}, and your last submission was " \
+               f"accepted at {last_date}."
+
+    # the submitters own queued submission is replaced by this one, so doesn't count towards the queue
+    queued = [file_path for file_path in fs_queue.get_queue()
+              if fs_queue.get_submission_request_details(file_path)[0] != submitter]
+    if config.admission_max_queued() and len(queued) >= config.admission_max_queued():
+        return f"The tournament is busy, with {len(queued)} submissions queued."
+
+    if config.admission_max_wait_seconds():
+        wait = eta.estimate_wait_seconds()
+        if wait >= config.admission_max_wait_seconds():
+            return f"The tournament is busy, with the queue estimated to take {_minutes(wait)} to process."
+
+    return ""
+
+
+def _minutes(seconds: float) -> str:
+    """ A duration in whole minutes """
+    minutes = max(1, round(seconds / 60))
+    return f"{minutes} minute" + ("s" if minutes != 1 else "")
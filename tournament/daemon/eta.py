@@ -0,0 +1,169 @@
+"""
+Estimates of when queued submissions will be processed.
+
+The daemon keeps a cost model of how long submissions take in paths.COST_MODEL_FILE, updated after each submission
+it tests: an exponentially weighted moving average of the time taken per tester/testee pair, of the time taken to
+publish the results of a submission, and of the time taken to generate tests for a submission on the server. Recent
+submissions are weighted most heavily, so the model follows changes in load and in the cost of the assignment.
+
+A submission needs a pair tested for each other submitter in the tournament, once for its tests and once for its
+progs. The queue is estimated in the order the daemon processes it (see fs_queue.get_queue), starting from the
+estimated completion of the submission currently being processed.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from tournament.daemon import fs_queue
+from tournament.flags import get_flag, SubmissionFlag
+from tournament.util import FilePath, Submitter, format as fmt, paths, write_atomic
+
+# The weight of the latest submission in each moving average
+EWMA_WEIGHT = 0.3
+
+# The model used before any submissions have been recorded
+DEFAULT_COST_MODEL = {
+    'seconds_per_pair': 2.0,
+    'overhead_seconds': 10.0,
+    'generation_seconds': 0.0,
+    'submissions_recorded': 0,
+    # the submission being processed: {submitter, started, estimated_seconds}
+    'processing': None
+}
+
+# The daemon records test generation from several threads, alongside the submissions it processes
+_model_lock = threading.Lock()
+
+
+def get_cost_model() -> dict:
+    """ The current cost model. Fields missing from the file take their default values """
+    if not os.path.isfile(paths.COST_MODEL_FILE):
+        return dict(DEFAULT_COST_MODEL)
+    return {**DEFAULT_COST_MODEL, **json.load(open(paths.COST_MODEL_FILE, 'r'))}
+
+
+def _write_cost_model(model: dict):
+    """ Write the cost model. Only called by the daemon, holding _model_lock """
+    write_atomic(paths.COST_MODEL_FILE, json.dumps(model, indent=4, sort_keys=True).encode())
+
+
+def _moving_average(average: float, latest: float) -> float:
+    """ Add the latest value to an exponentially weighted moving average """
+    return EWMA_WEIGHT * latest + (1 - EWMA_WEIGHT) * average
+
+
+def _tourney_entries() -> [str]:
+    """ The submitters with an entry in the tournament """
+    return [entry for entry in os.listdir(paths.TOURNEY_DIR) if not entry.startswith(".")]
+
+
+def count_pairs(submitter: Submitter, tourney_entries: [str] = None) -> int:
+    """ The number of tester/testee pairs a submission from the submitter needs tested """
+    tourney_entries = _tourney_entries() if tourney_entries is None else tourney_entries
+    return 2 * len([entry for entry in tourney_entries if entry != submitter])
+
+
+def estimate_seconds(model: dict, num_pairs: int) -> float:
+    """ The estimated time to process a submission with num_pairs pairs to test """
+    return model['overhead_seconds'] + model['seconds_per_pair'] * num_pairs
+
+
+def record_start(submitter: Submitter, num_pairs: int):
+    """ Record that the daemon has started testing a submission """
+    with _model_lock:
+        model = get_cost_model()
+        model['processing'] = {'submitter': submitter, 'started': time.time(),
+                               'estimated_seconds': estimate_seconds(model, num_pairs)}
+        _write_cost_model(model)
+
+
+def record_submission(num_pairs: int, test_seconds: float, overhead_seconds: float):
+    """
+    Record how long the daemon took to process a submission
+    :param num_pairs: the number of tester/testee pairs the submission had tested
+    :param test_seconds: how long testing the pairs took
+    :param overhead_seconds: how long the rest of processing the submission took, e.g. publishing its results
+    """
+    with _model_lock:
+        model = get_cost_model()
+        if num_pairs:
+            model['seconds_per_pair'] = _moving_average(model['seconds_per_pair'], test_seconds / num_pairs)
+        model['overhead_seconds'] = _moving_average(model['overhead_seconds'], overhead_seconds)
+        model['submissions_recorded'] += 1
+        model['processing'] = None
+        _write_cost_model(model)
+
+
+def record_generation(seconds: float):
+    """ Record how long the daemon took to generate the tests of a submission """
+    with _model_lock:
+        model = get_cost_model()
+        model['generation_seconds'] = _moving_average(model['generation_seconds'], seconds)
+        _write_cost_model(model)
+
+
+def _queue_times() -> List[Tuple[Submitter, datetime, float, float]]:
+    """
+    Estimate when each queued submission will start being tested, and when its results will be published
+    :return: the submitter, submission time, estimated start and estimated completion of each queued submission, in
+    the order they will be processed
+    """
+    model = get_cost_model()
+    now = time.time()
+
+    # the submission currently being processed finishes no earlier than now, even if it is taking longer than estimated
+    processing = model['processing']
+    queue_time = now if processing is None else max(now, processing['started'] + processing['estimated_seconds'])
+
+    tourney_entries = _tourney_entries()
+    times = []
+    for file_path in fs_queue.get_queue():
+        (submitter, submission_time) = fs_queue.get_submission_request_details(FilePath(file_path))
+        start = queue_time
+        if get_flag(SubmissionFlag.AWAITING_GENERATION, file_path):
+            # submissions are tested once their tests are generated, which runs alongside the rest of the queue
+            start = max(start, submission_time.timestamp() + model['generation_seconds'])
+        queue_time = start + estimate_seconds(model, count_pairs(submitter, tourney_entries))
+        times.append((submitter, submission_time, start, queue_time))
+    return times
+
+
+def estimate_queue() -> List[dict]:
+    """
+    Estimate when each queued submission will start being tested, and when its results will be published
+    :return: the estimate for each queued submission, in the order they will be processed
+    """
+    return [{'position': position,
+             'submitter': submitter,
+             'submission_date': submission_time.strftime(fmt.DATETIME_TRACE_STRING),
+             'estimated_start': _date(start),
+             'estimated_completion': _date(completion)}
+            for (position, (submitter, submission_time, start, completion)) in enumerate(_queue_times(), start=1)]
+
+
+def estimate_wait_seconds() -> float:
+    """ The estimated time until every queued submission has been processed """
+    times = _queue_times()
+    return max(0.0, times[-1][3] - time.time()) if times else 0.0
+
+
+def estimate_submission(submitter: Submitter) -> Optional[dict]:
+    """ The estimate for a submitters queued submission, or None if they don't have one queued """
+    return next((estimate for estimate in estimate_queue() if estimate['submitter'] == submitter), None)
+
+
+def describe_estimate(submitter: Submitter) -> str:
+    """ A description of when a submitters queued submission will be processed, for the submitter """
+    estimate = estimate_submission(submitter)
+    if estimate is None:
+        return "Your submission has already been taken from the queue for processing."
+    return f"Your submission is number {estimate['position']} in the queue. It is estimated to start being tested " \
+           f"at {estimate['estimated_start']}, with results published by {estimate['estimated_completion']}."
+
+
+def _date(timestamp: float) -> str:
+    """ A timestamp in the format of tournament traces """
+    return datetime.fromtimestamp(timestamp).strftime(fmt.DATETIME_TRACE_STRING)
@@ -1,12 +1,14 @@
 """
 Submissions ready to be processed are placed into paths.STAGED_DIR and their details are encoded in their file names
-in the file system. The tournament daemon will then pop from this queue by the oldest submission and process it.
+in the file system. The tournament daemon will then pop from this queue by the oldest submission and process it, with
+submissions admitted at a low priority (see admission.py) only processed once no others are queued.
 """
 import os
 import subprocess
 from datetime import datetime
 
 from tournament.flags import get_flag, set_flag, SubmissionFlag
+from tournament.reporting import leaderboard
 from tournament.util import FilePath, Submitter, Result
 from tournament.util import format as fmt, paths, print_tourney_trace
 
@@ -18,11 +20,39 @@ def get_next_request() -> FilePath:
     Pop the next submission to process in paths.STAGED_DIR
     :return: the file path of the next submission to process
     """
-    # get files ordered by creation date
-    submissions = [file for file in sorted(os.scandir(paths.STAGING_DIR), key=lambda folder: folder.stat().st_mtime)
-                   if file.name != ".gitignore"]
+    # submissions whose tests are still being generated aren't ready to process
+    submissions = [file_path for file_path in get_queue()
+                   if not get_flag(SubmissionFlag.AWAITING_GENERATION, file_path)]
 
-    return submissions[0].name if submissions else FilePath("")
+    return FilePath(os.path.basename(submissions[0])) if submissions else FilePath("")
+
+
+def get_awaiting_generation() -> [FilePath]:
+    """
+    Get the submissions in paths.STAGED_DIR that need their tests generated before they can be processed
+    :return: the file paths of the submissions, in the order they will be processed
+    """
+    return [file_path for file_path in get_queue()
+            if is_submission(file_path) and get_flag(SubmissionFlag.AWAITING_GENERATION, file_path)]
+
+
+def get_queue() -> [FilePath]:
+    """
+    Get all submissions in paths.STAGED_DIR, including those still being copied or awaiting test generation.
+    This is the order submissions are processed in, and is shared by everything that reports on the queue
+    :return: the file paths of the submissions, in the order they will be processed
+    """
+    submissions = []
+    for file in os.scandir(paths.STAGING_DIR):
+        # the daemon removes submissions while others read the queue, so skip any that disappear during the scan
+        if not file.name.startswith(SUBMISSION_REQUEST_PREFIX) or not os.path.isdir(file.path):
+            continue
+        # ordered by the submission time in the name, as setting or clearing flags changes the directory's mtime
+        (_, submission_time) = get_submission_request_details(FilePath(file.path))
+        low_priority = bool(get_flag(SubmissionFlag.LOW_PRIORITY, file.path))
+        submissions.append((low_priority, submission_time, FilePath(file.path)))
+
+    return [file_path for (_, _, file_path) in sorted(submissions)]
 
 
 def _remove_previous_occurrences(submitter: Submitter):
@@ -74,16 +104,29 @@ def get_submission_request_details(file_path: FilePath) -> (Submitter, datetime)
     return submitter, submission_time
 
 
-def queue_submission(submitter: Submitter, submission_time: datetime) -> Result:
-    """ Create a submission for a submitter in the paths.STAGED_DIR """
+def queue_submission(submitter: Submitter, submission_time: datetime, awaiting_generation: bool = False,
+                     low_priority: bool = False) -> Result:
+    """
+    Create a submission for a submitter in the paths.STAGED_DIR
+    :param submitter: the submitter making the submission
+    :param submission_time: the time of the submission
+    :param awaiting_generation: the submissions tests must be generated by the tournament before it can be processed
+    :param low_priority: the submission is processed after every submission at normal priority
+    """
 
     pre_val_dir = paths.get_pre_validation_dir(submitter)
 
     staged_dir = f"{paths.STAGING_DIR}/{_create_submission_request_name(submitter, submission_time)}"
     _remove_previous_occurrences(submitter)
     subprocess.run(f"mv {pre_val_dir} {staged_dir}", shell=True, check=True)
+    if awaiting_generation:
+        set_flag(SubmissionFlag.AWAITING_GENERATION, True, staged_dir)
+    if low_priority:
+        set_flag(SubmissionFlag.LOW_PRIORITY, True, staged_dir)
     set_flag(SubmissionFlag.SUBMISSION_READY, True, staged_dir)
+    leaderboard.publish()
 
-    trace = f"Submission successfully made by {submitter} at {submission_time.strftime(fmt.DATETIME_TRACE_STRING)}"
+    trace = f"Submission successfully made by {submitter} at {submission_time.strftime(fmt.DATETIME_TRACE_STRING)}" + \
+            (" at a low priority" if low_priority else "")
     print_tourney_trace(trace)
     return Result(True, trace)
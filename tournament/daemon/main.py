@@ -2,19 +2,24 @@
 Submissions are made to the tournament asynchronously by placing them in the paths.STAGED_DIR
 folder. These are then popped by the tournament daemon, oldest timestamp first, and processed in the tournament.
 """
+import os
 import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from multiprocessing import Pool, current_process, Value
 from time import sleep, time
+from typing import Dict
 import traceback
 
 from tournament import processing as tourney
-from tournament.config import AssignmentConfig
-from tournament.daemon import fs_queue
-from tournament.flags import get_flag, set_flag, TourneyFlag
-from tournament.processing import TourneySnapshot
-from tournament.util import FilePath, Result
-from tournament.util import paths, format as fmt, print_tourney_trace, print_tourney_error
+from tournament.config import AssignmentConfig, ProcessingConfig
+from tournament.daemon import eta, fs_queue
+from tournament.flags import get_flag, set_flag, SubmissionFlag, TourneyFlag
+from tournament.processing import TourneySnapshot, TourneyState
+from tournament.reporting import leaderboard
+from tournament.util import FilePath, Result, Submitter
+from tournament.util import paths, format as fmt, metrics, print_tourney_trace, print_tourney_error, scratch, \
+    status_board
 
 
 def _set_process_name(counter):
@@ -36,19 +41,116 @@ def _process_submission_request(file_path, pool):
     tourney_dest = paths.get_tourney_dir(submitter)
 
     assg = AssignmentConfig().get_assignment()
+
+    if os.path.isdir(tourney_dest) and assg.get_fingerprint(staged_dir) == assg.get_fingerprint(tourney_dest):
+        # identical to the submitters current tourney entry, so all of its results still stand
+        subprocess.run(f"rm -rf {staged_dir}", shell=True, check=True)
+        _record_unchanged_submission(submitter, submission_time)
+        metrics.record_submission("unchanged")
+        return
+
+    if os.path.isfile(f"{staged_dir}/{paths.CACHED_VERDICT_FILE}"):
+        # the submission skipped validation, but the tourney entry it matched has since been replaced. It is a copy of
+        # that entry, compiled and validated, so is processed as any other submission would be
+        if not os.path.isfile(f"{staged_dir}/{paths.NUM_TESTS_FILE}"):
+            # queued by an earlier version of the tournament, which didn't copy the entry
+            print_tourney_error(f"Submission from {submitter} reused the validation of a tourney entry that has "
+                                f"since been replaced, and can't be installed without it. Discarding the submission")
+            subprocess.run(f"rm -rf {staged_dir}", shell=True, check=True)
+            leaderboard.publish()
+            metrics.record_submission("discarded")
+            return
+        print_tourney_trace(f"Submission from {submitter} matched a tourney entry that has since been replaced. "
+                            f"Reinstating the entry")
+        os.remove(f"{staged_dir}/{paths.CACHED_VERDICT_FILE}")
+
     new_tests = assg.detect_new_tests(staged_dir, FilePath(tourney_dest))
     new_progs = assg.detect_new_progs(staged_dir, FilePath(tourney_dest))
 
     subprocess.run(f"rm -rf {tourney_dest}", shell=True, check=True)
     subprocess.run(f"mv {staged_dir} {tourney_dest}", shell=True, check=True)
+    scratch.release(submitter)
+    # the submission has left the queue
+    leaderboard.publish()
+
+    num_pairs = eta.count_pairs(submitter)
+    eta.record_start(submitter, num_pairs)
 
     time_start = time()
     tourney.run_submission(submitter, submission_time.strftime(fmt.DATETIME_TRACE_STRING), new_tests, new_progs, pool)
     time_end = time()
+    metrics.record_submission("tested", time_end - time_start)
 
     snapshot = TourneySnapshot(report_time=submission_time)
     snapshot.set_time_to_process_last_submission(int(time_end - time_start))
+    time_computed = time()
+    snapshot.write_snapshot()
+    snapshot.update_results_db([submitter])
+    metrics.record_snapshot(time_computed - time_end, time() - time_computed)
+    eta.record_submission(num_pairs, time_end - time_start, time() - time_end)
+
+
+def _record_unchanged_submission(submitter: Submitter, submission_time: datetime):
+    """
+    Record a submission that is identical to the submitters tourney entry. Only the date of the submitters latest
+    submission changes, so the tournament state and snapshot are updated in place rather than recomputed
+    """
+    submission_date = submission_time.strftime(fmt.DATETIME_TRACE_STRING)
+    print_tourney_trace(f"Submission from {submitter} is unchanged from their previous submission. "
+                        f"Updating submission date only")
+
+    tourney_state = TourneyState()
+    tourney_state.set_time_of_submission(submitter, submission_date)
+    tourney_state.save_to_file()
+
+    snapshot = TourneySnapshot(snapshot_file=paths.RESULTS_FILE)
+    snapshot.set_latest_submission_date(submitter, submission_date)
     snapshot.write_snapshot()
+    snapshot.update_results_db([])
+
+
+def _generate_tests(staged_dir: FilePath):
+    """
+    Generate the tests for a queued submission, then release it to be processed by the tournament.
+    Runs in the background while the daemon processes other submissions
+    """
+    (submitter, _) = fs_queue.get_submission_request_details(staged_dir)
+    print_tourney_trace(f"Generating tests for submission from {submitter}")
+
+    time_start = time()
+    try:
+        result = AssignmentConfig().get_assignment().generate_tests(staged_dir)
+    except Exception as exception:  # pylint: disable=broad-except
+        if not os.path.isdir(staged_dir):
+            # the submission was replaced by a newer submission from the same submitter
+            print_tourney_trace(f"Submission {os.path.basename(staged_dir)} was replaced while generating its tests")
+            return
+        result = Result(False, f"Exception caught while generating tests: {exception}\n{traceback.format_exc()}")
+
+    if result:
+        print_tourney_trace(f"Tests generated for submission from {submitter}. {result.traces}")
+        eta.record_generation(time() - time_start)
+    else:
+        print_tourney_error(f"Unable to generate tests for submission from {submitter}, using the tests generated "
+                            f"during validation.\n{result.traces}")
+
+    if os.path.isdir(staged_dir):
+        set_flag(SubmissionFlag.AWAITING_GENERATION, False, staged_dir)
+
+
+def _schedule_test_generation(generator: ThreadPoolExecutor, generation_jobs: Dict[FilePath, Future]):
+    """
+    Start generating tests for any queued submissions that need them.
+    :param generator: the executor to run test generation in. Its size limits how many submissions are generated at once
+    :param generation_jobs: the currently scheduled jobs, by submission
+    """
+    for (staged_dir, job) in list(generation_jobs.items()):
+        if job.done():
+            del generation_jobs[staged_dir]
+
+    for staged_dir in fs_queue.get_awaiting_generation():
+        if staged_dir not in generation_jobs:
+            generation_jobs[staged_dir] = generator.submit(_generate_tests, staged_dir)
 
 
 def is_alive() -> Result:
@@ -93,14 +195,24 @@ def main():
     print_tourney_trace("TourneyDaemon started...")
 
     # Thread pool for parallel processing. initargs contains a concurrency safe counter, used by set_process_name
-    pool = Pool(initializer=_set_process_name, initargs=(Value('i', 0, lock=True),))
+    num_processes = os.cpu_count() or 1
+    metrics.reset(num_processes)
+    status_board.create(os.getpid())
+    pool = Pool(processes=num_processes, initializer=_set_process_name, initargs=(Value('i', 0, lock=True),))
+
+    # Tests that are generated on the server are generated in the background, separately to the processing pool
+    generator = ThreadPoolExecutor(max_workers=ProcessingConfig().fuzz_generation_workers())
+    generation_jobs = {}
 
     try:
         set_flag(TourneyFlag.ALIVE, True)
         set_flag(TourneyFlag.SHUTDOWN, False)
 
-        # Create a snapshot file on startup
-        TourneySnapshot(report_time=datetime.now()).write_snapshot()
+        # Create a snapshot file on startup, and rebuild the results database from it in case the list of approved
+        # submitters has changed
+        snapshot = TourneySnapshot(report_time=datetime.now())
+        snapshot.write_snapshot()
+        snapshot.update_results_db()
 
         while not get_flag(TourneyFlag.SHUTDOWN):
 
@@ -108,6 +220,7 @@ def main():
                 # In the event of an uncaught crash the ALIVE flag can be manually deleted to kill the tournament
                 break
 
+            _schedule_test_generation(generator, generation_jobs)
             next_submission_to_process = fs_queue.get_next_request()
 
             if next_submission_to_process:
@@ -118,6 +231,9 @@ def main():
                     # submission is present in the staged folder, but has not finished being copied across
                     print_tourney_trace(f"Request present but not valid: {next_submission_to_process}")
                     sleep(5)
+            elif generation_jobs:
+                # check back soon, so that submissions are processed shortly after their tests are generated
+                sleep(5)
             else:
                 print_tourney_trace("Nothing to process")
                 sleep(60)
@@ -127,7 +243,11 @@ def main():
         print_tourney_error(traceback.format_exc())
         # emailer.email_crash_report()
 
-    # shutdown hook
+    # shutdown hook. Test generation that has already started is allowed to finish
+    for job in generation_jobs.values():
+        job.cancel()
+    generator.shutdown(wait=True)
+    status_board.remove()
     print_tourney_trace("TourneyDaemon shutting down.")
     set_flag(TourneyFlag.ALIVE, False)
 
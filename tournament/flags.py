@@ -1,7 +1,6 @@
 """
 The TourneyDaemon handles state via flags in the file system. If a file is present the flag is considered to be true
 """
-import os
 import subprocess
 from enum import Enum
 
@@ -32,12 +31,16 @@ class SubmissionFlag(Flag):
         .tests_valid: the submission has passed the 'validate_tests' stage
         .progs_valid: the submission has passed the 'validate_progs' stage
         .ready: the submission code is ready to be copied
+        .awaiting_generation: the submission is queued, but its tests are still being generated on the server
+        .low_priority: the submission is queued, but is processed after every submission at normal priority
     """
     ELIG = ".elig"
     COMPILED = ".compiled"
     TESTS_VALID = ".tests_valid"
     PROGS_VALID = ".progs_valid"
     SUBMISSION_READY = ".submission_ready"
+    AWAITING_GENERATION = ".awaiting_generation"
+    LOW_PRIORITY = ".low_priority"
 
 
 def set_flag(flag: Flag, true: bool, submission: str = None, contents: str = ""):
@@ -65,9 +68,11 @@ def get_flag(flag: Flag, submission: str = None) -> Result:
     :param submission: the path of the submission to write the flag in, if applicable
     """
     flag_path = flag.value if not submission else f"{submission}/{flag.value}"
-    if os.path.exists(flag_path):
-        return Result(True, open(flag_path, 'r').read().strip())
-    else:
+    try:
+        with open(flag_path, 'r') as flag_file:
+            return Result(True, flag_file.read().strip())
+    except (FileNotFoundError, NotADirectoryError):
+        # including a submission that was removed while its flags were read
         return Result(False, "")
 
 
@@ -8,8 +8,8 @@ from tournament import config as cfg
 from tournament import flags, daemon
 from tournament import processing as tourney
 from tournament.config import ApprovedSubmitters
-from tournament.reporting import results_server
-from tournament.util import paths, Result
+from tournament.reporting import results_server, top as top_view
+from tournament.util import paths, Result, scratch
 
 
 def start_tournament() -> Result:
@@ -31,6 +31,11 @@ def shutdown(message: str = "") -> Result:
     return daemon.shutdown(message)
 
 
+def top(interval: float, once: bool = False) -> Result:
+    """ Show a refreshing view of what the tournament daemon is processing """
+    return top_view.run(interval, once)
+
+
 def clean() -> Result:
     """ Remove all submissions, config files, and state from the tournament """
     result = daemon.is_alive()
@@ -42,6 +47,12 @@ def clean() -> Result:
     subprocess.run(f"rm -f  {paths.STATE_DIR}/**.json", shell=True, check=True)
     subprocess.run(f"rm -f  {paths.STATE_DIR}/**/*.json", shell=True, check=True)
     subprocess.run(f"rm -f  {paths.DIFF_FILE}", shell=True, check=True)
+    # read models and published copies of the results, and test stages built from the previous source assignment
+    subprocess.run(f"rm -f  {paths.RESULTS_DB_FILE} {paths.RESULTS_DB_FILE}-wal {paths.RESULTS_DB_FILE}-shm",
+                   shell=True, check=True)
+    subprocess.run(f"rm -f  {paths.LEADERBOARD_HTML_FILE} {paths.LEADERBOARD_HTML_FILE}.gz "
+                   f"{paths.LEADERBOARD_JSON_FILE}.gz", shell=True, check=True)
+    scratch.clear()
     flags.clear_all_flags()
 
     return Result(True, "All submissions and tournament results have been deleted")
@@ -2,19 +2,24 @@
 The core functions used for running the tournament
 """
 import csv
+import hashlib
 import json
+import math
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import partial
 from multiprocessing import current_process, Pool
+from time import time
 from typing import Tuple
 
-from tournament.config import AssignmentConfig
+from tournament.config import AssignmentConfig, ProcessingConfig
+from tournament.config.assignments import AbstractAssignment
 from tournament.processing.tourney_snapshot import TourneySnapshot
 from tournament.processing.tourney_state import TourneyState
-from tournament.util import Prog, Result, Submitter, Test, TestSet
-from tournament.util import paths, print_tourney_trace
+from tournament.util import FilePath, Prog, Result, Submitter, Test, TestSet
+from tournament.util import manifest, metrics, paths, print_tourney_trace, scratch, status_board
 
 
 def run_submission(submitter: Submitter, submission_time: str, new_tests: [Test], new_progs: [Prog], pool: Pool):
@@ -45,62 +50,176 @@ def run_submission(submitter: Submitter, submission_time: str, new_tests: [Test]
     rt_new_tests = partial(run_tests, tourney_state=tourney_state, new_tests=new_tests, new_progs=[])
     rt_new_progs = partial(run_tests, tourney_state=tourney_state, new_tests=[], new_progs=new_progs)
 
+    # pairs are handed to workers in batches so that each worker can prepare its next pair while testing the current
+    num_workers = os.cpu_count() or 1
+    status_board.set_submission(submitter, 2 * len(other_submitters))
+
     # run submitter tests against others progs
-    tester_results = pool.map(rt_new_tests, [(submitter, other) for other in other_submitters])
+    tester_batches = _batch_pairs([(submitter, other) for other in other_submitters], num_workers)
+    tester_results = pool.map(rt_new_tests, tester_batches)
 
     # run others tests against submitters progs
-    testee_results = pool.map(rt_new_progs, [(other, submitter) for other in other_submitters])
-
-    for (tester, testee, test_set) in tester_results + testee_results:
-        tourney_state.set(tester, testee, test_set)
+    testee_batches = _batch_pairs([(other, submitter) for other in other_submitters], num_workers)
+    testee_results = pool.map(rt_new_progs, testee_batches)
+
+    stats = {'pairs': 0, 'prep_seconds': 0.0, 'stall_seconds': 0.0, 'cells': 0, 'early_exits': 0}
+    for (batch_results, batch_stats) in tester_results + testee_results:
+        for (tester, testee, test_set) in batch_results:
+            tourney_state.set(tester, testee, test_set)
+        for stat in stats:
+            stats[stat] += batch_stats[stat]
+
+    if stats['pairs']:
+        print_tourney_trace(f"\tStage preparation: {stats['pairs']} pairs, "
+                            f"{1000 * stats['prep_seconds'] / stats['pairs']:.1f}ms average preparation, "
+                            f"{stats['stall_seconds']:.3f}s spent waiting on preparation")
+    if stats['cells']:
+        print_tourney_trace(f"\tTest runs: {stats['cells']} run, "
+                            f"{100 * stats['early_exits'] / stats['cells']:.1f}% stopped early at the first failure")
 
     print_tourney_trace(f"Submission from {submitter} tested")
+    status_board.clear_submission()
     tourney_state.save_to_file()
 
 
-def run_tests(pair: Tuple[Submitter, Submitter], tourney_state: TourneyState, new_tests: [Test], new_progs: [Prog]
-              ) -> [Submitter, Submitter, TestSet]:
+def _batch_pairs(pairs: [Tuple[Submitter, Submitter]], num_workers: int) -> [[Tuple[Submitter, Submitter]]]:
+    """ Split tester/testee pairs into contiguous batches, roughly four per worker as multiprocessing.Pool.map does """
+    batch_size = max(1, math.ceil(len(pairs) / (num_workers * 4)))
+    return [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+
+
+# The fingerprint of each source assignment, computed once per process
+_source_fingerprints = {}
+
+
+def _get_source_fingerprint(assg: AbstractAssignment) -> str:
+    """ A hash of every file in the source assignment """
+    source_assg_dir = assg.get_source_assg_dir()
+    if source_assg_dir not in _source_fingerprints:
+        hashes = manifest.hash_tree(source_assg_dir, "")
+        _source_fingerprints[source_assg_dir] = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()
+    return _source_fingerprints[source_assg_dir]
+
+
+def _get_test_stage(assg: AbstractAssignment, buffer: int) -> FilePath:
+    """
+    Get one of the current processes persistent test stages, creating it from the source assignment if this is the
+    first time it has been used, or rebuilding it if it was created from a different version of the source assignment
     """
-    Provided a tester/testee pair, run the testers tests against the testees programs.
+    test_stage_dir = scratch.get_stage_dir(current_process().name, buffer)
+    fingerprint_file = f"{test_stage_dir}/{paths.STAGE_FINGERPRINT_FILE}"
+    fingerprint = _get_source_fingerprint(assg)
+
+    if os.path.isdir(test_stage_dir):
+        try:
+            with open(fingerprint_file, 'r') as file:
+                if file.read() == fingerprint:
+                    return test_stage_dir
+        except FileNotFoundError:
+            pass
+        subprocess.run(f"rm -rf {test_stage_dir}", shell=True, check=True)
+
+    os.makedirs(os.path.dirname(test_stage_dir), exist_ok=True)
+    subprocess.run(f"cp -rf {assg.get_source_assg_dir()} {test_stage_dir}", shell=True, check=True)
+    with open(fingerprint_file, 'w') as file:
+        file.write(fingerprint)
+
+    return test_stage_dir
+
+
+def _prep_test_stage(assg: AbstractAssignment, pair: Tuple[Submitter, Submitter], test_stage_dir: FilePath) -> float:
+    """ Prepare a test stage for a tester/testee pair, returning how long the preparation took """
+    time_start = time()
+    (tester, testee) = pair
+    assg.prep_test_stage(tester, testee, test_stage_dir)
+    return time() - time_start
+
+
+def run_tests(pairs: [Tuple[Submitter, Submitter]], tourney_state: TourneyState, new_tests: [Test],
+              new_progs: [Prog]) -> ([Tuple[Submitter, Submitter, TestSet]], dict):
+    """
+    Provided a batch of tester/testee pairs, run the testers tests against the testees programs.
     If a test or a program is marked as new then run the test against the program, otherwise the values can be taken
-    from the existing tournament state
-    :param pair: the tester/testee pair
+    from the existing tournament state.
+    Two test stages are alternated between, while one pair is tested in one stage the next pair is prepared in the other
+    :param pairs: the tester/testee pairs
     :param tourney_state: the existing tournament state
     :param new_tests: the list of new tests that need to be run
     :param new_progs: the list of new programs that need to be tested
-    :return: (tester, testee, results of running all tests against all programs)
+    :return: [(tester, testee, results of running all tests against all programs)], and statistics on the batch
     """
 
     assg = AssignmentConfig().get_assignment()
-
-    # temporary trace file to help track the progress of the run_tests function on a per-thread basis
-    # it is overwritten on each new call to run_tests
-    trace_file = open(paths.get_head_to_head_log_file_path(current_process().name), 'w')
-
-    test_stage_dir = f"{paths.HEAD_TO_HEAD_DIR}/{current_process().name}"
-
-    if not os.path.isdir(test_stage_dir):
-        subprocess.run(f"cp -rf {assg.get_source_assg_dir()} {test_stage_dir}", shell=True, check=True)
-
-    (tester, testee) = pair
-
-    assg.prep_test_stage(tester, testee, test_stage_dir)
-    test_set = {}
-    for test in assg.get_test_list():
-        test_set[test] = {}
-        for prog in assg.get_programs_list():
-            trace_file.write(f"Comparing {tester}'s test {test} against {testee}'s program {prog}\n")
-            if test in new_tests or prog in new_progs:
-                trace_file.write("    Starting comparison\n")
-                test_set[test][prog], _ = assg.run_test(test, prog, test_stage_dir)
-                trace_file.write(f"    Completed. Result = {test_set[test][prog]}\n")
-            else:
-                # no need to rerun this test, keep the results from the current tournament state
-                test_set[test][prog] = tourney_state.get(tester, testee, test, prog)
-                trace_file.write("    Test and prog unchanged. Reusing prior value.\n")
-            trace_file.write("    Finished\n")
-
-    return tester, testee, test_set
+    test_stage_dirs = [_get_test_stage(assg, buffer) for buffer in [0, 1]]
+
+    results = []
+    stats = {'pairs': len(pairs), 'prep_seconds': 0.0, 'stall_seconds': 0.0, 'cells': 0, 'early_exits': 0}
+
+    if not pairs:
+        return results, stats
+
+    metrics.record_busy(True)
+
+    try:
+        # optional trace file to help track the progress of the run_tests function on a per-thread basis
+        # it is overwritten on each new call to run_tests. Progress is always published to the status board
+        trace_file_path = paths.get_head_to_head_log_file_path(current_process().name) \
+            if ProcessingConfig().head_to_head_traces() else os.devnull
+        with open(trace_file_path, 'w') as trace_file, \
+                ThreadPoolExecutor(max_workers=1) as prefetcher:
+
+            next_prep = prefetcher.submit(_prep_test_stage, assg, pairs[0], test_stage_dirs[0])
+
+            for (index, (tester, testee)) in enumerate(pairs):
+                test_stage_dir = test_stage_dirs[index % 2]
+
+                wait_start = time()
+                stats['prep_seconds'] += next_prep.result()
+                stats['stall_seconds'] += time() - wait_start
+
+                if index + 1 < len(pairs):
+                    next_stage_dir = test_stage_dirs[(index + 1) % 2]
+                    next_prep = prefetcher.submit(_prep_test_stage, assg, pairs[index + 1], next_stage_dir)
+
+                status_board.start_pair(tester, testee)
+                test_set = {}
+                reused_cells = 0
+                for test in assg.get_test_list():
+                    test_set[test] = {}
+                    for prog in assg.get_programs_list():
+                        trace_file.write(f"Comparing {tester}'s test {test} against {testee}'s program {prog}\n")
+                        if test in new_tests or prog in new_progs:
+                            trace_file.write("    Starting comparison\n")
+                            status_board.start_cell(test, prog)
+                            cell_start = time()
+                            # only the result is needed, so the test suite can stop as soon as it detects a bug
+                            test_set[test][prog], test_traces = assg.run_test(test, prog, test_stage_dir,
+                                                                              fail_fast=True)
+                            metrics.record_cell(test_set[test][prog], time() - cell_start)
+                            status_board.finish_cell()
+                            stats['cells'] += 1
+                            stats['early_exits'] += assg.exited_early(test_traces)
+                            trace_file.write(f"    Completed. Result = {test_set[test][prog]}\n")
+                        else:
+                            # no need to rerun this test, keep the results from the current tournament state
+                            test_set[test][prog] = tourney_state.get(tester, testee, test, prog)
+                            reused_cells += 1
+                            trace_file.write("    Test and prog unchanged. Reusing prior value.\n")
+                        trace_file.write("    Finished\n")
+
+                metrics.record_reused_cells(reused_cells)
+                status_board.finish_pair(reused_cells)
+                results.append((tester, testee, test_set))
+
+            trace_file.write(f"Batch of {len(pairs)} pairs: {stats['prep_seconds']:.3f}s preparing stages, "
+                             f"{stats['stall_seconds']:.3f}s waiting on preparation, "
+                             f"{stats['early_exits']}/{stats['cells']} test runs stopped early\n")
+    finally:
+        # an exception stops the worker testing, so it must not be left showing as busy
+        metrics.record_busy(False)
+        status_board.set_idle()
+
+    return results, stats
 
 
 def get_diffs() -> Result:
@@ -170,7 +289,9 @@ def rescore_invalid_progs() -> Result:
     # update tourney state and results
     parsing_results.traces += "Results updated. Recalculating submitter scores."
     tourney_state.save_to_file()
-    TourneySnapshot(report_time=datetime.now()).write_snapshot()
+    snapshot = TourneySnapshot(report_time=datetime.now())
+    snapshot.write_snapshot()
+    snapshot.update_results_db()
 
     return Result(True, f"{num_invalid_progs} invalid programs have had their score set to zero")
 
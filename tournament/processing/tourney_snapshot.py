@@ -7,10 +7,12 @@ import copy
 import csv
 import json
 from datetime import datetime
+from typing import List, Optional
 
 from tournament.config import AssignmentConfig
 from tournament.processing.tourney_state import TourneyState
-from tournament.util import FilePath
+from tournament.reporting import leaderboard, results_db
+from tournament.util import FilePath, Submitter, write_atomic
 from tournament.util import format as fmt
 from tournament.util import paths
 
@@ -52,6 +54,8 @@ class TourneySnapshot:
         """
 
         self.snapshot = TourneySnapshot.default_snapshot
+        # the tournament state the snapshot was computed from. None if the snapshot was read from file
+        self.tourney_state = None
 
         if snapshot_file is not None:
             self.snapshot = json.load(open(snapshot_file, 'r'))
@@ -63,8 +67,18 @@ class TourneySnapshot:
                                       "as an argument")
 
     def write_snapshot(self):
-        """ Write the snapshot to a json file """
-        json.dump(self.snapshot, open(paths.RESULTS_FILE, 'w'), indent=4, sort_keys=True)
+        """ Write the snapshot to a json file, and publish the leaderboard rendered from it """
+        write_atomic(paths.RESULTS_FILE, json.dumps(self.snapshot, indent=4, sort_keys=True).encode())
+        leaderboard.publish()
+
+    def update_results_db(self, changed_submitters: Optional[List[Submitter]] = None):
+        """
+        Update the results database with the snapshot
+        :param changed_submitters: the submitters whose head to head cells have changed since the last update, or None
+        if they all may have. Cells are left as they are for a snapshot read from file
+        """
+        state = None if self.tourney_state is None else self.tourney_state.get_state()
+        results_db.update(self.snapshot, state, changed_submitters)
 
     def write_csv(self):
         """
@@ -94,6 +108,7 @@ class TourneySnapshot:
         """
         tourney_state = TourneyState()
         assg = AssignmentConfig().get_assignment()
+        self.tourney_state = tourney_state
 
         self.snapshot['num_submitters'] = len(tourney_state.get_valid_submitters())
         self.snapshot['snapshot_date'] = report_time.strftime(fmt.DATETIME_TRACE_STRING)
@@ -159,6 +174,10 @@ class TourneySnapshot:
             new_score = round(results[submitter]['normalised_test_score'] * (2.5 / best_test_score), 2)
             results[submitter]['normalised_test_score'] = new_score
 
+    def set_latest_submission_date(self, submitter: Submitter, submission_date: str):
+        """ Update the date of a submitters latest submission without recomputing the snapshot """
+        self.snapshot['results'][submitter]['latest_submission_date'] = submission_date
+
     def set_time_to_process_last_submission(self, seconds: int):
         """ Set the time to process the last submission """
         self.snapshot['time_to_process_last_submission'] = seconds
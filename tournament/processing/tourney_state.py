@@ -9,7 +9,7 @@ from typing import Dict
 
 from tournament.config import ApprovedSubmitters, AssignmentConfig
 from tournament.util import Prog, Submitter, Test, TestResult, TestSet
-from tournament.util import paths
+from tournament.util import paths, write_atomic
 
 
 class TourneyState:
@@ -82,7 +82,7 @@ class TourneyState:
 
     def save_to_file(self):
         """ Write the state to paths.TOURNEY_STATE_FILE """
-        json.dump(self.state, open(paths.TOURNEY_STATE_FILE, 'w'), indent=4, sort_keys=True)
+        write_atomic(paths.TOURNEY_STATE_FILE, json.dumps(self.state, indent=4, sort_keys=True).encode())
 
     @staticmethod
     def create_default_testset() -> TestSet:
@@ -0,0 +1,364 @@
+"""
+An asyncio HTTP/1.1 server for the results server.
+
+All connections are served from a single event loop rather than a thread each, and connections are kept alive between
+requests. The number of connections served at once is bounded, each client ip is rate limited with a token bucket,
+and clients that are too slow to send a request or receive a response are disconnected.
+
+Requests are answered by a route function shared with the threaded server, which runs in a worker thread so that
+reading tournament files doesn't block the event loop.
+
+The server can also push server-sent events (text/event-stream). Subscribed connections are idle between events, so
+each one costs a coroutine and a socket rather than a thread, and thousands can be held open at once.
+"""
+import asyncio
+import threading
+import traceback
+from email.message import Message
+from email.parser import BytesHeaderParser
+from email.utils import formatdate
+from enum import Enum
+from http import HTTPStatus
+from time import monotonic
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from tournament.reporting.response import Response
+from tournament.util import print_tourney_error
+
+# The maximum size of the request line and headers of a request
+MAX_HEADER_BYTES = 16 * 1024
+
+# Clients whose token buckets have refilled are forgotten once this many clients are being tracked
+MAX_TRACKED_CLIENTS = 10000
+
+SERVER_NAME = "swen_tourney"
+
+# How often a comment is sent to idle event subscribers to keep their connections open
+EVENT_KEEP_ALIVE_SECONDS = 30
+
+# How long a client waits before reconnecting to the event stream after losing its connection
+EVENT_RETRY_SECONDS = 5
+
+
+class RateLimiter:
+    """ A token bucket for each client. Each request takes a token, and tokens are replaced at a fixed rate """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: the number of tokens added to each bucket per second
+        :param burst: the number of tokens each bucket holds
+        """
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def allow(self, client: str) -> bool:
+        """ Take a token from a client's bucket. Return whether there was one to take """
+        now = monotonic()
+        (tokens, last) = self.buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        allowed = tokens >= 1
+        self.buckets[client] = (tokens - 1 if allowed else tokens, now)
+
+        if len(self.buckets) > MAX_TRACKED_CLIENTS:
+            self.buckets = {client: (tokens, last) for (client, (tokens, last)) in self.buckets.items()
+                            if tokens + (now - last) * self.rate < self.burst}
+        return allowed
+
+
+class EventBroadcaster:
+    """
+    Pushes server-sent events to subscribed connections. The current event is found by polling, and is pushed to every
+    subscriber each time it changes. A subscriber that hasn't received an event yet only receives the latest one
+    """
+
+    def __init__(self, path: str, poll: Callable[[], Optional[str]], poll_seconds: float, max_subscribers: int):
+        """
+        :param path: the path clients request to subscribe to events
+        :param poll: returns the data of the current event, or None if there is no event
+        :param poll_seconds: how often to poll for a new event
+        :param max_subscribers: the maximum number of subscribers at once
+        """
+        self.path = path
+        self.poll = poll
+        self.poll_seconds = poll_seconds
+        self.max_subscribers = max_subscribers
+        self.current = None
+        self.subscribers = set()
+
+    def subscribe(self) -> Optional[asyncio.Queue]:
+        """ Subscribe to events. Return the queue events are pushed to, or None if there are too many subscribers """
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        queue = asyncio.Queue(maxsize=1)
+        if self.current is not None:
+            queue.put_nowait(self.current)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """ Stop pushing events to a subscriber """
+        self.subscribers.discard(queue)
+
+    async def run(self):
+        """ Poll for new events and push them to subscribers, until cancelled """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                event = await loop.run_in_executor(None, self.poll)
+            except Exception:  # pylint: disable=broad-except
+                print_tourney_error(f"Exception caught while polling for results server events\n"
+                                    f"{traceback.format_exc()}")
+                event = None
+
+            if event is not None and event != self.current:
+                self.current = event
+                for queue in self.subscribers:
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(event)
+
+            await asyncio.sleep(self.poll_seconds)
+
+
+class _Next(Enum):
+    """ What to do with a connection after answering a request """
+    CLOSE = 0
+    KEEP_ALIVE = 1
+    STREAM_EVENTS = 2
+
+
+class AsyncHTTPServer:
+    """
+    An HTTP/1.1 server run on an asyncio event loop. Like server.HTTPServer, serve_forever() blocks until shutdown()
+    is called from another thread
+    """
+
+    def __init__(self, server_address: Tuple[str, int], route: Callable, log: Callable, max_connections: int,
+                 rate_limiter: RateLimiter, client_timeout: float, keep_alive_timeout: float,
+                 events: EventBroadcaster = None):
+        """
+        :param server_address: the (host, port) to listen on
+        :param route: called with the method, path and headers of a request and returns a Response
+        :param log: called with the client address and request line of every request
+        :param max_connections: the maximum number of connections served at once
+        :param rate_limiter: limits the requests of each client
+        :param client_timeout: how long a client may take to send a request or receive a response
+        :param keep_alive_timeout: how long an idle connection is held open
+        :param events: server-sent events to provide, if any. Subscribed connections don't count towards
+        max_connections, as they are idle almost all of the time
+        """
+        self.server_address = server_address
+        self.route = route
+        self.log = log
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.client_timeout = client_timeout
+        self.keep_alive_timeout = keep_alive_timeout
+        self.events = events
+
+        self.loop = None
+        self.stop = None
+        self.connections = set()
+        self.started = threading.Event()
+        self.stopped = threading.Event()
+
+    def serve_forever(self):
+        """ Serve requests until shutdown() is called """
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.started.set()
+            self.stopped.set()
+
+    def shutdown(self):
+        """ Stop the server and wait for serve_forever() to return """
+        self.started.wait()
+        if self.loop is not None and not self.stopped.is_set():
+            self.loop.call_soon_threadsafe(self.stop.set)
+        self.stopped.wait()
+
+    async def _serve(self):
+        """ Accept connections until told to stop, then close all connections """
+        self.loop = asyncio.get_running_loop()
+        self.stop = asyncio.Event()
+        slots = asyncio.Semaphore(self.max_connections)
+
+        async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            self.connections.add(asyncio.current_task())
+            try:
+                await self._handle_connection(reader, writer, slots)
+            except asyncio.CancelledError:
+                # the server is shutting down
+                pass
+            finally:
+                self.connections.discard(asyncio.current_task())
+
+        (host, port) = self.server_address
+        async_server = await asyncio.start_server(on_connection, host or None, port, limit=MAX_HEADER_BYTES)
+        # the port actually listened on, as server.HTTPServer records it, if it was chosen by the system
+        self.server_address = async_server.sockets[0].getsockname()[:2]
+        broadcaster = asyncio.ensure_future(self.events.run()) if self.events is not None else None
+        self.started.set()
+
+        await self.stop.wait()
+
+        if broadcaster is not None:
+            broadcaster.cancel()
+        async_server.close()
+        for connection in list(self.connections):
+            connection.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await async_server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                 slots: asyncio.Semaphore):
+        """ Serve the requests made on a connection, once there is a free connection slot """
+        client = writer.get_extra_info('peername')[0]
+        try:
+            try:
+                await asyncio.wait_for(slots.acquire(), self.client_timeout)
+            except asyncio.TimeoutError:
+                await self._send(writer, Response(HTTPStatus.SERVICE_UNAVAILABLE, [('Retry-After', '5')]), False, True)
+                return
+
+            try:
+                timeout = self.client_timeout
+                next_step = _Next.KEEP_ALIVE
+                while next_step == _Next.KEEP_ALIVE:
+                    next_step = await self._handle_request(reader, writer, client, timeout)
+                    timeout = self.keep_alive_timeout
+            finally:
+                slots.release()
+
+            if next_step == _Next.STREAM_EVENTS:
+                await self._stream_events(reader, writer)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client: str,
+                              timeout: float) -> _Next:
+        """
+        Read and answer one request
+        :return: what to do with the connection next
+        """
+        request = await self._read_request(reader, timeout)
+        if request is None:
+            return _Next.CLOSE
+        (method, path, version, headers) = request
+
+        request_line = f"{method} {path} {version}"
+        self.log(client, request_line)
+
+        # bodies are never accepted, so a request with one ends the connection rather than its body being read
+        keep_alive = _keep_alive(version, headers) and not (headers.get('Content-Length', '0').strip() != '0' or
+                                                             headers.get('Transfer-Encoding'))
+
+        if not self.rate_limiter.allow(client):
+            await self._send(writer, Response(HTTPStatus.TOO_MANY_REQUESTS, [('Retry-After', '1')]), False, True)
+            return _Next.CLOSE
+
+        if self.events is not None and method == 'GET' and urlsplit(path).path == self.events.path:
+            return _Next.STREAM_EVENTS
+
+        try:
+            response = await self.loop.run_in_executor(None, self.route, method, path, headers)
+        except Exception:  # pylint: disable=broad-except
+            print_tourney_error(f"Exception caught while answering results server request {request_line}")
+            print_tourney_error(traceback.format_exc())
+            await self._send(writer, Response(HTTPStatus.INTERNAL_SERVER_ERROR), False, True)
+            return _Next.CLOSE
+
+        await self._send(writer, response, method == 'HEAD', not keep_alive)
+        return _Next.KEEP_ALIVE if keep_alive else _Next.CLOSE
+
+    async def _stream_events(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ Push server-sent events to a connection until the client disconnects or falls too far behind """
+        queue = self.events.subscribe()
+        if queue is None:
+            await self._send(writer, Response(HTTPStatus.SERVICE_UNAVAILABLE, [('Retry-After', '60')]), False, True)
+            return
+
+        # clients send nothing once subscribed, so anything read means the client has disconnected
+        disconnected = asyncio.ensure_future(reader.read(1))
+        next_event = None
+        try:
+            writer.write(("\r\n".join([f"HTTP/1.1 {HTTPStatus.OK.value} {HTTPStatus.OK.phrase}",
+                                        f"Server: {SERVER_NAME}",
+                                        f"Date: {formatdate(usegmt=True)}",
+                                        "Content-Type: text/event-stream",
+                                        "Cache-Control: no-cache",
+                                        "Connection: keep-alive"]) + "\r\n\r\n").encode('latin-1'))
+            writer.write(f"retry: {EVENT_RETRY_SECONDS * 1000}\n\n".encode())
+
+            while True:
+                await asyncio.wait_for(writer.drain(), self.client_timeout)
+                next_event = asyncio.ensure_future(queue.get())
+                (done, _) = await asyncio.wait([next_event, disconnected], timeout=EVENT_KEEP_ALIVE_SECONDS,
+                                               return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    return
+                if next_event in done:
+                    writer.write(f"event: update\ndata: {next_event.result()}\n\n".encode())
+                else:
+                    # lets the client, and any proxy in between, know the connection is still open
+                    writer.write(b": keep-alive\n\n")
+        finally:
+            for task in [disconnected, next_event]:
+                if task is not None:
+                    task.cancel()
+            self.events.unsubscribe(queue)
+
+    async def _read_request(self, reader: asyncio.StreamReader, timeout: float) \
+            -> Optional[Tuple[str, str, str, Message]]:
+        """
+        Read the request line and headers of a request
+        :return: the method, path, HTTP version and headers of the request, or None if no valid request was read
+        """
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+
+        (request_line, _, header_bytes) = head.partition(b"\r\n")
+        words = request_line.decode('latin-1').split()
+        if len(words) != 3 or not words[2].startswith("HTTP/1."):
+            return None
+
+        return words[0], words[1], words[2], BytesHeaderParser().parsebytes(header_bytes)
+
+    async def _send(self, writer: asyncio.StreamWriter, response: Response, head_only: bool, close: bool):
+        """ Send a response, waiting at most client_timeout for the client to receive it. Files are sent by sendfile """
+        try:
+            status = response.status
+            lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+                     f"Server: {SERVER_NAME}",
+                     f"Date: {formatdate(usegmt=True)}"]
+            lines += [f"{name}: {value}" for (name, value) in response.headers]
+            if status != HTTPStatus.NOT_MODIFIED and \
+                    'content-length' not in [name.lower() for (name, _) in response.headers]:
+                lines.append(f"Content-Length: {len(response.body)}")
+            lines.append(f"Connection: {'close' if close else 'keep-alive'}")
+
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+            if not head_only and status != HTTPStatus.NOT_MODIFIED:
+                if response.file is not None:
+                    await asyncio.wait_for(writer.drain(), self.client_timeout)
+                    await asyncio.wait_for(self.loop.sendfile(writer.transport, response.file), self.client_timeout)
+                else:
+                    writer.write(response.body)
+            await asyncio.wait_for(writer.drain(), self.client_timeout)
+        finally:
+            response.close()
+
+
+def _keep_alive(version: str, headers: Message) -> bool:
+    """ Whether the client wants the connection kept open after its request """
+    connection = (headers.get('Connection') or '').lower()
+    if version == "HTTP/1.0":
+        return connection == 'keep-alive'
+    return connection != 'close'
@@ -0,0 +1,211 @@
+"""
+The leaderboard is rendered once each time the tournament snapshot or the queue of submissions changes, rather than on
+every request to the results server. An HTML page and a JSON version of the leaderboard are published next to
+paths.RESULTS_FILE, along with gzip compressed copies, and the results server sends these files as they are.
+
+Files are published by renaming them into place, so the results server never sees a partially written file.
+Publishing is serialised between processes by a lock file, and always renders the snapshot currently on disk, so
+publishing from one process can't replace a newer leaderboard with an older one.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from tournament.config import AssignmentConfig
+from tournament.util import FilePath, format as fmt, paths, write_atomic
+
+# How often the page reloads itself in browsers without javascript
+NOSCRIPT_REFRESH_SECONDS = 60
+
+# How often the page checks for a new leaderboard in browsers without server-sent events
+POLL_SECONDS = 30
+
+# Keeps the leaderboard on the page up to date. The results server pushes an event with the version of the published
+# leaderboard whenever it changes, and the page then fetches itself and swaps in the new leaderboard. The fetch is
+# revalidated with the page's ETag, so it is cheap if nothing changed. Browsers without server-sent events, or whose
+# results server doesn't provide them, poll instead
+LIVE_UPDATE_SCRIPT = """
+(function () {
+    var leaderboard = document.getElementById('leaderboard');
+    if (!leaderboard || !window.fetch || !window.DOMParser) {
+        return;
+    }
+    function refresh() {
+        fetch(window.location.pathname, {cache: 'no-cache'}).then(function (response) {
+            return response.ok ? response.text() : null;
+        }).then(function (html) {
+            var latest = html && new DOMParser().parseFromString(html, 'text/html').getElementById('leaderboard');
+            if (latest && latest.getAttribute('data-version') !== leaderboard.getAttribute('data-version')) {
+                leaderboard.innerHTML = latest.innerHTML;
+                leaderboard.setAttribute('data-version', latest.getAttribute('data-version'));
+            }
+        }).catch(function () {});
+    }
+    function poll() {
+        setInterval(refresh, %d);
+    }
+    if (!window.EventSource) {
+        poll();
+        return;
+    }
+    var events = new EventSource('/events');
+    events.addEventListener('update', function (event) {
+        if (JSON.parse(event.data).version !== leaderboard.getAttribute('data-version')) {
+            refresh();
+        }
+    });
+    events.onerror = function () {
+        if (events.readyState === EventSource.CLOSED) {
+            poll();
+        }
+    };
+})();
+""" % (POLL_SECONDS * 1000)
+
+
+def publish():
+    """ Render the leaderboard from the current snapshot and queue of submissions, and publish it """
+    with open(paths.LEADERBOARD_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        if not os.path.exists(paths.RESULTS_FILE):
+            return
+
+        snapshot = json.load(open(paths.RESULTS_FILE, 'r'))
+        snapshot['queued_submissions'] = queued_submissions()
+        assg = AssignmentConfig().get_assignment()
+        (tests, progs) = (assg.get_test_list(), assg.get_programs_list())
+        leaderboard = ranked_leaderboard(snapshot)
+
+        leaderboard_json = _leaderboard_json(snapshot, leaderboard, tests, progs)
+        # identifies the published leaderboard, so that clients can tell whether their copy is current
+        version = hashlib.sha1(json.dumps(leaderboard_json, sort_keys=True).encode()).hexdigest()[:16]
+        leaderboard_json['version'] = version
+
+        _publish_file(paths.LEADERBOARD_JSON_FILE, json.dumps(leaderboard_json).encode())
+        _publish_file(paths.LEADERBOARD_HTML_FILE,
+                      _leaderboard_html(snapshot, leaderboard, tests, progs, version).encode())
+
+
+def _publish_file(file_path: FilePath, contents: bytes):
+    """ Publish a file and its gzip compressed copy. The copy is published first, so it is never older than the file """
+    write_atomic(f"{file_path}.gz", gzip.compress(contents))
+    write_atomic(file_path, contents)
+
+
+def queued_submissions() -> int:
+    """ The number of submissions waiting in the queue to be processed """
+    return len([file for file in os.listdir(paths.STAGING_DIR) if not file.startswith(".")])
+
+
+def ranked_leaderboard(snapshot: dict) -> [dict]:
+    """
+    Rank the submitters in a snapshot from best score to worst. Submitters with equal scores share a rank, and
+    submitters without a processed submission are unranked
+    :param snapshot: the contents of the snapshot file
+    :return: the leaderboard entry of each submitter, in rank order
+    """
+    results = snapshot['results']
+    scores = {submitter: float(results[submitter]['normalised_test_score']) +
+              float(results[submitter]['normalised_prog_score']) for submitter in results}
+
+    leaderboard = []
+    rank = 0
+    prev_score = -1
+
+    for submitter in sorted(results, key=lambda sub: scores[sub], reverse=True):
+        entry = {'rank': None,
+                 'name': submitter,
+                 'latest_submission_date': results[submitter]['latest_submission_date'],
+                 'score': scores[submitter],
+                 'tests': results[submitter]['tests'],
+                 'progs': results[submitter]['progs']}
+
+        if entry['latest_submission_date'] is not None:
+            if prev_score != scores[submitter]:
+                rank += 1
+                prev_score = scores[submitter]
+            entry['rank'] = rank
+        leaderboard.append(entry)
+
+    return leaderboard
+
+
+def _leaderboard_json(snapshot: dict, leaderboard: [dict], tests: [str], progs: [str]) -> dict:
+    """ The JSON version of the leaderboard """
+    num_submitters = snapshot['num_submitters']
+    return {'snapshot_date': snapshot['snapshot_date'],
+            'time_to_process_last_submission': snapshot['time_to_process_last_submission'],
+            'queued_submissions': snapshot['queued_submissions'],
+            'tests': sorted(tests),
+            'progs': sorted(progs),
+            'max_bugs_detected': 0 if num_submitters == 0 else (num_submitters - 1) * len(progs),
+            'max_tests_evaded': 0 if num_submitters == 0 else (num_submitters - 1) * len(tests),
+            'leaderboard': leaderboard}
+
+
+def _leaderboard_html(snapshot: dict, leaderboard: [dict], tests: [str], progs: [str], version: str) -> str:
+    """
+    The HTML page of the leaderboard. The leaderboard is updated in place by LIVE_UPDATE_SCRIPT, and the page reloads
+    itself in browsers without javascript
+    """
+    report_date = datetime.strptime(snapshot['snapshot_date'], fmt.DATETIME_TRACE_STRING)
+
+    return ''.join(['<!DOCTYPE html><html><head><noscript>',
+                    f'<meta http-equiv="refresh" content="{NOSCRIPT_REFRESH_SECONDS}">',
+                    '</noscript></head>',
+                    f'<body><div id="leaderboard" data-version="{version}">',
+                    '<h1>Results as of ', report_date.strftime(fmt.DATETIME_TRACE_STRING), '</h1>',
+                    _tournament_processing_details(snapshot),
+                    _html_table_from_results(snapshot, leaderboard, tests, progs),
+                    '</div><script>', LIVE_UPDATE_SCRIPT, '</script></body></html>'])
+
+
+def _tournament_processing_details(snapshot: dict) -> str:
+    """ Return a string with submissions still to process and the current submission processing duration """
+    return f"There are {snapshot['queued_submissions']} submissions awaiting processing.\n" + \
+           f"The most recent submission took {snapshot['time_to_process_last_submission']} seconds to process"
+
+
+def _html_table_from_results(snapshot: dict, leaderboard: [dict], tests: [str], progs: [str]) -> str:
+    """
+    Convert the ranked leaderboard to an HTML table of submitter results
+    :return: a string of an HTML table with submitter results
+    """
+    num_submitters = snapshot['num_submitters']
+    num_tests = 0 if num_submitters == 0 else (num_submitters - 1) * len(tests)
+    num_progs = 0 if num_submitters == 0 else (num_submitters - 1) * len(progs)
+
+    tests_header = f"<table><tr><th>Bugs detected (out of {num_progs})</th></tr>" + \
+                   f"<tr><td>{str(sorted(tests))}</tr></td></table>"
+    progs_header = f"<table><tr><th>Tests evaded (out of {num_tests})</th></tr>" + \
+                   f"<tr><td>{str(sorted(progs))}</tr></td></table>"
+
+    rows = ['<table style="width:100%" align="center">',
+            _table_header("Rank", "Name", "Date of submission", tests_header, progs_header)]
+
+    for entry in leaderboard:
+        if entry['rank'] is None:
+            rows.append(_table_row("-", entry['name'], "No submission", "N/A", "N/A"))
+        else:
+            latest_submission_date = datetime.strptime(entry['latest_submission_date'], fmt.DATETIME_TRACE_STRING)
+            test_scores = [entry['tests'][test] for test in sorted(entry['tests'])]
+            prog_scores = [entry['progs'][prog] for prog in sorted(entry['progs'])]
+            rows.append(_table_row(entry['rank'], entry['name'], latest_submission_date.strftime(
+                fmt.DATETIME_TRACE_STRING), test_scores, prog_scores))
+
+    rows.append('</table>')
+    return ''.join(rows)
+
+
+def _table_header(*args) -> str:
+    """ Return an HTML table header string. The size of the row depends on the number of values in *args """
+    return '<tr>' + ''.join(['<th align="center">' + str(col) + '</th>' for col in args]) + '<tr>'
+
+
+def _table_row(*args) -> str:
+    """ Return an HTML table row string. The size of the row depends on the number of values in *args """
+    return '<tr>' + ''.join(['<td align="center">' + str(col) + '</td>' for col in args]) + '<tr>'
@@ -0,0 +1,128 @@
+"""
+Responses of the results server, independent of whether they are sent by the threaded or the asyncio server
+"""
+import gzip
+import hashlib
+import html
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus, server
+from typing import BinaryIO, Tuple
+
+from tournament.util import FilePath
+
+# Smaller responses are sent uncompressed, as compression would save little
+GZIP_MIN_BYTES = 1024
+
+
+class Response:
+    """ A response to an HTTP request. The body is either bytes, or a file that is sent with sendfile """
+
+    def __init__(self, status: HTTPStatus, headers: [Tuple[str, str]] = (), body: bytes = b"", file: BinaryIO = None):
+        """
+        :param status: the status of the response
+        :param headers: the (name, value) headers of the response
+        :param body: the body of the response. Not sent in reply to HEAD requests
+        :param file: an open file to send as the body instead. Closed by the server once the response is sent
+        """
+        self.status = status
+        self.headers = list(headers)
+        self.body = body
+        self.file = file
+
+    def close(self):
+        """ Close the file of the response, if any """
+        if self.file is not None:
+            self.file.close()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """ Whether a client accepts gzip encoded responses, given the Accept-Encoding header of its request """
+    for coding in (accept_encoding or '').split(','):
+        (name, _, params) = coding.partition(';')
+        if name.strip().lower() in ['gzip', 'x-gzip']:
+            return params.replace(' ', '') not in ['q=0', 'q=0.0', 'q=0.00', 'q=0.000']
+    return False
+
+
+def not_modified(etag: str, last_modified: int, if_none_match: str, if_modified_since: str) -> bool:
+    """ Whether the client already has the current version of a resource, given the conditional headers it sent """
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def file_response(file_path: FilePath, content_type: str, headers) -> Response:
+    """
+    Send a published file, or 304 Not Modified if the client's copy is current.
+    If the client accepts gzip and a pre-compressed copy of the file exists at file_path.gz, the copy is sent
+    :param file_path: the file to send
+    :param content_type: the content type of the file
+    :param headers: the headers of the request
+    :return: the response to send
+    """
+    try:
+        file = open(file_path, 'rb')
+    except FileNotFoundError:
+        return error_response(HTTPStatus.SERVICE_UNAVAILABLE, "Results have not been published yet")
+
+    # the file is replaced, never modified, when it is published, so its inode and mtime identify its contents
+    stat = os.fstat(file.fileno())
+    etag = f"{stat.st_ino:x}-{stat.st_mtime_ns:x}"
+
+    content_headers = [('Content-Type', content_type)]
+    if accepts_gzip(headers.get('Accept-Encoding')) and os.path.isfile(f"{file_path}.gz"):
+        file.close()
+        file = open(f"{file_path}.gz", 'rb')
+        etag += "-gzip"
+        content_headers.append(('Content-Encoding', 'gzip'))
+    etag = f'"{etag}"'
+
+    # headers that let clients revalidate their copy instead of downloading it again
+    cache_headers = [('ETag', etag), ('Last-Modified', formatdate(int(stat.st_mtime), usegmt=True)),
+                     ('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+
+    if not_modified(etag, int(stat.st_mtime), headers.get('If-None-Match'), headers.get('If-Modified-Since')):
+        file.close()
+        return Response(HTTPStatus.NOT_MODIFIED, cache_headers)
+
+    content_headers.append(('Content-Length', str(os.fstat(file.fileno()).st_size)))
+    return Response(HTTPStatus.OK, content_headers + cache_headers, file=file)
+
+
+def json_response(data, headers, status: HTTPStatus = HTTPStatus.OK) -> Response:
+    """
+    Send a JSON document, or 304 Not Modified if the client's copy is current.
+    The document is gzip compressed if the client accepts gzip and the document is large enough to benefit
+    :param data: the document to send
+    :param headers: the headers of the request
+    :param status: the status of the response
+    :return: the response to send
+    """
+    body = json.dumps(data).encode()
+    use_gzip = len(body) > GZIP_MIN_BYTES and accepts_gzip(headers.get('Accept-Encoding'))
+    etag = f'"{hashlib.sha1(body).hexdigest()[:16]}{"-gzip" if use_gzip else ""}"'
+    cache_headers = [('ETag', etag), ('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+
+    if status == HTTPStatus.OK and not_modified(etag, 0, headers.get('If-None-Match'), None):
+        return Response(HTTPStatus.NOT_MODIFIED, cache_headers)
+
+    content_headers = [('Content-Type', 'application/json')]
+    if use_gzip:
+        body = gzip.compress(body)
+        content_headers.append(('Content-Encoding', 'gzip'))
+    content_headers.append(('Content-Length', str(len(body))))
+    return Response(status, content_headers + cache_headers, body)
+
+
+def error_response(status: HTTPStatus, message: str) -> Response:
+    """ An error page, in the same format as the errors sent by http.server """
+    body = server.DEFAULT_ERROR_MESSAGE % {'code': status.value, 'message': html.escape(message, quote=False),
+                                           'explain': html.escape(status.description, quote=False)}
+    return Response(status, [('Content-Type', server.DEFAULT_ERROR_CONTENT_TYPE)], body.encode('UTF-8', 'replace'))
@@ -0,0 +1,141 @@
+"""
+A read only JSON API of the tournament results, served by the results server.
+
+    /api/leaderboard?page=1&per_page=50   a page of the ranked leaderboard
+    /api/submitter/<name>                 a submitters scores, the result of every head to head cell their tests and
+                                          progs took part in, and their position in the queue of submissions with
+                                          when it is estimated to be processed
+    /api/mutant/<name>/<prog>             the result of every other submitters test suites against one of a submitters
+                                          progs
+    /api/queue                            the queue of submissions, with when each is estimated to be processed (see
+                                          eta.py)
+
+Requests are answered from the results database (see results_db.py), whose indexes make answering a request cost only
+as much as the answer.
+"""
+import json
+import os
+import sqlite3
+import threading
+from http import HTTPStatus
+from typing import Dict
+from urllib.parse import parse_qs, unquote
+
+from tournament.daemon import eta
+from tournament.reporting import leaderboard, results_db
+from tournament.reporting.response import Response, json_response
+from tournament.util import Submitter
+from tournament.util import paths
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# The published leaderboard, and the version of the file it was read from
+_published = {}
+_published_lock = threading.Lock()
+
+
+def published_leaderboard() -> dict:
+    """ The contents of the published leaderboard JSON file. Only read again once the file has been published """
+    stat = os.stat(paths.LEADERBOARD_JSON_FILE)
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _published_lock:
+        if _published.get('version') != version:
+            _published.update(version=version, leaderboard=json.load(open(paths.LEADERBOARD_JSON_FILE, 'r')))
+        return _published['leaderboard']
+
+
+def route_api_request(path: str, query: str, headers) -> Response:
+    """
+    Answer a GET request to the results API
+    :param path: the requested path, starting with /api/
+    :param query: the query string of the request
+    :param headers: the headers of the request
+    :return: the response to send
+    """
+    if path.rstrip('/') == "/api/queue":
+        return _queue(headers)
+    try:
+        if results_db.get_snapshot_details() is None:
+            return _error(HTTPStatus.SERVICE_UNAVAILABLE, "Results have not been published yet", headers)
+
+        if path.rstrip('/') == "/api/leaderboard":
+            return _leaderboard_page(parse_qs(query), headers)
+        if path.startswith("/api/submitter/"):
+            return _submitter_details(Submitter(unquote(path[len("/api/submitter/"):])), headers)
+        if path.startswith("/api/mutant/") and path.count('/') == 4:
+            (submitter, prog) = path[len("/api/mutant/"):].split('/')
+            return _mutant_details(Submitter(unquote(submitter)), unquote(prog), headers)
+    except sqlite3.OperationalError:
+        # the database has not been created yet
+        return _error(HTTPStatus.SERVICE_UNAVAILABLE, "Results have not been published yet", headers)
+    return _error(HTTPStatus.NOT_FOUND, f"Unknown API endpoint {path}", headers)
+
+
+def _leaderboard_page(query: Dict[str, list], headers) -> Response:
+    """ A page of the ranked leaderboard """
+    try:
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', [str(DEFAULT_PAGE_SIZE)])[0])
+    except ValueError:
+        return _error(HTTPStatus.BAD_REQUEST, "page and per_page must be integers", headers)
+    if page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+        return _error(HTTPStatus.BAD_REQUEST, f"page must be at least 1, and per_page between 1 and {MAX_PAGE_SIZE}",
+                      headers)
+
+    (num_submitters, entries) = results_db.get_leaderboard_page((page - 1) * per_page, per_page)
+    (tests, progs) = results_db.get_assignment()
+
+    return json_response({'snapshot_date': results_db.get_snapshot_details()['snapshot_date'],
+                          'queued_submissions': leaderboard.queued_submissions(),
+                          'tests': tests,
+                          'progs': progs,
+                          'page': page,
+                          'per_page': per_page,
+                          'num_pages': max(1, -(-num_submitters // per_page)),
+                          'num_submitters': num_submitters,
+                          'leaderboard': entries}, headers)
+
+
+def _submitter_details(submitter: Submitter, headers) -> Response:
+    """
+    A submitters leaderboard entry, the results of their tests against every other submitters progs and of every
+    other submitters tests against their progs, and their position in the queue
+    """
+    details = results_db.get_submitter(submitter)
+    if details is None:
+        return _error(HTTPStatus.NOT_FOUND, f"Unknown submitter {submitter}", headers)
+
+    queue = eta.estimate_queue()
+    estimate = next((estimate for estimate in queue if estimate['submitter'] == submitter), {})
+
+    return json_response({'snapshot_date': results_db.get_snapshot_details()['snapshot_date'],
+                          **details,
+                          'queue_position': estimate.get('position'),
+                          'queued_submissions': len(queue),
+                          'estimated_start': estimate.get('estimated_start'),
+                          'estimated_completion': estimate.get('estimated_completion')}, headers)
+
+
+def _mutant_details(submitter: Submitter, prog: str, headers) -> Response:
+    """ The results of every other submitters test suites against one of a submitters progs """
+    details = results_db.get_mutant(submitter, prog)
+    if details is None:
+        return _error(HTTPStatus.NOT_FOUND, f"Unknown prog {prog} of submitter {submitter}", headers)
+
+    return json_response({'snapshot_date': results_db.get_snapshot_details()['snapshot_date'], **details}, headers)
+
+
+def _queue(headers) -> Response:
+    """ The queue of submissions, with when each is estimated to be processed, and the model behind the estimates """
+    model = eta.get_cost_model()
+    return json_response({'queue': eta.estimate_queue(),
+                          'seconds_per_pair': model['seconds_per_pair'],
+                          'overhead_seconds': model['overhead_seconds'],
+                          'generation_seconds': model['generation_seconds'],
+                          'submissions_recorded': model['submissions_recorded']}, headers)
+
+
+def _error(status: HTTPStatus, message: str, headers) -> Response:
+    """ An API error, as a JSON document """
+    return json_response({'error': message}, headers, status)
@@ -0,0 +1,306 @@
+"""
+A sqlite read model of the tournament results, queried by the results API.
+
+The tournament updates the database after each submission it processes, rewriting only the head to head cells the
+submission took part in. Submitter scores are normalised against the best submission, so they are rewritten each time.
+The database is in WAL mode, so the results server reads it concurrently without blocking, or being blocked by, the
+tournament writing to it. Each update is a single transaction, so readers always see a complete set of results.
+
+    submitters   one row per submitter: their rank, scores, and position on the leaderboard
+    test_scores  the number of bugs detected by each of a submitters test suites
+    prog_scores  the number of test suites evaded by each of a submitters progs
+    cells        the result of each testers test suite against each testees prog
+    snapshots    the history of tournament snapshots
+    assignment   the tests and progs of the assignment
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tournament.config import AssignmentConfig
+from tournament.reporting import leaderboard
+from tournament.util import Submitter, TestResult
+from tournament.util import paths
+
+# How long a connection waits for another process writing to the database before giving up
+BUSY_TIMEOUT_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submitters (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    rank INTEGER,
+    score REAL NOT NULL,
+    latest_submission_date TEXT,
+    normalised_test_score REAL NOT NULL,
+    normalised_prog_score REAL NOT NULL,
+    average_bugs_detected REAL NOT NULL,
+    average_tests_evaded REAL NOT NULL,
+    average_tests_per_suite REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS submitters_by_position ON submitters (position);
+
+CREATE TABLE IF NOT EXISTS test_scores (
+    submitter TEXT NOT NULL,
+    test TEXT NOT NULL,
+    bugs_detected INTEGER NOT NULL,
+    PRIMARY KEY (submitter, test)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS prog_scores (
+    submitter TEXT NOT NULL,
+    prog TEXT NOT NULL,
+    tests_evaded INTEGER NOT NULL,
+    PRIMARY KEY (submitter, prog)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS cells (
+    tester TEXT NOT NULL,
+    testee TEXT NOT NULL,
+    test TEXT NOT NULL,
+    prog TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (tester, testee, test, prog)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cells_by_mutant ON cells (testee, prog, tester, test, result);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    snapshot_date TEXT NOT NULL,
+    time_to_process_last_submission INTEGER NOT NULL,
+    num_submitters INTEGER NOT NULL,
+    best_average_bugs_detected REAL NOT NULL,
+    best_average_tests_evaded REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS assignment (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (kind, name)
+) WITHOUT ROWID;
+"""
+
+
+def update(snapshot: dict, state: Optional[dict] = None, changed_submitters: Optional[List[Submitter]] = None):
+    """
+    Update the database with a new tournament snapshot
+    :param snapshot: the snapshot, as written to paths.RESULTS_FILE
+    :param state: the tournament state the snapshot was computed from, or None if no head to head cells have changed
+    :param changed_submitters: the submitters whose head to head cells have changed, or None to rewrite every cell
+    """
+    assg = AssignmentConfig().get_assignment()
+    (tests, progs) = (assg.get_test_list(), assg.get_programs_list())
+
+    connection = _connect()
+    try:
+        with connection:
+            _write_scores(connection, snapshot)
+
+            connection.execute("DELETE FROM assignment")
+            connection.executemany("INSERT INTO assignment VALUES (?, ?)",
+                                   [('test', test) for test in tests] + [('prog', prog) for prog in progs])
+
+            if state is not None:
+                _write_cells(connection, state, changed_submitters)
+
+            connection.execute("INSERT INTO snapshots (snapshot_date, time_to_process_last_submission, num_submitters, "
+                               "best_average_bugs_detected, best_average_tests_evaded) VALUES (?, ?, ?, ?, ?)",
+                               (snapshot['snapshot_date'], snapshot['time_to_process_last_submission'],
+                                snapshot['num_submitters'], snapshot['best_average_bugs_detected'],
+                                snapshot['best_average_tests_evaded']))
+    finally:
+        connection.close()
+
+
+def _connect() -> sqlite3.Connection:
+    """ Open the database for writing, creating it if it doesn't exist """
+    connection = sqlite3.connect(paths.RESULTS_DB_FILE, timeout=BUSY_TIMEOUT_SECONDS)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # in WAL mode a crash can only lose the most recent updates, which are rewritten from the tournament state
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _write_scores(connection: sqlite3.Connection, snapshot: dict):
+    """ Replace the scores of every submitter with those in the snapshot """
+    results = snapshot['results']
+    entries = leaderboard.ranked_leaderboard(snapshot)
+
+    connection.execute("DELETE FROM submitters")
+    connection.execute("DELETE FROM test_scores")
+    connection.execute("DELETE FROM prog_scores")
+
+    connection.executemany("INSERT INTO submitters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(entry['name'], position, entry['rank'], entry['score'], entry['latest_submission_date'],
+                             results[entry['name']]['normalised_test_score'],
+                             results[entry['name']]['normalised_prog_score'],
+                             results[entry['name']]['average_bugs_detected'],
+                             results[entry['name']]['average_tests_evaded'],
+                             results[entry['name']]['average_tests_per_suite'])
+                            for (position, entry) in enumerate(entries)])
+    connection.executemany("INSERT INTO test_scores VALUES (?, ?, ?)",
+                           [(submitter, test, bugs_detected) for submitter in results
+                            for (test, bugs_detected) in results[submitter]['tests'].items()])
+    connection.executemany("INSERT INTO prog_scores VALUES (?, ?, ?)",
+                           [(submitter, prog, tests_evaded) for submitter in results
+                            for (prog, tests_evaded) in results[submitter]['progs'].items()])
+
+
+def _write_cells(connection: sqlite3.Connection, state: dict, changed_submitters: Optional[List[Submitter]]):
+    """ Rewrite the head to head cells of the changed submitters, as testers and as testees """
+    if changed_submitters is None:
+        connection.execute("DELETE FROM cells")
+        connection.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?)", _cells(state, state, state))
+        return
+
+    changed = [submitter for submitter in changed_submitters if submitter in state]
+    for submitter in changed:
+        connection.execute("DELETE FROM cells WHERE tester = ?", (submitter,))
+        connection.execute("DELETE FROM cells WHERE testee = ?", (submitter,))
+
+    # cells between two changed submitters are in both sets, so the testers are restricted to avoid duplicates
+    connection.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?)", _cells(state, changed, state))
+    connection.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?)",
+                           _cells(state, [tester for tester in state if tester not in changed], changed))
+
+
+def _cells(state: dict, testers, testees) -> Iterator[Tuple[str, str, str, str, str]]:
+    """ The head to head cells of the testers test suites against the testees progs """
+    for tester in testers:
+        for (testee, test_set) in state[tester]['test_results'].items():
+            if testee in testees:
+                for (test, prog_results) in test_set.items():
+                    for (prog, result) in prog_results.items():
+                        yield (tester, testee, test, prog, TestResult(result).value)
+
+
+# Each thread of the results server reads through its own connection
+_readers = threading.local()
+
+
+def reader() -> sqlite3.Connection:
+    """
+    A read only connection to the database for the current thread. Raises sqlite3.OperationalError if the database
+    doesn't exist
+    """
+    if getattr(_readers, 'connection', None) is None:
+        _readers.connection = sqlite3.connect(f"file:{paths.RESULTS_DB_FILE}?mode=ro", uri=True,
+                                              timeout=BUSY_TIMEOUT_SECONDS)
+        _readers.connection.row_factory = sqlite3.Row
+    return _readers.connection
+
+
+def get_snapshot_details() -> Optional[sqlite3.Row]:
+    """ The latest snapshot, or None if the database is empty """
+    return reader().execute("SELECT * FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+
+
+def get_assignment() -> Tuple[List[str], List[str]]:
+    """ The (tests, progs) of the assignment """
+    rows = reader().execute("SELECT kind, name FROM assignment ORDER BY name").fetchall()
+    return ([row['name'] for row in rows if row['kind'] == 'test'],
+            [row['name'] for row in rows if row['kind'] == 'prog'])
+
+
+def get_leaderboard_page(offset: int, limit: int) -> Tuple[int, List[dict]]:
+    """
+    A page of the ranked leaderboard
+    :return: the total number of submitters, and the leaderboard entries on the page
+    """
+    connection = reader()
+    # read from a single transaction, so that all the queries see the same update
+    with _read_transaction(connection):
+        num_submitters = connection.execute("SELECT COUNT(*) FROM submitters").fetchone()[0]
+        rows = connection.execute("SELECT * FROM submitters ORDER BY position LIMIT ? OFFSET ?",
+                                  (limit, offset)).fetchall()
+        page = "SELECT name FROM submitters ORDER BY position LIMIT ? OFFSET ?"
+        tests = _scores(connection.execute(f"SELECT submitter, test, bugs_detected FROM test_scores "
+                                           f"WHERE submitter IN ({page})", (limit, offset)))
+        progs = _scores(connection.execute(f"SELECT submitter, prog, tests_evaded FROM prog_scores "
+                                           f"WHERE submitter IN ({page})", (limit, offset)))
+
+    return (num_submitters, [_leaderboard_entry(row, tests.get(row['name'], {}), progs.get(row['name'], {}))
+                             for row in rows])
+
+
+def get_submitter(submitter: Submitter) -> Optional[dict]:
+    """
+    A submitters leaderboard entry and the result of every head to head cell they took part in, or None if the
+    submitter is not in the tournament
+    """
+    connection = reader()
+    with _read_transaction(connection):
+        row = connection.execute("SELECT * FROM submitters WHERE name = ?", (submitter,)).fetchone()
+        if row is None:
+            return None
+        tests = _scores(connection.execute("SELECT submitter, test, bugs_detected FROM test_scores "
+                                           "WHERE submitter = ?", (submitter,)))
+        progs = _scores(connection.execute("SELECT submitter, prog, tests_evaded FROM prog_scores "
+                                           "WHERE submitter = ?", (submitter,)))
+        tests_against_progs = _nested(connection.execute("SELECT testee, test, prog, result FROM cells "
+                                                         "WHERE tester = ?", (submitter,)))
+        progs_against_tests = _nested(connection.execute("SELECT tester, test, prog, result FROM cells "
+                                                         "WHERE testee = ?", (submitter,)))
+
+    return {**_leaderboard_entry(row, tests.get(submitter, {}), progs.get(submitter, {})),
+            'tests_against_progs': tests_against_progs,
+            'progs_against_tests': progs_against_tests}
+
+
+def get_mutant(submitter: Submitter, prog: str) -> Optional[dict]:
+    """
+    The result of every other submitters test suites against one of a submitters progs, or None if the submitter or
+    prog is not in the tournament
+    """
+    connection = reader()
+    with _read_transaction(connection):
+        row = connection.execute("SELECT tests_evaded FROM prog_scores WHERE submitter = ? AND prog = ?",
+                                 (submitter, prog)).fetchone()
+        if row is None:
+            return None
+        results = connection.execute("SELECT tester, test, result FROM cells WHERE testee = ? AND prog = ?",
+                                     (submitter, prog)).fetchall()
+
+    tests_against_prog: Dict[str, Dict[str, str]] = {}
+    for (tester, test, result) in results:
+        tests_against_prog.setdefault(tester, {})[test] = result
+    return {'name': submitter, 'prog': prog, 'tests_evaded': row['tests_evaded'],
+            'tests_against_prog': tests_against_prog}
+
+
+@contextmanager
+def _read_transaction(connection: sqlite3.Connection):
+    """ Read the database as of a single update, even if the tournament commits another update part way through """
+    connection.execute("BEGIN")
+    try:
+        yield
+    finally:
+        connection.execute("COMMIT")
+
+
+def _leaderboard_entry(row: sqlite3.Row, tests: dict, progs: dict) -> dict:
+    """ A leaderboard entry, in the same format as the entries of the published leaderboard """
+    return {'rank': row['rank'],
+            'name': row['name'],
+            'latest_submission_date': row['latest_submission_date'],
+            'score': row['score'],
+            'tests': tests,
+            'progs': progs}
+
+
+def _scores(rows) -> Dict[str, Dict[str, int]]:
+    """ Group (submitter, test or prog, score) rows by submitter """
+    scores = {}
+    for (submitter, name, score) in rows:
+        scores.setdefault(submitter, {})[name] = score
+    return scores
+
+
+def _nested(rows) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """ Group (submitter, test, prog, result) rows into results[submitter][test][prog] """
+    results = {}
+    for (submitter, test, prog, result) in rows:
+        results.setdefault(submitter, {}).setdefault(test, {})[prog] = result
+    return results
@@ -1,165 +1,169 @@
 """
 Results of the tournament are written to an HTTP server.
-The server delivers a static page with a ranked table of submitters
+The server delivers a static page with a ranked table of submitters, which is published by the tournament each time
+the results change (see leaderboard.py), and a JSON API of the results (see results_api.py). In asyncio mode clients
+viewing the page are pushed an event whenever the leaderboard is published
 """
 
+import json
 import os
+import resource
 import subprocess
 import threading
 import time
 import traceback
 from datetime import datetime
+from email.message import Message
 from http import HTTPStatus, server
 from socketserver import ThreadingMixIn
+from typing import Optional
+from urllib.parse import urlsplit
 
-from tournament.config import AssignmentConfig, ServerConfig
+from tournament.config import ServerConfig
+from tournament.daemon import fs_queue
 from tournament.flags import get_flag, TourneyFlag
 from tournament.processing import TourneySnapshot
-from tournament.util import Result
-from tournament.util import format as fmt, paths
+from tournament.reporting import leaderboard, results_api
+from tournament.reporting.async_server import AsyncHTTPServer, EventBroadcaster, RateLimiter
+from tournament.reporting.response import Response, error_response, file_response
+from tournament.util import FilePath, Result
+from tournament.util import metrics, paths
 from tournament.util import print_tourney_trace, print_tourney_error
 
 
-class ThreadedHTTPServer(ThreadingMixIn, server.HTTPServer):
-    """ Default server.HTTPServer, but uses ThreadingMixIn to be able to handle multiple HTTP requests in parallel """
-
-
-class TourneyResultsHandler(server.SimpleHTTPRequestHandler):
-    """ HTTP request handler that returns a ranked table of submitter results """
-
-    def do_GET(self):
-        """ Handle GET requests to the server """
-
-        self.send_response(HTTPStatus.OK)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-
-        snapshot = TourneySnapshot(snapshot_file=paths.RESULTS_FILE)
-        report_date = snapshot.date()
-
-        html = '<!DOCTYPE html><html><body>' \
-               '<h1>Results as of ' + report_date.strftime(fmt.DATETIME_TRACE_STRING) + '</h1>' + \
-               tournament_processing_details(snapshot) + \
-               _html_table_from_results(snapshot) + \
-               '</body></html>'
-
-        self.wfile.write(bytes(html, 'utf-8'))
+# Clients subscribe to live leaderboard updates at this path. Only provided in asyncio mode
+EVENTS_PATH = "/events"
 
-    def do_HEAD(self):
-        self.do_GET()
+# How often the published leaderboard is checked for changes to push to subscribers
+EVENT_POLL_SECONDS = 1
 
-    # noinspection PyPep8Naming
-    def do_POST(self):  # pylint: disable=invalid-name
-        """ Don't accept POST requests """
-        self.send_error(HTTPStatus.NOT_IMPLEMENTED, "POST requests are not accepted")
+# Metrics of the tournament's throughput, in the Prometheus text format
+METRICS_PATH = "/metrics"
 
-    def list_directory(self, path):
-        # stubbed
-        return None
 
-    def log_message(self, log_format, *args):  # pylint: disable=arguments-differ,unused-argument
-        with open(paths.RESULTS_SERVER_TRACE_FILE, 'a') as file:
-            file.write("{} - - [{}] {}\n".format(self.address_string(), self.log_date_time_string(), *args))
-
-
-def tournament_processing_details(snapshot: TourneySnapshot) -> str:
-    """ Return a string with submissions still to process and the current submission processing duration """
-    queued_submissions = len([file for file in os.listdir(paths.STAGING_DIR) if not file.startswith(".")])
-    time_to_process_last_submission = snapshot.time_to_process_last_submission()
-
-    return f"There are {queued_submissions} submissions awaiting processing.\n" + \
-           f"The most recent submission took {time_to_process_last_submission} seconds to process"
+class ThreadedHTTPServer(ThreadingMixIn, server.HTTPServer):
+    """ Default server.HTTPServer, but uses ThreadingMixIn to be able to handle multiple HTTP requests in parallel """
 
 
-def _html_table_from_results(snapshot: TourneySnapshot) -> str:
+def route_request(method: str, path: str, headers: Message) -> Response:
     """
-    Convert the tournament snapshot to a ranked table of submitter results
-    :param snapshot: the tournament snapshot data
-    :return: a string of an HTML table with submitter results
+    Answer a request to the results server. Used by both the threaded and the asyncio servers
+    :param method: the HTTP method of the request
+    :param path: the requested path
+    :param headers: the headers of the request
+    :return: the response to send
     """
+    if method == 'POST':
+        return error_response(HTTPStatus.NOT_IMPLEMENTED, "POST requests are not accepted")
+    if method not in ['GET', 'HEAD']:
+        return error_response(HTTPStatus.NOT_IMPLEMENTED, f"Unsupported method ({method})")
+
+    url = urlsplit(path)
+    if url.path.startswith("/api/"):
+        return results_api.route_api_request(url.path, url.query, headers)
+    if url.path == EVENTS_PATH:
+        # events are pushed by the asyncio server before requests are routed
+        return error_response(HTTPStatus.NOT_FOUND, "Live updates are not provided by this server")
+    if url.path == METRICS_PATH:
+        return metrics_response()
+    if url.path == "/leaderboard.json":
+        return file_response(FilePath(paths.LEADERBOARD_JSON_FILE), 'application/json', headers)
+    return file_response(FilePath(paths.LEADERBOARD_HTML_FILE), 'text/html; charset=utf-8', headers)
+
+
+def metrics_response() -> Response:
+    """
+    The metrics recorded by the daemon, along with the depth of the queue of submissions and the age of its oldest
+    submission, which are measured from paths.STAGING_DIR
+    """
+    queue = fs_queue.get_queue()
+    oldest = min((fs_queue.get_submission_request_details(file_path)[1] for file_path in queue), default=None)
+    queue_age = 0 if oldest is None else max(0.0, (datetime.now() - oldest).total_seconds())
 
-    num_submitters = snapshot.num_submitters()
-    assg = AssignmentConfig().get_assignment()
-    num_tests = 0 if num_submitters == 0 else (num_submitters - 1) * len(assg.get_test_list())
-    num_progs = 0 if num_submitters == 0 else (num_submitters - 1) * len(assg.get_programs_list())
-
-    tests_header = f"<table><tr><th>Bugs detected (out of {num_progs})</th></tr>" + \
-                   f"<tr><td>{str(sorted(assg.get_test_list()))}</tr></td></table>"
-    progs_header = f"<table><tr><th>Tests evaded (out of {num_tests})</th></tr>" + \
-                   f"<tr><td>{str(sorted(assg.get_programs_list()))}</tr></td></table>"
-
-    table = '<table style="width:100%" align="center">' + \
-        _table_header("Rank", "Name", "Date of submission", tests_header, progs_header)
-
-    table += _table_body_from_results(snapshot)
-
-    return table
-
-
-def _table_body_from_results(snapshot: TourneySnapshot) -> str:
-    """ Generate the body of the results table from the tournament results """
-    table = ''
-    results = snapshot.results()
+    body = metrics.exposition([("tourney_queue_depth", "Submissions waiting in the queue to be processed", len(queue)),
+                               ("tourney_queue_oldest_age_seconds", "Time the oldest queued submission has waited",
+                                queue_age)]).encode()
+    return Response(HTTPStatus.OK, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                    ('Content-Length', str(len(body))), ('Cache-Control', 'no-cache')], body)
 
-    table_data = {}
-    for submitter in results:
-        score = float(results[submitter]['normalised_test_score']) + float(results[submitter]['normalised_prog_score'])
 
-        table_data[submitter] = {'latest_processed_submission': results[submitter]['latest_submission_date'],
-                                 'score': score,
-                                 'progs': results[submitter]['progs'],
-                                 'tests': results[submitter]['tests'],
-                                 }
+def leaderboard_event() -> Optional[str]:
+    """
+    The server-sent event pushed to clients viewing the leaderboard: the version of the published leaderboard and the
+    number of queued submissions. Changes each time the leaderboard is published
+    """
+    if not os.path.isfile(paths.LEADERBOARD_JSON_FILE):
+        return None
+    published = results_api.published_leaderboard()
+    return json.dumps({'version': published.get('version'),
+                       'snapshot_date': published['snapshot_date'],
+                       'queued_submissions': published['queued_submissions']})
 
-    rank = 0
-    prev_score = -1
 
-    # print results from best score to worst
-    for submitter, sub_data in sorted(table_data.items(), key=lambda item: item[1]['score'], reverse=True):
-        if sub_data['latest_processed_submission'] is None:
-            table += _table_row("-", submitter, "No submission", "N/A", "N/A")
-        else:
-            latest_submission_date = datetime.strptime(sub_data['latest_processed_submission'],
-                                                       fmt.DATETIME_TRACE_STRING)
+def _raise_open_file_limit():
+    """ Allow the server as many open connections as the system allows, for clients subscribed to events """
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
 
-            prog_scores = [sub_data['progs'][prog] for prog in sorted(sub_data['progs'])]
-            test_scores = [sub_data['tests'][test] for test in sorted(sub_data['tests'])]
 
-            latest_submission_date = latest_submission_date.strftime(fmt.DATETIME_TRACE_STRING)
+def write_server_trace(client_address: str, message):
+    """ Write a request to the results server trace file """
+    # the same date format as server.BaseHTTPRequestHandler.log_date_time_string()
+    (year, month, day, hour, minute, second, _, _, _) = time.localtime()
+    log_date = f"{day:02d}/{server.BaseHTTPRequestHandler.monthname[month]}/{year:04d} " \
+               f"{hour:02d}:{minute:02d}:{second:02d}"
+    with open(paths.RESULTS_SERVER_TRACE_FILE, 'a') as file:
+        file.write("{} - - [{}] {}\n".format(client_address, log_date, message))
 
-            if prev_score != sub_data['score']:
-                rank += 1
-                prev_score = sub_data['score']
-            table += _table_row(rank, submitter, latest_submission_date, test_scores, prog_scores)
 
-    table += '</table>'
+class TourneyResultsHandler(server.SimpleHTTPRequestHandler):
+    """ HTTP request handler that returns a ranked table of submitter results """
 
-    return table
+    def do_GET(self):
+        """ Handle GET requests to the server """
+        self._send_routed_response()
 
+    def do_HEAD(self):
+        """ Handle HEAD requests to the server. The same as GET but without the page """
+        self._send_routed_response()
 
-def _table_header(*args) -> str:
-    """ Return an HTML table header string. The size of the row depends on the number of values in *args """
-    row = '<tr>'
-    for col in args:
-        row += '<th align="center">' + str(col) + '</th>'
-    row += '<tr>'
-    return row
+    # noinspection PyPep8Naming
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ Don't accept POST requests """
+        self._send_routed_response()
+
+    def _send_routed_response(self):
+        """ Send the response to the request from route_request. Files are sent with sendfile """
+        response = route_request(self.command, self.path, self.headers)
+        try:
+            self.send_response(response.status)
+            for (name, value) in response.headers:
+                self.send_header(name, value)
+            self.end_headers()
+
+            if self.command != 'HEAD' and response.status != HTTPStatus.NOT_MODIFIED:
+                if response.file is not None:
+                    self.wfile.flush()
+                    self.connection.sendfile(response.file)
+                else:
+                    self.wfile.write(response.body)
+        finally:
+            response.close()
 
+    def list_directory(self, path):
+        # stubbed
+        return None
 
-def _table_row(*args) -> str:
-    """ Return an HTML table row string. The size of the row depends on the number of values in *args """
-    row = '<tr>'
-    for col in args:
-        row += '<td align="center">' + str(col) + '</td>'
-    row += '<tr>'
-    return row
+    def log_message(self, log_format, *args):  # pylint: disable=arguments-differ,unused-argument
+        write_server_trace(self.address_string(), args[0] if args else log_format)
 
 
-def _server_assassin(httpd: ThreadedHTTPServer):
+def _server_assassin(httpd):
     """
     An assassin thread that checks for the removal of the tournament alive flag.
     When it get removed kill the server thread
-    :param httpd: the HTTP server to kill
+    :param httpd: the HTTP server to kill, either a ThreadedHTTPServer or an AsyncHTTPServer
     """
     while get_flag(TourneyFlag.ALIVE):
         time.sleep(5)
@@ -173,11 +177,25 @@ def main():
     try:
         time.sleep(5)
         print_tourney_trace("Starting the results server")
-        if not os.path.exists(paths.RESULTS_FILE):
-            TourneySnapshot(report_time=datetime.now()).write_snapshot()
+        if not os.path.exists(paths.RESULTS_FILE) or not os.path.exists(paths.RESULTS_DB_FILE):
+            snapshot = TourneySnapshot(report_time=datetime.now())
+            snapshot.write_snapshot()
+            snapshot.update_results_db()
+        else:
+            # the leaderboard may have been published by an older version of the tournament
+            leaderboard.publish()
         server_config = ServerConfig()
         server_address = ('', server_config.port())
-        httpd = ThreadedHTTPServer(server_address, TourneyResultsHandler)
+        if server_config.mode() == "threaded":
+            httpd = ThreadedHTTPServer(server_address, TourneyResultsHandler)
+        else:
+            _raise_open_file_limit()
+            rate_limiter = RateLimiter(server_config.rate_limit_per_second(), server_config.rate_limit_burst())
+            events = EventBroadcaster(EVENTS_PATH, leaderboard_event, EVENT_POLL_SECONDS,
+                                      server_config.max_event_subscribers())
+            httpd = AsyncHTTPServer(server_address, route_request, write_server_trace,
+                                    server_config.max_connections(), rate_limiter,
+                                    server_config.client_timeout_seconds(), server_config.keep_alive_seconds(), events)
         threading.Thread(target=_server_assassin, args=[httpd], daemon=True).start()
         httpd.serve_forever()
         print_tourney_trace("Shutting down the results server")
@@ -0,0 +1,104 @@
+"""
+A refreshing terminal view of the tournament daemon, rendered from its live status board (see status_board.py) and
+its metrics (see metrics.py): the submission being processed, what each process of the processing pool is testing,
+the queue of submissions, and throughput
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from tournament.daemon import fs_queue
+from tournament.util import Result, format as fmt, metrics, status_board
+
+# Clears the terminal and moves the cursor to its top left
+CLEAR_SCREEN = "\033[H\033[2J"
+
+
+def run(interval: float, once: bool = False) -> Result:
+    """
+    Render the view every interval seconds until interrupted
+    :param interval: how often to refresh the view, in seconds
+    :param once: render the view a single time, e.g. when the output is not a terminal
+    """
+    previous = None
+    try:
+        while True:
+            board = status_board.attach()
+            if board is None:
+                return Result(False, "The tournament is not running, so there is no status to show")
+            try:
+                (view, previous) = render(board.buf, previous)
+            finally:
+                board.close()
+
+            if once:
+                return Result(True, view)
+            print(CLEAR_SCREEN + view, flush=True)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return Result(True, "")
+
+
+def render(buf, previous: Optional[dict]) -> (str, dict):
+    """
+    Render the view from a status board
+    :param buf: the buffer of the attached status board
+    :param previous: the totals returned when the view was last rendered, used to measure throughput
+    :return: the view, and the totals to pass when the view is next rendered
+    """
+    now = time.time()
+    header = status_board.read_header(buf)
+    slots = status_board.read_slots(buf)
+    totals = {'time': now,
+              'pairs': sum(slot['pairs_done'] for slot in slots),
+              'cells': sum(slot['cells_run'] for slot in slots),
+              'reused': sum(slot['cells_reused'] for slot in slots)}
+
+    lines = [f"Tournament status at {datetime.now().strftime(fmt.DATETIME_TRACE_STRING)} | "
+             f"daemon pid {header['pid']}, up {_duration(now - header['started'])}"]
+
+    if header['submitter']:
+        pairs_done = totals['pairs'] - header['pairs_done_before']
+        lines.append(f"Processing {header['submitter']} for {_duration(now - header['submission_started'])} | "
+                     f"{pairs_done}/{header['pairs_total']} pairs tested")
+    else:
+        lines.append("Not processing a submission")
+
+    queue = [fs_queue.get_submission_request_details(file_path)[1] for file_path in fs_queue.get_queue()]
+    lines.append(f"Queue: {len(queue)} submissions" +
+                 (f", oldest waiting {_duration((datetime.now() - min(queue)).total_seconds())}" if queue else ""))
+
+    if previous is not None and now > previous['time']:
+        elapsed = now - previous['time']
+        throughput = f"{(totals['cells'] - previous['cells']) / elapsed:.1f} cells/s, " \
+                     f"{(totals['pairs'] - previous['pairs']) / elapsed:.2f} pairs/s"
+    else:
+        throughput = "measuring"
+    recorded = metrics.read()
+    submissions = "" if recorded is None else f", {_submissions_processed(recorded)} submissions processed"
+    lines += [f"Throughput: {throughput} | {totals['cells']} cells run, {totals['reused']} reused{submissions}", ""]
+
+    lines.append(f"{'PROCESS':<12} {'PID':>7}  {'STATE':<5}  {'PAIR':<36} {'CELL':<28} {'PAIR TIME':>9} "
+                 f"{'CELL TIME':>9} {'PAIRS':>6} {'CELLS':>7}")
+    for slot in slots:
+        busy = bool(slot['busy'])
+        pair = f"{slot['tester']} -> {slot['testee']}" if busy else ""
+        cell = f"{slot['test']} / {slot['prog']}" if busy and slot['cell_started'] else ""
+        lines.append(f"{'process_' + str(slot['slot']):<12} {slot['pid']:>7}  {'busy' if busy else 'idle':<5}  "
+                     f"{pair[:36]:<36} {cell[:28]:<28} "
+                     f"{_duration(now - slot['pair_started']) if busy else '':>9} "
+                     f"{_duration(now - slot['cell_started']) if cell else '':>9} "
+                     f"{slot['pairs_done']:>6} {slot['cells_run']:>7}")
+
+    return "\n".join(lines), totals
+
+
+def _submissions_processed(recorded: dict) -> int:
+    """ The number of submissions the daemon has taken from the queue since it started, given its metrics """
+    return int(sum(recorded[f"tourney_submissions_processed_total:{outcome}"]
+                   for outcome in metrics.SUBMISSION_OUTCOMES))
+
+
+def _duration(seconds: float) -> str:
+    """ A duration as H:MM:SS """
+    return str(timedelta(seconds=int(max(0.0, seconds))))
@@ -3,17 +3,19 @@ from __future__ import annotations
 
 import json
 import os
-import re
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
-from itertools import takewhile
+from typing import Any, Callable, Optional
 
 from tournament import daemon
-from tournament.config import AssignmentConfig, ApprovedSubmitters
+from tournament.daemon import admission, eta
+from tournament.config import AssignmentConfig, ApprovedSubmitters, ProcessingConfig
 from tournament.config.assignments import AbstractAssignment
 from tournament.flags import get_flag, set_flag, clear_all_flags, SubmissionFlag
-from tournament.util import paths, format as fmt, print_tourney_trace
+from tournament.util import paths, quota, format as fmt, print_tourney_trace
 from tournament.util.types import FilePath, Prog, Result, Submitter, TestResult
 
 
@@ -69,12 +71,15 @@ def run_stage(stage: Stage, submitter: Submitter, assg_name: str = None, submiss
                              f"stages via the Gitlab web interface")
 
     # run the stage
-    result = {Stage.CHECK_ELIG: lambda: _check_submitter_eligibility(submitter, assg_name, submission_dir),
-              Stage.COMPILE: lambda: _compile_submission(submitter),
-              Stage.VALIDATE_TESTS: lambda: _validate_tests(submitter),
-              Stage.VALIDATE_PROGS: lambda: _validate_programs_under_test(submitter),
-              Stage.SUBMIT: lambda: _submit(submitter)
-              }.get(stage, lambda: Result(False, f"Stage {stage.name} not implemented"))()
+    if stage in [Stage.COMPILE, Stage.VALIDATE_TESTS, Stage.VALIDATE_PROGS] and _verdict_cached(pre_val_dir):
+        result = Result(True, "Submission is identical to your current tournament submission. Reusing its results")
+    else:
+        result = {Stage.CHECK_ELIG: lambda: _check_submitter_eligibility(submitter, assg_name, submission_dir),
+                  Stage.COMPILE: lambda: _compile_submission(submitter),
+                  Stage.VALIDATE_TESTS: lambda: _validate_tests(submitter),
+                  Stage.VALIDATE_PROGS: lambda: _validate_programs_under_test(submitter),
+                  Stage.SUBMIT: lambda: _submit(submitter)
+                  }.get(stage, lambda: Result(False, f"Stage {stage.name} not implemented"))()
 
     # process the results
     if result:
@@ -101,6 +106,11 @@ def _submission_details(submitter: Submitter) -> (Submitter, FilePath, AbstractA
     return submitter, submitter_pre_validation_dir, assg
 
 
+def _verdict_cached(pre_val_dir: FilePath) -> bool:
+    """ Whether a submission is identical to the submitters tourney entry, and can reuse its validation results """
+    return os.path.isfile(f"{pre_val_dir}/{paths.CACHED_VERDICT_FILE}")
+
+
 def _check_submitter_eligibility(submitter: Submitter, assg_name: str, submission_dir: FilePath) -> Result:
     """
     Check that the submitter has made a submission that is eligible for the tournament.
@@ -142,9 +152,50 @@ def _check_submitter_eligibility(submitter: Submitter, assg_name: str, submissio
         subprocess.run(f"rm -rf {submitter_pre_val_dir}", shell=True, check=True)
         return Result(False, f"An error occurred while preparing the submission:\n\t{result.traces}")
 
+    # the source code of the submission won't change from here on, hash it for detecting changes between submissions
+    assg.write_manifest(FilePath(submitter_pre_val_dir))
+
+    # if nothing has changed since the submitters current tourney entry then its validation still holds
+    tourney_dir = paths.get_tourney_dir(submitter)
+    if os.path.isdir(tourney_dir):
+        fingerprint = assg.get_fingerprint(tourney_dir)
+        if assg.get_fingerprint(FilePath(submitter_pre_val_dir)) == fingerprint and \
+                _copy_tourney_entry(assg, tourney_dir, FilePath(submitter_pre_val_dir), fingerprint):
+            with open(f"{submitter_pre_val_dir}/{paths.CACHED_VERDICT_FILE}", 'w') as cached_verdict_file:
+                cached_verdict_file.write(fingerprint)
+            return Result(True, "Submitter is eligible for the tournament\n"
+                                "The tests and programs in this submission are identical to your current tournament "
+                                "submission. Validation will be skipped")
+
     return Result(True, "Submitter is eligible for the tournament")
 
 
+def _copy_tourney_entry(assg: AbstractAssignment, tourney_dir: FilePath, pre_val_dir: FilePath,
+                        fingerprint: str) -> bool:
+    """
+    Replace a submission with a copy of the identical tourney entry, including the entry's compiled and generated
+    files. The copy can then be installed in the tournament without being validated, even if the entry it was copied
+    from is replaced by another submission before it leaves the queue
+    :param fingerprint: the fingerprint of the tourney entry
+    :return: whether the entry was copied. If not, the submission is left as it is and must be validated
+    """
+    entry_copy = f"{pre_val_dir}.entry"
+    subprocess.run(f"rm -rf {entry_copy}", shell=True, check=True)
+    copied = subprocess.run(f"cp -a {tourney_dir} {entry_copy}", shell=True, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, check=False).returncode == 0
+
+    # the daemon may have replaced the entry while it was being copied
+    if not copied or assg.get_fingerprint(FilePath(entry_copy)) != fingerprint:
+        subprocess.run(f"rm -rf {entry_copy}", shell=True, check=True)
+        return False
+
+    subprocess.run(f"rm -rf {pre_val_dir}", shell=True, check=True)
+    subprocess.run(f"mv {entry_copy} {pre_val_dir}", shell=True, check=True)
+    # the age of the submission is measured from its directory's mtime, which was copied from the entry
+    os.utime(pre_val_dir)
+    return True
+
+
 def _compile_submission(submitter: Submitter) -> Result:
     """
     Compile any tests or programs under test in a submission, if necessary.
@@ -156,9 +207,9 @@ def _compile_submission(submitter: Submitter) -> Result:
 
     # compile progs under test
     result = Result(True, "Compiling programs:")
-    for prog in ["original"] + assg.get_programs_list():
-        compil_result = assg.compile_prog(submitter_pre_val_dir, prog)
-
+    compil_results = assg.compile_progs(submitter_pre_val_dir, ["original"] + assg.get_programs_list(),
+                                        paths.get_tourney_dir(submitter))
+    for (prog, compil_result) in compil_results.items():
         result.traces += f"\n\t{prog} compilation "
         result.traces += "SUCCESS" if compil_result else (f"FAILED.\n{compil_result.traces}")
         result.success = result.success and compil_result.success
@@ -172,6 +223,10 @@ def _compile_submission(submitter: Submitter) -> Result:
         result.traces += "SUCCESS" if compil_result else (f"FAILED.\n{compil_result.traces}")
         result.success = result.success and compil_result.success
 
+    # compilation and test generation can produce large files, reject oversized submissions as early as possible
+    if result:
+        result += _check_submission_file_size(submitter_pre_val_dir)
+
     return result
 
 
@@ -193,19 +248,30 @@ def _validate_tests(submitter: Submitter) -> Result:
                              "test pipeline")
 
     assg = AssignmentConfig().get_assignment()
+    tests = assg.get_test_list()
+
+    test_results = _run_in_parallel(
+        lambda test: assg.run_test(test, Prog("original"), FilePath(submitter_pre_val_dir)),
+        tests, failed=lambda result: result[0] != TestResult.NO_BUGS_DETECTED)
 
     num_tests = {}
     tests_valid = True
     validation_traces = "Validation results:"
-    for test in assg.get_test_list():
-        test_result, test_traces = assg.run_test(test, Prog("original"), FilePath(submitter_pre_val_dir))
-
+    for (test, run_result) in zip(tests, test_results):
         validation_traces += f"\n\t{test} test "
+
+        if run_result is None:
+            validation_traces += "SKIPPED - Validation stopped at the first failure"
+            tests_valid = False
+            continue
+
+        test_result, test_traces = run_result
         validation_traces += \
             {TestResult.TIMEOUT: f"FAIL    - Timeout when run against original program: {test_traces}",
              TestResult.NO_BUGS_DETECTED: "SUCCESS - No bugs detected in original program",
              TestResult.BUG_FOUND: f"FAIL    - Test falsely reports error in original code\n{test_traces}",
-             TestResult.UNEXPECTED_RETURN_CODE: f"FAIL    - Unrecognised return code found\n{test_traces}"
+             TestResult.UNEXPECTED_RETURN_CODE: f"FAIL    - Unrecognised return code found\n{test_traces}",
+             TestResult.NOT_TESTED: f"FAIL    - Not every test could be run in time: {test_traces}"
              }.get(test_result, f"ERROR   - unexpected test result: {test_result}")
 
         tests_valid = tests_valid and test_result == TestResult.NO_BUGS_DETECTED
@@ -236,34 +302,60 @@ def _validate_programs_under_test(submitter: Submitter) -> Result:
                              "test pipeline")
 
     assg = AssignmentConfig().get_assignment()
-
-    progs_valid = True
+    progs = assg.get_programs_list()
+    fail_fast = ProcessingConfig().validation_fail_fast()
+
+    # check the diffs of all programs against the original code
+    diff_results = _run_in_parallel(lambda prog: assg.check_diff(submitter_pre_val_dir, prog), progs,
+                                    failed=lambda result: not result)
+
+    # programs with valid changes must not be duplicates of earlier programs. Only programs with matching fingerprints
+    # can be identical, so progs_identical is just used to confirm a match
+    prog_failures = {}
+    progs_by_fingerprint = {}
+    for (prog, diff_result) in zip(progs, diff_results):
+        fingerprint = assg.get_prog_fingerprint(prog, FilePath(submitter_pre_val_dir))
+        if diff_result is None:
+            prog_failures[prog] = "SKIPPED - Validation stopped at the first failure"
+        elif not diff_result:
+            prog_failures[prog] = f"FAIL - Invalid changes to original code: {diff_result.traces}"
+        else:
+            duplicate_progs = [other for other in progs_by_fingerprint.get(fingerprint, [])
+                               if assg.progs_identical(prog, other, submitter_pre_val_dir)]
+            if duplicate_progs:
+                prog_failures[prog] = f"FAIL - Duplicate of {duplicate_progs[0]}"
+        progs_by_fingerprint.setdefault(fingerprint, []).append(prog)
+
+    # the submitters tests must detect the bugs in all remaining programs
+    cells = [] if prog_failures and fail_fast else \
+        [(prog, test) for prog in progs if prog not in prog_failures for test in assg.get_test_list()]
+    cell_results = dict(zip(cells, _run_in_parallel(
+        lambda cell: assg.run_test(cell[1], cell[0], FilePath(submitter_pre_val_dir), use_poc=True, fail_fast=True),
+        cells, failed=lambda result: result[0] != TestResult.BUG_FOUND)))
+
+    progs_valid = not prog_failures
     validation_traces = "Validation results:"
-    for prog in assg.get_programs_list():
-
-        diff_result = assg.check_diff(submitter_pre_val_dir, prog)
-        if not diff_result:
-            validation_traces += f"\n\t{prog} FAIL - Invalid changes to original code: {diff_result.traces}"
-            progs_valid = False
-            continue
-
-        other_progs = takewhile(lambda p, curr_prog=prog: p != curr_prog, assg.get_programs_list())
-        duplicate_progs = [other for other in other_progs if assg.progs_identical(prog, other, submitter_pre_val_dir)]
-
-        if duplicate_progs:
-            validation_traces += f"\n\t{prog} FAIL - Duplicate of {duplicate_progs[0]}"
-            progs_valid = False
+    for prog in progs:
+        if prog in prog_failures:
+            validation_traces += f"\n\t{prog} {prog_failures[prog]}"
             continue
 
         for test in assg.get_test_list():
-            test_result, test_traces = assg.run_test(test, prog, FilePath(submitter_pre_val_dir), use_poc=True)
-
             validation_traces += f"\n\t{prog} {test} test "
+
+            run_result = cell_results.get((prog, test))
+            if run_result is None:
+                validation_traces += "SKIPPED - Validation stopped at the first failure"
+                progs_valid = False
+                continue
+
+            test_result, test_traces = run_result
             validation_traces += \
                 {TestResult.TIMEOUT: "FAIL    - Timeout",
                  TestResult.NO_BUGS_DETECTED: "FAIL    - Test suite does not detect error",
                  TestResult.BUG_FOUND: "SUCCESS - Test suite detects error",
                  TestResult.UNEXPECTED_RETURN_CODE: f"FAIL    - Unrecognised return code found\n{test_traces}",
+                 TestResult.NOT_TESTED: f"FAIL    - Not every test could be run in time: {test_traces}",
                  }.get(test_result, f"ERROR   - unexpected test result: {test_result}")
 
             progs_valid = progs_valid and test_result == TestResult.BUG_FOUND
@@ -271,26 +363,43 @@ def _validate_programs_under_test(submitter: Submitter) -> Result:
     return Result(progs_valid, validation_traces)
 
 
+def _run_in_parallel(func: Callable[[Any], Any], items: list, failed: Callable[[Any], bool]) -> list:
+    """
+    Apply func to each item, running up to ProcessingConfig().validation_workers() at a time. Each call is expected
+    to spend its time waiting on a subprocess, so a thread is used to drive each one.
+    :param func: the function to apply
+    :param items: the items to apply func to
+    :param failed: given the result of func, whether the item failed validation
+    :return: the results of func, in the same order as items. In fail fast mode items that had not started when the
+             first failure was found are skipped and have a result of None. Items already running are left to finish,
+             and keep their results
+    """
+    config = ProcessingConfig()
+    assg = AssignmentConfig().get_assignment()
+    workers = config.validation_workers() if assg.supports_parallel_test_runs() else 1
+
+    if not items:
+        return []
+
+    # the first failure is noted by the worker that found it, so no worker starts another item after it
+    fail_fast = config.validation_fail_fast()
+    stop = threading.Event()
+
+    def run_item(item) -> Optional[Any]:
+        if stop.is_set():
+            return None
+        result = func(item)
+        if fail_fast and failed(result):
+            stop.set()
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items)))) as executor:
+        return list(executor.map(run_item, items))
+
+
 def _check_submission_file_size(pre_val_dir: FilePath) -> Result:
     """ Check that the size of the submissions is not too large """
-    result = subprocess.run(f"du -sh {pre_val_dir}",
-                            stdout=subprocess.PIPE, universal_newlines=True, shell=True, check=False)
-    filesize_pattern = "^([0-9]+(?:\\.[0-9]+)?)([BKMG])"  # number and scale, eg: "744K" = 744KB or "1.8G" == 1.8GB
-    submission_size_regex = re.search(filesize_pattern, result.stdout)
-
-    if submission_size_regex is not None:
-        size_in_bytes = float(submission_size_regex.group(1)) * \
-                        {"B": 1, "K": 1000, "M": 1000000, "G": 1000000000}.get(submission_size_regex.group(2))
-        if size_in_bytes > 150 * 1000 * 1000:  # 150 MB
-            error_string = "Error: After compilation and test generation the submission file size ({}) is larger than "\
-                           "150 megabytes.\nServer space is limited so please keep your submissions to a " \
-                           "reasonable size\n".format("".join(submission_size_regex.groups()))
-            error_string += "Further details:\n{}".format(
-                subprocess.run("du -d 2 -h .", cwd=pre_val_dir, shell=True, universal_newlines=True,
-                               stdout=subprocess.PIPE, check=False).stdout)
-
-            return Result(False, error_string)
-    return Result(True, "submission size valid")
+    return quota.check_quota(pre_val_dir, ProcessingConfig().submission_quota_bytes())
 
 
 def _submit(submitter: Submitter) -> Result:
@@ -307,4 +416,20 @@ def _submit(submitter: Submitter) -> Result:
     if not size_check_result:
         return size_check_result
 
-    return daemon.queue_submission(submitter, submission_time)
+    # identical resubmissions reuse the tourney entry's tests, so only new submissions need tests generated
+    assg = AssignmentConfig().get_assignment()
+    awaiting_generation = assg.generates_tests_in_background() and not _verdict_cached(pre_val_dir)
+
+    (decision, reason) = admission.admit(submitter, submission_time)
+    if decision == admission.Admission.REJECTED:
+        return Result(False, f"A new submission can't be made at {submission_time.strftime(fmt.DATETIME_TRACE_STRING)}."
+                             f" {reason} Please submit again later")
+
+    low_priority = decision == admission.Admission.DEFERRED
+    result = daemon.queue_submission(submitter, submission_time, awaiting_generation, low_priority)
+    if result and low_priority:
+        result += f"{reason} Your submission will be processed after submissions at normal priority, so its " \
+                  f"estimate may move back as they are made."
+    if result:
+        result += eta.describe_estimate(submitter)
+    return result
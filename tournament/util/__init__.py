@@ -1,4 +1,5 @@
 """ Utility functions use by the tournament """
 
-from .funcs import print_tourney_error, print_tourney_trace, Ansi
+from .funcs import print_tourney_error, print_tourney_trace, get_pool_process_number, kill_process_group, \
+    limit_cpu, relink, write_atomic, Ansi
 from .types import *
@@ -0,0 +1,167 @@
+"""
+Bounded capture of the output of test processes.
+
+A students program can print without limit, so output is streamed into a fixed size buffer that keeps the start and
+the end of the output and drops the middle. Markers in the output (e.g. "Parallel execution timed out") are detected
+while streaming, so they are found even if they fall in the dropped middle. Optionally the output can also be spilled
+to a file, up to a size limit.
+"""
+import os
+import select
+import subprocess
+from time import time
+from typing import BinaryIO, Dict
+
+from tournament.util.funcs import kill_process_group
+from tournament.util.types import FilePath
+
+# How much of the start and end of the output to keep
+HEAD_BYTES = 16 * 1024
+TAIL_BYTES = 48 * 1024
+
+READ_SIZE = 64 * 1024
+
+
+class BoundedOutput:
+    """ Keeps the head and tail of a stream of output, and records which markers appear anywhere in it """
+
+    def __init__(self, markers: [str] = (), head_bytes: int = HEAD_BYTES, tail_bytes: int = TAIL_BYTES,
+                 spill_file: FilePath = None, spill_limit: int = 0):
+        """
+        :param markers: strings to look for in the output
+        :param head_bytes: how much of the start of the output to keep
+        :param tail_bytes: how much of the end of the output to keep
+        :param spill_file: if set, also write the output to this file
+        :param spill_limit: the maximum number of bytes to write to spill_file
+        """
+        self.markers = [marker.encode() for marker in markers]
+        self.found = set()
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+
+        # the end of the previous chunk, so markers split across two chunks are still found
+        self.carry = b""
+        self.carry_bytes = max((len(marker) for marker in self.markers), default=1) - 1
+
+        self.spill = open(spill_file, 'wb') if spill_file else None
+        self.spill_remaining = spill_limit
+
+    def write(self, chunk: bytes):
+        """ Add a chunk of output """
+        self.total_bytes += len(chunk)
+
+        if len(self.found) < len(self.markers):
+            window = self.carry + chunk
+            for marker in self.markers:
+                if marker not in self.found and marker in window:
+                    self.found.add(marker)
+            self.carry = window[-self.carry_bytes:] if self.carry_bytes else b""
+
+        to_head = max(0, min(len(chunk), self.head_bytes - len(self.head)))
+        self.head += chunk[:to_head]
+        self.tail += chunk[to_head:]
+        if len(self.tail) > self.tail_bytes:
+            del self.tail[:len(self.tail) - self.tail_bytes]
+
+        if self.spill and self.spill_remaining > 0:
+            self.spill.write(chunk[:self.spill_remaining])
+            self.spill_remaining -= min(len(chunk), self.spill_remaining)
+
+    def close(self):
+        """ Finish writing any spill file """
+        if self.spill:
+            self.spill.close()
+            self.spill = None
+
+    def found_marker(self, marker: str) -> bool:
+        """ Whether a marker appeared anywhere in the output """
+        return marker.encode() in self.found
+
+    def text(self) -> str:
+        """ The kept output, with a note of how much was dropped """
+        omitted = self.total_bytes - len(self.head) - len(self.tail)
+        output = bytes(self.head)
+        if omitted > 0:
+            output += f"\n\n... [{omitted} bytes of output omitted] ...\n\n".encode()
+        output += bytes(self.tail)
+        return output.decode('ascii', errors='backslashreplace')
+
+
+class CapturedRun:
+    """ The result of running a process with run_captured """
+
+    def __init__(self, return_code: int, output: BoundedOutput, timed_out: bool):
+        """
+        :param return_code: the return code of the process
+        :param output: the captured output of the process
+        :param timed_out: the process was killed for taking too long
+        """
+        self.return_code = return_code
+        self.output = output
+        self.timed_out = timed_out
+
+    @property
+    def stdout(self) -> str:
+        """ The captured stdout and stderr of the process """
+        return self.output.text()
+
+
+def run_captured(command, cwd: FilePath, timeout: float = None, shell: bool = False, env: Dict[str, str] = None,
+                 output: BoundedOutput = None) -> CapturedRun:
+    """
+    Run a process, streaming its combined stdout and stderr into a BoundedOutput.
+    If the process takes too long it is killed, along with any processes it started
+    :param command: the command to run, as for subprocess.Popen
+    :param cwd: the directory to run the command in
+    :param timeout: how long in seconds the process may run for
+    :param shell: run the command through the shell
+    :param env: the environment to run the command in, if not the tournament's own
+    :param output: where to capture the output. Defaults to an unmarked BoundedOutput
+    :return: the result of the run
+    """
+    output = output if output is not None else BoundedOutput()
+    deadline = time() + timeout if timeout is not None else None
+    timed_out = False
+
+    process = subprocess.Popen(command, cwd=cwd, shell=shell, env=env, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        fd = process.stdout.fileno()
+        while True:
+            remaining = deadline - time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                timed_out = True
+                kill_process_group(process)
+                break
+
+            (ready, _, _) = select.select([fd], [], [], remaining)
+            if ready:
+                chunk = os.read(fd, READ_SIZE)
+                if not chunk:
+                    break
+                output.write(chunk)
+    finally:
+        process.stdout.close()
+        output.close()
+
+    if not timed_out:
+        try:
+            process.wait(timeout=max(0.0, deadline - time()) if deadline is not None else None)
+        except subprocess.TimeoutExpired:
+            # the process closed its output but kept running
+            timed_out = True
+            kill_process_group(process)
+
+    return CapturedRun(process.returncode, output, timed_out)
+
+
+def read_bounded(file: BinaryIO, output: BoundedOutput = None) -> BoundedOutput:
+    """ Stream output that was written to a file, from the file's current position, into a BoundedOutput """
+    output = output if output is not None else BoundedOutput()
+    for chunk in iter(lambda: file.read(READ_SIZE), b""):
+        output.write(chunk)
+    output.close()
+    return output
@@ -2,9 +2,16 @@
 Utility functions used by the tournament
 """
 
+import os
+import shutil
+import signal
+import subprocess
 import sys
+import tempfile
 from datetime import datetime
 from enum import Enum
+from multiprocessing import current_process
+from typing import Optional
 
 from tournament.util import format as fmt, paths
 
@@ -47,3 +54,76 @@ def print_tourney_error(trace: str):
     """ Write tournament error traces to the log file """
     with open(paths.TRACE_FILE, 'a') as file:
         file.write(error() + trace + "\n")
+
+
+def get_pool_process_number() -> Optional[int]:
+    """
+    The number of the current process in the processing pool of the tournament daemon, whose processes are named
+    process_N
+    :return: the number of the process, or None if it isn't in the pool
+    """
+    (prefix, _, number) = current_process().name.partition('_')
+    return int(number) if prefix == "process" and number.isdigit() else None
+
+
+def relink(target: str, link: str) -> bool:
+    """
+    Point the symlink at `link` to `target`. The file system is only touched if the link does not already point to
+    `target`, any existing file or directory at `link` is replaced.
+    :param target: the file the link should point to
+    :param link: the location of the symlink
+    :return: whether the link had to be updated
+    """
+    if os.path.islink(link):
+        if os.readlink(link) == target:
+            return False
+        os.remove(link)
+    elif os.path.isdir(link):
+        shutil.rmtree(link)
+    elif os.path.exists(link):
+        os.remove(link)
+
+    os.symlink(target, link)
+    return True
+
+
+def kill_process_group(process: subprocess.Popen):
+    """
+    Kill a process started with `start_new_session=True`, along with any processes it has spawned, and reap it
+    :param process: the process to kill
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def limit_cpu(command: [str], cpu_seconds: int) -> [str]:
+    """
+    Wrap a command so that it runs with a CPU time limit, after which it is sent SIGXCPU and then killed. The limit is
+    set by a shell rather than by a preexec_fn, which can deadlock the child when other threads are running
+    :param command: the command to run, as a list of arguments
+    :param cpu_seconds: the CPU time limit
+    :return: the wrapped command
+    """
+    return ["sh", "-c", f'ulimit -S -t {int(cpu_seconds)} && ulimit -H -t {int(cpu_seconds) + 1} && exec "$@"',
+            "sh"] + list(command)
+
+
+def write_atomic(file_path: str, contents: bytes):
+    """
+    Write a file by writing a temporary file in the same directory and renaming it into place, so that readers see
+    either the old or the new contents of the file and never a partially written file
+    :param file_path: the file to write
+    :param contents: the new contents of the file
+    """
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=f".{os.path.basename(file_path)}.")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(contents)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
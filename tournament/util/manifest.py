@@ -0,0 +1,46 @@
+"""
+Manifests record a content hash for every file in a directory tree. Comparing the manifests of two submissions shows
+which of their tests and programs have changed without needing to re-read or diff either submission.
+"""
+import hashlib
+import os
+import re
+from typing import Dict
+
+from tournament.util.types import FilePath
+
+
+def hash_file(file_path: FilePath, ignore_whitespace: bool = False) -> str:
+    """
+    Return the sha256 hex digest of a file's contents
+    :param file_path: the file to hash
+    :param ignore_whitespace: ignore all whitespace within lines, as `diff -w` does
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        if ignore_whitespace:
+            for line in file:
+                digest.update(re.sub(rb"\s+", b"", line) + b"\n")
+        else:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_tree(root: FilePath, rel_dir: str, ignore_whitespace: bool = False) -> Dict[str, str]:
+    """
+    Hash every file under a directory
+    :param root: the root of the submission
+    :param rel_dir: the directory to hash, relative to root
+    :param ignore_whitespace: ignore all whitespace within lines, as `diff -w` does
+    :return: a mapping of each file's path relative to root to the hash of its contents.
+             Empty if the directory does not exist
+    """
+    hashes = {}
+    for (dir_path, dir_names, file_names) in os.walk(f"{root}/{rel_dir}"):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(dir_path, file_name)
+            if os.path.isfile(file_path):
+                hashes[os.path.relpath(file_path, root)] = hash_file(FilePath(file_path), ignore_whitespace)
+    return hashes
@@ -0,0 +1,270 @@
+"""
+Metrics of the tournament's throughput, published through a block of counters in a memory mapped file
+(paths.METRICS_FILE) and exposed by the results server at /metrics in the Prometheus text format.
+
+The block has one region for the daemon and one for each process of the processing pool. Each region is only ever
+written by the process that owns it, so recording a metric is a handful of memory writes with no locking. Regions are
+guarded by a sequence number that is odd while the region is being written (a seqlock), so that the results server
+reads a consistent copy of each region without ever blocking a writer.
+
+Metrics are reset each time the daemon starts.
+"""
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from tournament.util import paths
+from tournament.util.funcs import get_pool_process_number, write_atomic
+from tournament.util.types import TestResult
+
+# Histogram bucket upper bounds, in seconds
+CELL_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SUBMISSION_SECONDS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+SNAPSHOT_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# How submissions leave the queue: tested in the tournament, identical to the submitters tourney entry, or discarded
+SUBMISSION_OUTCOMES = ("tested", "unchanged", "discarded")
+
+# Pool processes are given the region of their process number, modulo the number of worker regions
+NUM_WORKER_REGIONS = 256
+
+# How many times a region is read before giving up on a consistent copy of it, and how long to wait between reads
+READ_ATTEMPTS = 100
+READ_RETRY_SECONDS = 0.001
+
+# (name, type, help, labels or histogram buckets) of each metric recorded in the block
+METRICS = [
+    ("tourney_submissions_processed_total", "counter", "Submissions taken from the queue, by outcome",
+     [("outcome", outcome) for outcome in SUBMISSION_OUTCOMES]),
+    ("tourney_submission_duration_seconds", "histogram", "Time taken to test a submission in the tournament",
+     SUBMISSION_SECONDS_BUCKETS),
+    ("tourney_cells_total", "counter", "Head to head test runs, by result",
+     [("result", result.value) for result in TestResult]),
+    ("tourney_cell_duration_seconds", "histogram", "Time taken by a head to head test run", CELL_SECONDS_BUCKETS),
+    ("tourney_cache_lookups_total", "counter", "Lookups of results that may be reused, by cache",
+     [("cache", "cells"), ("cache", "submissions")]),
+    ("tourney_cache_hits_total", "counter", "Lookups of results that were reused, by cache",
+     [("cache", "cells"), ("cache", "submissions")]),
+    ("tourney_snapshot_compute_seconds", "histogram", "Time taken to compute a snapshot from the tournament state",
+     SNAPSHOT_SECONDS_BUCKETS),
+    ("tourney_snapshot_write_seconds", "histogram", "Time taken to write and publish a snapshot",
+     SNAPSHOT_SECONDS_BUCKETS),
+    ("tourney_pool_processes", "gauge", "Processes in the processing pool", []),
+    ("tourney_pool_processes_busy", "gauge", "Processes in the processing pool that are running head to head tests",
+     []),
+]
+
+# (name, help) of the gauge of idle pool processes, derived from the gauges of all and of busy pool processes
+IDLE_PROCESSES = ("tourney_pool_processes_idle", "Processes in the processing pool that are waiting for work")
+
+
+def _slot_names() -> List[str]:
+    """ The name of each slot of a region. Histograms have a slot per bucket, one for +Inf, and one for their sum """
+    slots = []
+    for (name, metric_type, _, labels) in METRICS:
+        if metric_type == "histogram":
+            slots += [f"{name}:{bound}" for bound in labels] + [f"{name}:+Inf", f"{name}:sum"]
+        elif labels:
+            slots += [f"{name}:{value}" for (_, value) in labels]
+        else:
+            slots.append(name)
+    return slots
+
+
+SLOTS = {slot: index for (index, slot) in enumerate(_slot_names())}
+
+# Each region is a sequence number followed by its slots, all 8 byte doubles. The block starts with a header holding
+# the number of slots in a region, so that a reader can tell whether the block has the layout it expects
+REGION_BYTES = 8 * (1 + len(SLOTS))
+BLOCK_BYTES = 8 + REGION_BYTES * (1 + NUM_WORKER_REGIONS)
+
+
+class _Region:
+    """ The slots written by one process """
+
+    def __init__(self, block: mmap.mmap, index: int):
+        self.block = block
+        self.offset = 8 + REGION_BYTES * index
+
+    def update(self, increments: Dict[str, float] = None, values: Dict[str, float] = None):
+        """
+        Update slots of the region. Must only be called by the process that owns the region
+        :param increments: amounts to add to slots
+        :param values: values to set slots to
+        """
+        (sequence,) = struct.unpack_from('d', self.block, self.offset)
+        struct.pack_into('d', self.block, self.offset, sequence + 1)
+
+        for (slot, increment) in (increments or {}).items():
+            slot_offset = self.offset + 8 * (1 + SLOTS[slot])
+            (value,) = struct.unpack_from('d', self.block, slot_offset)
+            struct.pack_into('d', self.block, slot_offset, value + increment)
+        for (slot, value) in (values or {}).items():
+            struct.pack_into('d', self.block, self.offset + 8 * (1 + SLOTS[slot]), value)
+
+        struct.pack_into('d', self.block, self.offset, sequence + 2)
+
+
+# The block as mapped by this process, and the pid of the process it was mapped by
+_mapped = {}
+
+
+def _block() -> Optional[mmap.mmap]:
+    """ The block, mapped into this process, or None if the daemon has not created it """
+    if _mapped.get('pid') != os.getpid():
+        try:
+            with open(paths.METRICS_FILE, 'r+b') as block_file:
+                block = mmap.mmap(block_file.fileno(), BLOCK_BYTES)
+        except (FileNotFoundError, ValueError):
+            block = None
+        _mapped.update(pid=os.getpid(), block=block)
+    return _mapped['block']
+
+
+def _region() -> Optional[_Region]:
+    """ The region of this process. Any process outside of the processing pool is the daemon """
+    block = _block()
+    if block is None:
+        return None
+    number = get_pool_process_number()
+    return _Region(block, 0 if number is None else 1 + number % NUM_WORKER_REGIONS)
+
+
+def _observe(name: str, buckets: Tuple[float, ...], seconds: float) -> Dict[str, float]:
+    """ The increments recording an observation in a histogram """
+    index = bisect_left(buckets, seconds)
+    bucket = f"{name}:{buckets[index]}" if index < len(buckets) else f"{name}:+Inf"
+    return {bucket: 1, f"{name}:sum": seconds}
+
+
+def reset(pool_processes: int):
+    """ Create the block, with every metric zeroed. Called by the daemon on startup, before the pool is started """
+    # replaced rather than truncated, as processes of a previous daemon may still have the old block mapped
+    write_atomic(paths.METRICS_FILE, struct.pack('d', len(SLOTS)) + bytes(BLOCK_BYTES - 8))
+    _mapped.clear()
+    _region().update(values={"tourney_pool_processes": pool_processes})
+
+
+def record_submission(outcome: str, seconds: float = None):
+    """
+    Record a submission leaving the queue
+    :param outcome: one of SUBMISSION_OUTCOMES
+    :param seconds: how long the submission took to test, if it was tested
+    """
+    region = _region()
+    if region is None:
+        return
+    increments = {f"tourney_submissions_processed_total:{outcome}": 1,
+                  "tourney_cache_lookups_total:submissions": 1,
+                  "tourney_cache_hits_total:submissions": int(outcome == "unchanged")}
+    if seconds is not None:
+        increments.update(_observe("tourney_submission_duration_seconds", SUBMISSION_SECONDS_BUCKETS, seconds))
+    region.update(increments)
+
+
+def record_snapshot(compute_seconds: float, write_seconds: float):
+    """ Record how long a snapshot took to compute, and to write and publish """
+    region = _region()
+    if region is not None:
+        region.update({**_observe("tourney_snapshot_compute_seconds", SNAPSHOT_SECONDS_BUCKETS, compute_seconds),
+                       **_observe("tourney_snapshot_write_seconds", SNAPSHOT_SECONDS_BUCKETS, write_seconds)})
+
+
+def record_busy(busy: bool):
+    """ Record whether this pool process is running head to head tests """
+    region = _region()
+    if region is not None:
+        region.update(values={"tourney_pool_processes_busy": int(busy)})
+
+
+def record_cell(result: TestResult, seconds: float):
+    """ Record a head to head test run """
+    region = _region()
+    if region is not None:
+        region.update({f"tourney_cells_total:{TestResult(result).value}": 1,
+                       "tourney_cache_lookups_total:cells": 1,
+                       **_observe("tourney_cell_duration_seconds", CELL_SECONDS_BUCKETS, seconds)})
+
+
+def record_reused_cells(num_cells: int):
+    """ Record head to head cells whose results were reused from the tournament state rather than run """
+    region = _region()
+    if region is not None and num_cells:
+        region.update({"tourney_cache_lookups_total:cells": num_cells, "tourney_cache_hits_total:cells": num_cells})
+
+
+def read() -> Optional[Dict[str, float]]:
+    """
+    Read the block without blocking its writers
+    :return: the value of each slot, summed over all regions, or None if the daemon has not created the block
+    """
+    try:
+        with open(paths.METRICS_FILE, 'rb') as block_file:
+            header = os.pread(block_file.fileno(), 8, 0)
+            if len(header) < 8 or struct.unpack('d', header)[0] != len(SLOTS):
+                return None
+
+            totals = [0.0] * len(SLOTS)
+            for index in range(1 + NUM_WORKER_REGIONS):
+                region = _read_region(block_file.fileno(), 8 + REGION_BYTES * index)
+                totals = [total + value for (total, value) in zip(totals, region)]
+    except FileNotFoundError:
+        return None
+
+    return dict(zip(SLOTS, totals))
+
+
+def _read_region(fd: int, offset: int) -> Tuple[float, ...]:
+    """ A consistent copy of the slots of a region. Read again if the region was being written while it was read """
+    values = ()
+    for _ in range(READ_ATTEMPTS):
+        contents = os.pread(fd, REGION_BYTES, offset)
+        (sequence,) = struct.unpack_from('d', contents)
+        values = struct.unpack_from(f'{len(SLOTS)}d', contents, 8)
+        if sequence % 2 == 0 and struct.unpack('d', os.pread(fd, 8, offset))[0] == sequence:
+            break
+        # let the writer finish
+        time.sleep(READ_RETRY_SECONDS)
+    return values
+
+
+def exposition(gauges: List[Tuple[str, str, float]] = ()) -> str:
+    """
+    The metrics in the Prometheus text exposition format
+    :param gauges: (name, help, value) of extra gauges, measured by the reader rather than recorded in the block
+    :return: the metrics, or only the extra gauges if the daemon has not created the block
+    """
+    lines = []
+    for (name, help_text, value) in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+
+    values = read()
+    if values is None:
+        return "\n".join(lines) + "\n"
+
+    for (name, metric_type, help_text, labels) in METRICS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        if metric_type == "histogram":
+            cumulative = 0.0
+            for bound in list(labels) + ["+Inf"]:
+                cumulative += values[f"{name}:{bound}"]
+                lines.append(f'{name}_bucket{{le="{bound}"}} {_number(cumulative)}')
+            lines += [f"{name}_sum {_number(values[f'{name}:sum'])}", f"{name}_count {_number(cumulative)}"]
+        elif labels:
+            lines += [f'{name}{{{label}="{value}"}} {_number(values[f"{name}:{value}"])}' for (label, value) in labels]
+        else:
+            lines.append(f"{name} {_number(values[name])}")
+
+    (name, help_text) = IDLE_PROCESSES
+    idle = max(0.0, values["tourney_pool_processes"] - values["tourney_pool_processes_busy"])
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_number(idle)}"]
+
+    return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    """ A value in the exposition format, without an exponent for whole numbers """
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
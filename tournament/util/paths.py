@@ -2,6 +2,7 @@
 File paths used by the tournament
 """
 
+import hashlib
 import os
 
 from tournament.util.types import Submitter, FilePath
@@ -20,11 +21,42 @@ APPROVED_SUBMITTERS_LIST = CONFIGS_DIR + "/approved_submitters.json"
 ASSIGNMENT_CONFIG = CONFIGS_DIR + "/assignment_config.json"
 SERVER_CONFIG = CONFIGS_DIR + "/server_config.json"
 EMAIL_CONFIG = CONFIGS_DIR + "/email_config.json"
+PROCESSING_CONFIG = CONFIGS_DIR + "/processing_config.json"
 
 # Tournament state and snapshot used by the results server
 TOURNEY_STATE_FILE = STATE_DIR + "/tourney_state.json"
 RESULTS_FILE = STATE_DIR + "/tourney_results.json"
 
+# The leaderboard, rendered from the snapshot each time it is published. Served as is by the results server, along with
+# gzip compressed copies at the same paths with a .gz suffix
+LEADERBOARD_HTML_FILE = STATE_DIR + "/leaderboard.html"
+LEADERBOARD_JSON_FILE = STATE_DIR + "/leaderboard.json"
+LEADERBOARD_LOCK_FILE = STATE_DIR + "/.leaderboard.lock"
+
+# The sqlite read model of the results, updated after each submission and queried by the results API
+RESULTS_DB_FILE = STATE_DIR + "/results.db"
+
+# Counters of the tournament's throughput, memory mapped by the daemon and its processing pool (see metrics.py)
+METRICS_FILE = STATE_DIR + "/.metrics"
+
+# The daemon's model of how long submissions take to process, used to estimate when queued submissions will be
+# processed (see eta.py)
+COST_MODEL_FILE = STATE_DIR + "/cost_model.json"
+
+# When each submitter last had a submission accepted into the queue, used for admission control (see admission.py)
+ADMISSIONS_FILE = STATE_DIR + "/admissions.json"
+ADMISSIONS_LOCK_FILE = STATE_DIR + "/.admissions.lock"
+
+# The shared memory block of the daemon's live status board (see status_board.py). Named after the root of the project
+# so that tournaments installed side by side don't share a board
+STATUS_BOARD_NAME = "swen_tourney_status_" + hashlib.sha1(ROOT_DIR.encode()).hexdigest()[:8]
+
+# Compiled tournament-provided java classes (e.g. FailFastRunner) shared by all ant submissions
+JAVA_CLASSES_DIR = STATE_DIR + "/java_classes"
+
+# Tools built by the tournament from source on first use (e.g. the fuzz fork server)
+TOOLS_DIR = STATE_DIR + "/tools"
+
 # Folder to store all traces generated by the tournament
 TRACES_DIR = ROOT_DIR + "/traces"
 
@@ -43,6 +75,21 @@ DIFF_FILE = ROOT_DIR + "/submitter_prog_diffs.csv"
 # Track how many tests a submission has used per test suite
 NUM_TESTS_FILE = "num_tests.json"
 
+# Content hashes of the tests and progs in a submission
+MANIFEST_FILE = "manifest.json"
+
+# Build keys of the binaries compiled for a submission. Binaries with unchanged keys are reused by the next submission
+BUILD_KEYS_FILE = "build_keys.json"
+
+# Present in a submission that is identical to the submitters current tourney entry and so skipped validation. The
+# submission is a copy of the tourney entry, so it can be installed even if the entry is replaced while it is queued.
+# Contains the fingerprint of the tourney entry whose verdict was reused
+CACHED_VERDICT_FILE = ".cached_verdict"
+
+# Present in each persistent head to head test stage. Contains the fingerprint of the source assignment it was copied
+# from, so that stages are rebuilt when the source assignment changes
+STAGE_FINGERPRINT_FILE = ".source_fingerprint"
+
 # Directories that store student submissions for validation, submission, and testing
 SUBMISSIONS_DIR = STATE_DIR + "/submissions"
 PRE_VALIDATION_DIR = SUBMISSIONS_DIR + "/pre_validation"
@@ -61,6 +108,14 @@ def get_tourney_dir(submitter: Submitter) -> FilePath:
     return FilePath(f"{TOURNEY_DIR}/{submitter}")
 
 
+def get_head_to_head_stage_dir(thread_name: str, buffer: int) -> FilePath:
+    """
+    Given the name of the current thread, return the file path of one of its persistent test stages.
+    Each thread keeps two stages so that the next tester/testee pair can be prepared while the current one is tested
+    """
+    return FilePath(f"{HEAD_TO_HEAD_DIR}/{thread_name}_{buffer}")
+
+
 def get_head_to_head_log_file_path(thread_name: str) -> FilePath:
     """
     Given the name of the current thread, return a file path to save its logs to when running tests against progs
@@ -0,0 +1,102 @@
+"""
+Size accounting for submissions. Directory trees are walked with os.scandir and measurement stops as soon as a quota
+is exceeded, so an oversized submission is rejected without having to measure (or copy) all of it.
+"""
+import os
+import shutil
+
+from tournament.util.types import FilePath, Result
+
+
+class QuotaExceeded(Exception):
+    """ Raised when a SizeReport grows beyond its limit """
+
+
+def format_size(num_bytes: int) -> str:
+    """ Format a number of bytes in the style of `du -h`, e.g. 744K or 1.8G """
+    size = float(num_bytes)
+    for unit in ["B", "K", "M"]:
+        if size < 1000:
+            return f"{size:.0f}{unit}" if unit == "B" or size >= 10 else f"{size:.1f}{unit}"
+        size /= 1000
+    return f"{size:.1f}G"
+
+
+class SizeReport:
+    """
+    Accumulates the disk usage of files as they are measured or copied, along with a breakdown of usage per directory.
+    Raises QuotaExceeded as soon as the total goes over the limit
+    """
+
+    def __init__(self, limit: int, max_depth: int = 2):
+        """
+        :param limit: the maximum number of bytes allowed
+        :param max_depth: how many directory levels to include in the breakdown
+        """
+        self.limit = limit
+        self.max_depth = max_depth
+        self.total = 0
+        self.breakdown = {}
+
+    def add(self, rel_path: str, num_bytes: int):
+        """ Account for num_bytes used by the file at rel_path """
+        self.total += num_bytes
+
+        parts = rel_path.split(os.sep)[:-1]
+        for depth in range(min(len(parts), self.max_depth) + 1):
+            directory = os.path.join(".", *parts[:depth])
+            self.breakdown[directory] = self.breakdown.get(directory, 0) + num_bytes
+
+        if self.total > self.limit:
+            raise QuotaExceeded()
+
+    def walk(self, root: FilePath, rel_dir: str = ""):
+        """ Measure every file under root/rel_dir. Symlinks are not followed """
+        with os.scandir(os.path.join(root, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    self.walk(root, rel_path)
+                else:
+                    self.add(rel_path, entry.stat(follow_symlinks=False).st_blocks * 512)
+
+    def copytree(self, src: FilePath, dst: FilePath, rel_dst: str):
+        """
+        Copy the directory src to dst, accounting for each file before it is copied.
+        If the quota is exceeded the partial copy is removed and QuotaExceeded is raised
+        :param src: the directory to copy
+        :param dst: the location to copy to
+        :param rel_dst: the location to copy to, relative to the root of the measured tree
+        """
+        def copy_function(src_file, dst_file):
+            self.add(os.path.join(rel_dst, os.path.relpath(dst_file, dst)), os.lstat(src_file).st_blocks * 512)
+            return shutil.copy2(src_file, dst_file)
+
+        try:
+            shutil.copytree(src, dst, symlinks=True, copy_function=copy_function)
+        except QuotaExceeded:
+            shutil.rmtree(dst, ignore_errors=True)
+            raise
+
+    def describe(self) -> str:
+        """ A `du -d 2 -h` style breakdown of the measured tree """
+        lines = [f"{format_size(size)}\t{directory}" for (directory, size) in sorted(self.breakdown.items())]
+        return "\n".join(lines)
+
+
+def check_quota(root: FilePath, limit: int) -> Result:
+    """
+    Check that the files under root take up no more than limit bytes
+    :param root: the directory to check
+    :param limit: the maximum number of bytes allowed
+    :return: whether root is within the quota, with a breakdown of disk usage if it is not
+    """
+    report = SizeReport(limit)
+    try:
+        report.walk(root)
+    except QuotaExceeded:
+        return Result(False, f"Error: The submission file size is larger than {format_size(limit)}. "
+                             f"Measurement stopped at {format_size(report.total)}.\n"
+                             f"Server space is limited so please keep your submissions to a reasonable size\n"
+                             f"Further details:\n{report.describe()}")
+    return Result(True, "submission size valid")
@@ -0,0 +1,190 @@
+"""
+Scratch space for transient tournament files. Head to head test stages and copies of build artefacts are kept in a
+fast scratch directory (e.g. /dev/shm or a tmpfs mount) rather than on disk. Scratch usage is accounted for and once
+the configured budget is reached new stages and artefacts spill over to disk.
+Durable state, such as paths.TOURNEY_DIR and the tournament state files, is never stored in scratch space.
+
+The scratch space is configured once per process, and its usage is measured at most every USAGE_REFRESH_SECONDS, with
+the artefacts a process copies in counted as it copies them, so looking up a stage or artefact costs next to nothing.
+"""
+import os
+import shutil
+import threading
+import time
+
+from tournament.config.files.processing_config import ProcessingConfig
+from tournament.util import manifest, paths
+from tournament.util.types import FilePath, Submitter
+
+
+# How long a measurement of the scratch space's usage is used for. Every pool process writes to the scratch space, so
+# usage is measured again periodically rather than only tracked by each process
+USAGE_REFRESH_SECONDS = 60
+
+# The scratch space of this process: its root and budget, read from the processing config once per process, and its
+# usage as last measured plus the bytes this process has copied in since
+_scratch = {}
+_scratch_lock = threading.Lock()
+
+
+def _get_scratch() -> dict:
+    """ The scratch space of this process. Pool processes configure their own once forked """
+    with _scratch_lock:
+        if _scratch.get('pid') != os.getpid():
+            config = ProcessingConfig()
+            _scratch.clear()
+            _scratch.update(pid=os.getpid(), root=_create_scratch_root(config.scratch_dir()),
+                            budget=config.scratch_budget_bytes(), usage=0, measured=None)
+        return _scratch
+
+
+def _create_scratch_root(scratch_dir: str) -> FilePath:
+    """ Create the scratch dir, returning an empty path if it is not configured or is not usable """
+    if not scratch_dir:
+        return FilePath("")
+
+    try:
+        os.makedirs(scratch_dir, exist_ok=True)
+    except OSError:
+        return FilePath("")
+
+    return FilePath(scratch_dir) if os.access(scratch_dir, os.W_OK) else FilePath("")
+
+
+def get_scratch_root() -> FilePath:
+    """
+    Get the root of the scratch space
+    :return: the configured scratch dir, or an empty path if no usable scratch dir is configured
+    """
+    return _get_scratch()['root']
+
+
+def get_usage(path: FilePath) -> int:
+    """ The number of bytes used by all files under path. Symlinks are not followed """
+    usage = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    usage += get_usage(FilePath(entry.path))
+                else:
+                    usage += entry.stat(follow_symlinks=False).st_blocks * 512
+    except FileNotFoundError:
+        pass
+    return usage
+
+
+def _within_budget(extra_bytes: int = 0) -> bool:
+    """ Whether the scratch space can hold another extra_bytes without exceeding its budget """
+    scratch = _get_scratch()
+    with _scratch_lock:
+        if scratch['measured'] is None or time.time() - scratch['measured'] > USAGE_REFRESH_SECONDS:
+            scratch.update(usage=get_usage(scratch['root']), measured=time.time())
+        return scratch['usage'] + extra_bytes <= scratch['budget']
+
+
+def _add_usage(num_bytes: int):
+    """ Count bytes this process has copied into the scratch space, until its usage is next measured """
+    scratch = _get_scratch()
+    with _scratch_lock:
+        scratch['usage'] += num_bytes
+
+
+def get_stage_dir(thread_name: str, buffer: int) -> FilePath:
+    """
+    Get the location of a persistent head to head test stage. Stages are placed in scratch space when there is room,
+    and otherwise in paths.HEAD_TO_HEAD_DIR. Once created a stage stays where it is.
+    :param thread_name: the name of the thread that owns the stage
+    :param buffer: which of the threads stages to return
+    :return: the location of the test stage
+    """
+    disk_stage_dir = paths.get_head_to_head_stage_dir(thread_name, buffer)
+
+    scratch_root = get_scratch_root()
+    if not scratch_root:
+        return disk_stage_dir
+
+    scratch_stage_dir = FilePath(f"{scratch_root}/stages/{thread_name}_{buffer}")
+    if os.path.isdir(scratch_stage_dir) or (not os.path.isdir(disk_stage_dir) and _within_budget()):
+        return scratch_stage_dir
+    return disk_stage_dir
+
+
+def get_artefact_dir(submitter: Submitter, artefact: str) -> FilePath:
+    """
+    Get a copy of a build artefact from a submitters tourney entry (e.g. 'classes/tests') to read during head to head
+    testing. The artefact is copied into scratch space the first time it is requested for a given version of the
+    tourney entry. If there is no scratch space, the entry has no manifest (see paths.MANIFEST_FILE), or the copy would
+    exceed the scratch budget, the artefact in the tourney entry is used.
+    :param submitter: the submitter whose artefact is requested
+    :param artefact: the path of the artefact relative to the root of the submission
+    :return: the location of the artefact to use
+    """
+    tourney_dir = paths.get_tourney_dir(submitter)
+    tourney_artefact = FilePath(f"{tourney_dir}/{artefact}")
+    manifest_file = FilePath(f"{tourney_dir}/{paths.MANIFEST_FILE}")
+
+    scratch_root = get_scratch_root()
+    if not scratch_root or not os.path.isdir(tourney_artefact) or not os.path.isfile(manifest_file):
+        return tourney_artefact
+
+    # Artefacts are built from the tests and progs recorded in the entry's manifest, so the manifest identifies the
+    # entry's version. A replaced entry may reuse the inode of the one before it, so its inode can't be used
+    version = manifest.hash_file(manifest_file)[:16]
+    submitter_artefacts = f"{scratch_root}/artefacts/{submitter}"
+    scratch_artefact = FilePath(f"{submitter_artefacts}/{version}/{artefact}")
+
+    if os.path.isdir(scratch_artefact):
+        return scratch_artefact
+
+    release(submitter, keep_version=version)
+    artefact_bytes = get_usage(tourney_artefact)
+    if not _within_budget(artefact_bytes):
+        return tourney_artefact
+
+    # copy under a temporary name then rename, so concurrent workers never see a partial copy
+    os.makedirs(os.path.dirname(scratch_artefact), exist_ok=True)
+    tmp_artefact = f"{scratch_artefact}.tmp.{os.getpid()}"
+    try:
+        shutil.copytree(tourney_artefact, tmp_artefact, symlinks=True)
+        os.rename(tmp_artefact, scratch_artefact)
+        _add_usage(artefact_bytes)
+    except OSError:
+        # another worker got there first, or the scratch space is full
+        shutil.rmtree(tmp_artefact, ignore_errors=True)
+        if not os.path.isdir(scratch_artefact):
+            return tourney_artefact
+
+    return scratch_artefact
+
+
+def release(submitter: Submitter, keep_version: str = ""):
+    """
+    Remove a submitters artefacts from scratch space
+    :param submitter: the submitter whose artefacts are no longer needed
+    :param keep_version: a version of the submitters tourney entry whose artefacts should be kept
+    """
+    scratch_root = get_scratch_root()
+    if not scratch_root:
+        return
+
+    submitter_artefacts = f"{scratch_root}/artefacts/{submitter}"
+    if os.path.isdir(submitter_artefacts):
+        for version in os.listdir(submitter_artefacts):
+            if version != keep_version:
+                shutil.rmtree(f"{submitter_artefacts}/{version}", ignore_errors=True)
+                # measure the usage again once space has been freed
+                with _scratch_lock:
+                    _scratch['measured'] = None
+
+
+def clear():
+    """ Remove every stage and artefact from scratch space, so that none outlive the tournament they were made for """
+    scratch_root = get_scratch_root()
+    if not scratch_root:
+        return
+
+    for kind in ["stages", "artefacts"]:
+        shutil.rmtree(f"{scratch_root}/{kind}", ignore_errors=True)
+    with _scratch_lock:
+        _scratch['measured'] = None
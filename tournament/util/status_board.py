@@ -0,0 +1,193 @@
+"""
+A live status board of the tournament daemon, kept in a fixed layout block of shared memory
+(multiprocessing.shared_memory, named paths.STATUS_BOARD_NAME) and rendered by `backend.py top`.
+
+The block starts with a header written by the daemon: the submission being processed and how many tester/testee pairs
+it needs tested. It is followed by a slot for each process of the processing pool, written only by that process: the
+pair and cell it is testing, when it started them, and how many pairs and cells it has finished. Each record is
+guarded by a sequence number that is odd while the record is being written (a seqlock), so readers get a consistent
+copy of each record without ever blocking the daemon.
+
+The block is created when the daemon starts, before the processing pool is forked, and removed when it shuts down.
+"""
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional
+
+from tournament.util import paths
+from tournament.util.funcs import get_pool_process_number
+
+# Pool processes are given the slot of their process number, modulo the number of slots
+NUM_SLOTS = 256
+
+# Names are truncated to this many bytes
+NAME_BYTES = 64
+
+# How many times a record is read before giving up on a consistent copy of it, and how long to wait between reads
+READ_ATTEMPTS = 100
+READ_RETRY_SECONDS = 0.001
+
+# sequence, number of slots, daemon pid, daemon start time, submitter being processed, submission start time,
+# pairs to test for the submission, pairs finished by all processes before the submission started
+HEADER = struct.Struct(f"<QQQd{NAME_BYTES}sdQQ")
+HEADER_FIELDS = ('sequence', 'num_slots', 'pid', 'started', 'submitter', 'submission_started', 'pairs_total',
+                 'pairs_done_before')
+
+# sequence, pid, whether the process is testing a pair, tester, testee, test, prog, pair start time,
+# cell start time, pairs finished, cells run, cells reused from the tournament state, time of the last update
+SLOT = struct.Struct(f"<QQQ{NAME_BYTES}s{NAME_BYTES}s{NAME_BYTES}s{NAME_BYTES}sddQQQd")
+SLOT_FIELDS = ('sequence', 'pid', 'busy', 'tester', 'testee', 'test', 'prog', 'pair_started', 'cell_started',
+               'pairs_done', 'cells_run', 'cells_reused', 'updated')
+
+BLOCK_BYTES = HEADER.size + SLOT.size * NUM_SLOTS
+
+# The block, once created by this process. Pool processes inherit the daemon's block when forked
+_board = {}
+
+# The current contents of the header, in the daemon, and of the slot of the current process, in pool processes. Kept
+# so that records are updated without being read back
+_header = {}
+_slot = {}
+
+
+def create(pid: int):
+    """
+    Create the block, replacing any left behind by a daemon that didn't shut down cleanly. Called by the daemon
+    :param pid: the pid of the daemon
+    """
+    try:
+        board = shared_memory.SharedMemory(paths.STATUS_BOARD_NAME, create=True, size=BLOCK_BYTES)
+    except FileExistsError:
+        shared_memory.SharedMemory(paths.STATUS_BOARD_NAME).unlink()
+        board = shared_memory.SharedMemory(paths.STATUS_BOARD_NAME, create=True, size=BLOCK_BYTES)
+
+    board.buf[:BLOCK_BYTES] = bytes(BLOCK_BYTES)
+    _board['block'] = board
+    _header.update(sequence=0, num_slots=NUM_SLOTS, pid=pid, started=time.time(), submitter=b"",
+                   submission_started=0.0, pairs_total=0, pairs_done_before=0)
+    _write(HEADER, HEADER_FIELDS, _header, 0)
+
+
+def remove():
+    """ Remove the block. Called by the daemon when it shuts down """
+    board = _board.pop('block', None)
+    if board is not None:
+        board.close()
+        board.unlink()
+
+
+def set_submission(submitter: str, pairs_total: int):
+    """ Record the submission the daemon has started processing, and how many tester/testee pairs it needs tested """
+    if 'block' in _board:
+        pairs_done = sum(slot['pairs_done'] for slot in read_slots(_board['block'].buf))
+        _header.update(submitter=submitter.encode()[:NAME_BYTES], submission_started=time.time(),
+                       pairs_total=pairs_total, pairs_done_before=pairs_done)
+        _write(HEADER, HEADER_FIELDS, _header, 0)
+
+
+def clear_submission():
+    """ Record that the daemon has finished processing its submission """
+    if 'block' in _board:
+        _header.update(submitter=b"", submission_started=0.0, pairs_total=0, pairs_done_before=0)
+        _write(HEADER, HEADER_FIELDS, _header, 0)
+
+
+def start_pair(tester: str, testee: str):
+    """ Record that this pool process has started testing a tester/testee pair """
+    _update_slot(busy=1, tester=tester.encode()[:NAME_BYTES], testee=testee.encode()[:NAME_BYTES], test=b"", prog=b"",
+                 pair_started=time.time(), cell_started=0.0)
+
+
+def start_cell(test: str, prog: str):
+    """ Record that this pool process has started running a test against a prog """
+    _update_slot(test=test.encode()[:NAME_BYTES], prog=prog.encode()[:NAME_BYTES], cell_started=time.time())
+
+
+def finish_cell():
+    """ Record that this pool process has finished running a test against a prog """
+    if _has_slot():
+        _update_slot(cells_run=_slot['cells_run'] + 1, cell_started=0.0)
+
+
+def finish_pair(cells_reused: int):
+    """ Record that this pool process has finished testing a pair, reusing the results of cells_reused cells """
+    if _has_slot():
+        _update_slot(pairs_done=_slot['pairs_done'] + 1, cells_reused=_slot['cells_reused'] + cells_reused)
+
+
+def set_idle():
+    """ Record that this pool process has finished its batch of pairs """
+    _update_slot(busy=0, tester=b"", testee=b"", test=b"", prog=b"", pair_started=0.0, cell_started=0.0)
+
+
+def _has_slot() -> bool:
+    """
+    Whether this process has a slot to write to. On first use the slot's counters are carried on from its previous
+    owner, if any, so that totals over all slots never go backwards
+    """
+    number = get_pool_process_number()
+    if 'block' not in _board or number is None:
+        return False
+    if not _slot:
+        offset = HEADER.size + SLOT.size * (number % NUM_SLOTS)
+        _slot.update(dict(zip(SLOT_FIELDS, SLOT.unpack_from(_board['block'].buf, offset))),
+                     offset=offset, pid=os.getpid())
+    return True
+
+
+def _update_slot(**fields):
+    """ Update the slot of this pool process """
+    if _has_slot():
+        _slot.update(fields, updated=time.time())
+        _write(SLOT, SLOT_FIELDS, _slot, _slot['offset'])
+
+
+def _write(record: struct.Struct, fields, values: dict, offset: int):
+    """ Write a record at offset, bracketed by odd and then even sequence numbers """
+    buf = _board['block'].buf
+    sequence = values['sequence'] + (values['sequence'] % 2)
+    struct.pack_into("<Q", buf, offset, sequence + 1)
+    record.pack_into(buf, offset, sequence + 1, *[values[field] for field in fields[1:]])
+    struct.pack_into("<Q", buf, offset, sequence + 2)
+    values['sequence'] = sequence + 2
+
+
+def attach() -> Optional[shared_memory.SharedMemory]:
+    """ Attach to the block for reading, or None if the daemon is not running """
+    try:
+        board = shared_memory.SharedMemory(paths.STATUS_BOARD_NAME)
+    except FileNotFoundError:
+        return None
+    # attaching registers the block with this process's resource tracker, which would remove it when this process exits
+    resource_tracker.unregister(board._name, 'shared_memory')  # pylint: disable=protected-access
+    return board
+
+
+def read_header(buf) -> dict:
+    """ A consistent copy of the header of an attached block """
+    return _read(buf, HEADER, HEADER_FIELDS, 0)
+
+
+def read_slots(buf) -> List[dict]:
+    """ A consistent copy of each slot of a block that has been used by a pool process """
+    slots = []
+    for index in range(NUM_SLOTS):
+        offset = HEADER.size + SLOT.size * index
+        if struct.unpack_from("<Q", buf, offset)[0] != 0:
+            slots.append({'slot': index, **_read(buf, SLOT, SLOT_FIELDS, offset)})
+    return slots
+
+
+def _read(buf, record: struct.Struct, fields, offset: int) -> dict:
+    """ A consistent copy of a record. Read again if the record was being written while it was read """
+    values = ()
+    for _ in range(READ_ATTEMPTS):
+        values = record.unpack(bytes(buf[offset:offset + record.size]))
+        if values[0] % 2 == 0 and struct.unpack_from("<Q", buf, offset)[0] == values[0]:
+            break
+        # let the writer finish
+        time.sleep(READ_RETRY_SECONDS)
+    return {field: value.rstrip(b"\0").decode(errors='replace') if isinstance(value, bytes) else value
+            for (field, value) in zip(fields, values)}